@@ -0,0 +1,238 @@
+"""Admission control: per-session/per-IP token buckets and a fair upstream queue."""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+from deadline import Cancelled
+
+# How often a queued request checks whether its client is still there
+POLL_INTERVAL = 0.25
+
+
+class AdmissionRejected(Exception):
+    """The request was shed; ``retry_after`` is a hint in seconds."""
+
+    def __init__(self, reason, retry_after=1.0):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``rate`` tokens per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """Take one token; return 0 on success or the seconds until one is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class KeyedBuckets:
+    """One bucket per key, forgetting the least recently seen keys past ``max_keys``."""
+
+    def __init__(self, rate, capacity, max_keys=100000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def take(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(now)
+
+
+class _Waiter:
+    def __init__(self, loop=None):
+        self.event = threading.Event()
+        self.granted = False
+        # A waiter on an event loop is woken through a future on that loop
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+
+    def grant(self):
+        self.granted = True
+        self.event.set()
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_wake, self.future)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionController:
+    """Guards the upstream deployment against bursts.
+
+    ``check_rate`` is cheap and runs before any work is done. ``slot`` wraps
+    the upstream call itself: at most ``max_concurrent`` run at once, and up
+    to ``max_queue`` more wait their turn, served round-robin across sessions
+    so one busy session cannot starve the others. Anything beyond that is
+    rejected immediately rather than timing out later. ``aslot`` is the same
+    slot for coroutines, sharing the limits and the queue with ``slot``.
+    """
+
+    def __init__(self, max_concurrent=16, max_queue=64, queue_timeout=10.0,
+                 session_rate=20 / 60, session_burst=5, ip_rate=60 / 60, ip_burst=20,
+                 upstream_rpm=0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._sessions = KeyedBuckets(session_rate, session_burst)
+        self._ips = KeyedBuckets(ip_rate, ip_burst)
+        # Requests per minute the deployment is provisioned for; 0 disables the check
+        self._global = TokenBucket(upstream_rpm / 60, max(1, upstream_rpm / 60)) if upstream_rpm else None
+        self._active = 0
+        self._queues = OrderedDict()
+        self._queued = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def check_rate(self, session_key, ip):
+        now = time.monotonic()
+        with self._lock:
+            wait = self._sessions.take(session_key, now)
+            reason = "session rate limit"
+            if not wait:
+                wait = self._ips.take(ip, now)
+                reason = "client rate limit"
+            if wait:
+                self.rejected += 1
+                raise AdmissionRejected(reason, retry_after=wait)
+
+    @contextmanager
+    def slot(self, session_key, deadline=None):
+        self._acquire(session_key, deadline)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, session_key, deadline=None):
+        waiter = self._enqueue(session_key, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await self._await_turn(waiter, deadline)
+            except asyncio.CancelledError:
+                self._abandon(session_key, waiter)
+                raise
+            self._settle(session_key, waiter, deadline)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _enqueue(self, session_key, loop=None):
+        """Take a slot at once (returning None) or join the queue (returning the waiter)."""
+        with self._lock:
+            if self._global is not None:
+                wait = self._global.take(time.monotonic())
+                if wait:
+                    self.rejected += 1
+                    raise AdmissionRejected("upstream quota", retry_after=wait)
+            if self._active < self.max_concurrent and not self._queued:
+                self._active += 1
+                self.admitted += 1
+                return None
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected("queue full", retry_after=self.queue_timeout)
+            waiter = _Waiter(loop)
+            self._queues.setdefault(session_key, deque()).append(waiter)
+            self._queued += 1
+            return waiter
+
+    def _acquire(self, session_key, deadline=None):
+        waiter = self._enqueue(session_key)
+        if waiter is None:
+            return
+        if deadline is None:
+            waiter.event.wait(self.queue_timeout)
+        else:
+            # A request whose client left or whose deadline passed gives up its place in line
+            ends = time.monotonic() + deadline.timeout(self.queue_timeout)
+            while not waiter.event.wait(min(POLL_INTERVAL, max(0.0, ends - time.monotonic()))):
+                if time.monotonic() >= ends or deadline.cancelled():
+                    break
+        self._settle(session_key, waiter, deadline)
+
+    async def _await_turn(self, waiter, deadline):
+        ends = time.monotonic() + (self.queue_timeout if deadline is None else deadline.timeout(self.queue_timeout))
+        while not waiter.future.done():
+            remaining = ends - time.monotonic()
+            if remaining <= 0 or (deadline is not None and deadline.cancelled()):
+                return
+            await asyncio.wait([waiter.future], timeout=min(POLL_INTERVAL, remaining))
+
+    def _settle(self, session_key, waiter, deadline):
+        """Keep the slot a waiter was granted, or take it out of the queue and raise."""
+        with self._lock:
+            if waiter.granted:
+                self.admitted += 1
+                return
+            # Timed out or cancelled: take ourselves out of the queue
+            self._dequeue(session_key, waiter)
+            if deadline is not None and deadline.cancelled():
+                raise Cancelled(deadline.reason, "admission")
+            self.rejected += 1
+        raise AdmissionRejected("queue timeout", retry_after=self.queue_timeout)
+
+    def _abandon(self, session_key, waiter):
+        # The waiting task was cancelled; a slot granted meanwhile goes to the next in line
+        with self._lock:
+            granted = waiter.granted
+            if not granted:
+                self._dequeue(session_key, waiter)
+        if granted:
+            self._release()
+
+    def _dequeue(self, session_key, waiter):
+        queue = self._queues.get(session_key)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            if not queue:
+                del self._queues[session_key]
+
+    def _release(self):
+        with self._lock:
+            if not self._queues:
+                self._active -= 1
+                return
+            # Round-robin: the session served next moves to the back of the line
+            session_key, queue = self._queues.popitem(last=False)
+            waiter = queue.popleft()
+            if queue:
+                self._queues[session_key] = queue
+            self._queued -= 1
+            # The slot passes straight to the waiter, so _active stays the same
+            waiter.grant()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "queued": self._queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
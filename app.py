@@ -1,41 +1,262 @@
-from flask import Flask, request, jsonify, render_template_string, session
+from flask import Flask, current_app, request, jsonify, session, Response, stream_with_context
+from flask.sessions import SecureCookieSessionInterface
 import os
-import requests
+import json
+import math
+import time
+import uuid
 import logging
+import threading
 from dotenv import load_dotenv
-import markdown2
+from markupsafe import Markup
+from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime
-import re
-
-# Load environment variables
-load_dotenv()
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('app.log')
-    ]
-)
+from assets import StaticAssets, compress_response, negotiate_encoding
+from admission import AdmissionController, AdmissionRejected
+from coalescing import CoalesceTimeout, SingleFlight
+from conversation_store import create_store
+from deadline import Cancelled, Deadline, socket_disconnected
+from logging_setup import configure_logging, request_id_var
+from market_data import CachedMarketData, create_provider
+from markdown_render import MarkdownRenderer
+from metrics import COUNT_BUCKETS, SIZE_BUCKETS, Registry
+from profiling import ProfilingMiddleware, stage
+from prompts import build_context_builder, chat_payload
+from response_cache import ResponseCache, cache_key
+from tools import ToolRunner, market_data_tools
+from topic_filter import TopicFilter
+from upstream import UpstreamClient, CircuitBreaker
+from upstream_router import Backend, UpstreamRouter
+
 logger = logging.getLogger(__name__)
 
-# Read environment variables
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
+def backend_specs():
+    """Deployments from AZURE_OPENAI_BACKENDS (a JSON list), or the single-deployment variables.
+
+    Each entry may set name, endpoint, deployment, api_key, api_version,
+    weight and rpm; anything missing falls back to the AZURE_OPENAI_* values.
+    A weight must be positive; leave a deployment out of the list to disable it.
+    """
+    specs = json.loads(os.getenv("AZURE_OPENAI_BACKENDS") or "[{}]")
+    defaults = {
+        "endpoint": os.getenv("AZURE_OPENAI_ENDPOINT"),
+        "deployment": os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+        "api_key": os.getenv("AZURE_OPENAI_API_KEY"),
+        "api_version": os.getenv("AZURE_OPENAI_API_VERSION"),
+        "weight": 1.0,
+        "rpm": 0,
+    }
+    resolved = []
+    for index, spec in enumerate(specs):
+        spec = dict(defaults, **spec)
+        spec.setdefault("name", spec["deployment"] if len(specs) == 1 else f"backend{index}")
+        if not float(spec["weight"]) > 0:
+            raise ValueError(f"Backend {spec['name']} needs a weight above 0, got {spec['weight']}")
+        spec["api_url"] = (f"{spec['endpoint']}/openai/deployments/{spec['deployment']}"
+                           f"/chat/completions?api-version={spec['api_version']}")
+        spec["headers"] = {"Content-Type": "application/json", "api-key": spec["api_key"]}
+        resolved.append(spec)
+    return resolved
+
+# Prometheus metrics, scraped from /metrics
+metrics = Registry()
+UPSTREAM_LATENCY = metrics.histogram("chat_upstream_latency_seconds", "Chat completion time including retries.", ["mode"])
+TIME_TO_FIRST_TOKEN = metrics.histogram("chat_time_to_first_token_seconds", "Time until the first streamed delta.")
+MARKDOWN_RENDER = metrics.histogram("chat_markdown_render_seconds", "Markdown to sanitized HTML render time.")
+TEMPLATE_RENDER = metrics.histogram("chat_template_render_seconds", "Jinja render time.", ["template"])
+REQUEST_SIZE = metrics.histogram("chat_request_size_bytes", "HTTP request body size.", ["endpoint"], buckets=SIZE_BUCKETS)
+HISTORY_LENGTH = metrics.histogram("chat_session_history_turns", "Stored turns in a conversation when a message arrives.",
+                                   buckets=COUNT_BUCKETS)
+TOKENS = metrics.counter("chat_tokens", "Tokens reported in the upstream usage field.", ["kind"])
+CALCULATOR_ANSWERS = metrics.counter("chat_calculator_answers", "Questions answered locally by a calculator.", ["intent"])
+OFF_TOPIC_REJECTIONS = metrics.counter("chat_off_topic_rejections", "Questions turned away by the local topic filter.")
+UPSTREAM_ERRORS = metrics.counter("chat_upstream_errors", "Failed upstream attempts by HTTP status.", ["backend", "status"])
+HISTORY_SEARCH = metrics.histogram("chat_history_search_seconds", "Full-text search over a conversation.")
+TOOL_CALLS = metrics.counter("chat_tool_calls", "Tool calls requested by the model, by outcome.", ["tool", "status"])
+TOOL_LATENCY = metrics.histogram("chat_tool_latency_seconds", "Execution time of one tool call.", ["tool"])
+CANCELLED_WORK = metrics.counter("chat_cancelled_work", "Stages skipped or cut short because the deadline passed "
+                                 "or the client disconnected.", ["stage", "reason"])
+# Copied from the services' own stats() when /metrics is scraped
+RESPONSE_CACHE_LOOKUPS = metrics.counter("chat_response_cache_lookups", "Response cache lookups.", ["result"])
+RESPONSE_CACHE_ENTRIES = metrics.gauge("chat_response_cache_entries", "Replies held by the response cache.")
+COALESCED_CALLS = metrics.counter("chat_coalesced_calls", "Identical prompts by how single-flight handled them.",
+                                  ["path", "outcome"])
+COALESCE_IN_FLIGHT = metrics.gauge("chat_coalesce_in_flight", "Distinct prompts with an upstream call in flight.", ["path"])
+UPSTREAM_ROUTING = metrics.counter("chat_upstream_routing", "Failovers, hedges launched and hedges that won.", ["event"])
+BACKEND_LATENCY = metrics.gauge("chat_backend_latency_seconds", "Smoothed completion latency per backend.", ["backend"])
+BACKEND_ERROR_RATE = metrics.gauge("chat_backend_error_rate", "Smoothed share of failed calls per backend.", ["backend"])
+BACKEND_HEALTHY = metrics.gauge("chat_backend_healthy", "1 while the backend's circuit breaker lets calls through.",
+                                ["backend"])
+
+def export_coalescing(path, stats):
+    for outcome in ("leaders", "coalesced", "timeouts", "cancelled"):
+        COALESCED_CALLS.set(stats[outcome], path=path, outcome=outcome)
+    COALESCE_IN_FLIGHT.set(stats["in_flight"], path=path)
+
+@metrics.collect
+def export_service_stats():
+    cache = response_cache.stats()
+    RESPONSE_CACHE_LOOKUPS.set(cache["hits"], result="hit")
+    RESPONSE_CACHE_LOOKUPS.set(cache["misses"], result="miss")
+    RESPONSE_CACHE_ENTRIES.set(cache["size"])
+    export_coalescing("sync", coalescer.stats())
+    routing = upstream_client.stats()
+    for event in ("failovers", "hedges", "hedge_wins"):
+        UPSTREAM_ROUTING.set(routing[event], event=event)
+    for name, backend in routing["backends"].items():
+        if backend["latency"] is not None:
+            BACKEND_LATENCY.set(backend["latency"], backend=name)
+        BACKEND_ERROR_RATE.set(backend["error_rate"], backend=name)
+        BACKEND_HEALTHY.set(1 if backend["healthy"] else 0, backend=name)
+
+def upstream_options(name):
+    """Client settings shared by every backend, for both the sync and async clients."""
+    return {
+        "connect_timeout": float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3.05")),
+        "read_timeout": float(os.getenv("UPSTREAM_READ_TIMEOUT", "30")),
+        "max_retries": int(os.getenv("UPSTREAM_MAX_RETRIES", "3")),
+        "on_error": lambda status: UPSTREAM_ERRORS.inc(backend=name, status=status),
+    }
+
+SUMMARY_MAX_TOKENS = 300
+HISTORY_MAX_PAGE_SIZE = 100
+SEARCH_MAX_RESULTS = 50
+
+def record_tool_call(name, status, seconds):
+    TOOL_CALLS.inc(tool=name, status=status)
+    TOOL_LATENCY.observe(seconds, tool=name)
+
+def summarize_turns(messages):
+    payload = {"messages": messages, "temperature": 0.3, "max_tokens": SUMMARY_MAX_TOKENS}
+    result = upstream_client.chat_completion(payload)
+    return result["choices"][0]["message"]["content"]
+
+def build_router(specs, pool_size):
+    """An UpstreamRouter over ``specs``, with one keep-alive pool and breaker per deployment."""
+    return UpstreamRouter(
+        [
+            Backend(
+                spec["name"],
+                UpstreamClient(
+                    spec["api_url"],
+                    spec["headers"],
+                    pool_size=pool_size,
+                    breaker=CircuitBreaker(
+                        failure_threshold=int(os.getenv("UPSTREAM_BREAKER_THRESHOLD", "5")),
+                        reset_timeout=float(os.getenv("UPSTREAM_BREAKER_RESET", "30")),
+                    ),
+                    **upstream_options(spec["name"]),
+                ),
+                weight=float(spec["weight"]),
+                rpm=int(spec["rpm"]),
+            )
+            for spec in specs
+        ],
+        hedge=os.getenv("UPSTREAM_HEDGE", "0") == "1",
+        hedge_min_delay=float(os.getenv("UPSTREAM_HEDGE_MIN_DELAY", "0.5")),
+        hedge_workers=int(os.getenv("UPSTREAM_HEDGE_WORKERS", "32")),
+    )
+
+def init_services():
+    """Build the shared services from the environment.
+
+    They live at module level so the turn helpers and asgi.py can share them,
+    which makes this one app per process; a preforking server runs it once
+    in every worker.
+    """
+    global BACKENDS, upstream_client, conversation_store, markdown_renderer, response_cache, coalescer, admission
+    global assets, context_builder, topic_filter, tool_runner
+    global RESPONSE_CACHE_CONTEXT_TURNS, COALESCE_WAIT_TIMEOUT, CALCULATORS_ENABLED, HISTORY_PAGE_SIZE, WARM_CONNECTIONS
+    global REQUEST_DEADLINE
+
+    BACKENDS = backend_specs()
+    # Upstream calls in flight at once; the connection pools are sized to match
+    max_concurrent = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "16"))
+
+    # Shared upstream router: one keep-alive pool and breaker per deployment
+    upstream_client = build_router(BACKENDS, int(os.getenv("UPSTREAM_POOL_SIZE", str(max_concurrent))))
+    # Keep-alive connections per backend opened by warm_up() before the first request
+    WARM_CONNECTIONS = int(os.getenv("UPSTREAM_WARM_CONNECTIONS", "2"))
+
+    # Conversation history is kept server-side; the session cookie only holds its id
+    conversation_store = create_store(
+        os.getenv("CONVERSATION_STORE", "memory"),
+        max_bytes=int(os.getenv("CONVERSATION_STORE_MAX_BYTES", str(64 * 1024 * 1024))),
+        path=os.getenv("CONVERSATION_DB_PATH", "conversations.db"),
+    )
+
+    # Replies are rendered once per distinct text and sanitized before `| safe`
+    markdown_renderer = MarkdownRenderer(
+        cache_size=int(os.getenv("MARKDOWN_CACHE_SIZE", "1024")),
+        max_workers=int(os.getenv("MARKDOWN_WORKERS", "2")),
+    )
+
+    # Repeated questions are answered from here instead of going upstream
+    response_cache = ResponseCache(
+        max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+        path=os.getenv("RESPONSE_CACHE_PATH") or None,
+    )
+    RESPONSE_CACHE_CONTEXT_TURNS = int(os.getenv("RESPONSE_CACHE_CONTEXT_TURNS", "2"))
+
+    # Identical prompts that arrive while one is in flight wait for its answer
+    coalescer = SingleFlight()
+    COALESCE_WAIT_TIMEOUT = float(os.getenv("COALESCE_WAIT_TIMEOUT", "60"))
+
+    # Seconds a chat turn may take end to end; admission, retries and the upstream timeout all fit inside it
+    REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "45"))
+
+    # Sheds bursts early with a 429 instead of letting them pile up on the deployment
+    admission = AdmissionController(
+        max_concurrent=max_concurrent,
+        max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+        queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+        session_rate=float(os.getenv("SESSION_RATE_PER_MIN", "20")) / 60,
+        session_burst=int(os.getenv("SESSION_BURST", "5")),
+        ip_rate=float(os.getenv("IP_RATE_PER_MIN", "60")) / 60,
+        ip_burst=int(os.getenv("IP_BURST", "20")),
+        upstream_rpm=int(os.getenv("UPSTREAM_RPM", "0")),
+    )
+
+    # CSS and JS are served from memory under content-hashed names
+    assets = StaticAssets(os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+
+    # Shared with batch.py, so batch prompts match the interactive ones
+    context_builder = build_context_builder(conversation_store, summarize=summarize_turns)
 
-API_URL = f"{AZURE_OPENAI_ENDPOINT}/openai/deployments/{AZURE_OPENAI_DEPLOYMENT}/chat/completions?api-version={AZURE_OPENAI_API_VERSION}"
-HEADERS = {
-    "Content-Type": "application/json",
-    "api-key": AZURE_OPENAI_API_KEY
-}
+    # Deterministic finance math is answered locally instead of by the model
+    CALCULATORS_ENABLED = os.getenv("CALCULATORS_ENABLED", "1") == "1"
 
-# Initialize Flask app
-app = Flask(__name__)
-app.secret_key = os.getenv("FLASK_SECRET_KEY", "your_default_secret_key")
+    # Clearly off-topic questions get a canned reply without an upstream round-trip
+    topic_filter = (TopicFilter(threshold=float(os.getenv("TOPIC_FILTER_THRESHOLD", "0.2")))
+                    if os.getenv("TOPIC_FILTER_ENABLED", "1") == "1" else None)
+
+    HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "30"))
+
+    # Live quotes and rates through chat-completions tool calls; MARKET_DATA_PROVIDER=local needs no network
+    tool_runner = None
+    if os.getenv("MARKET_DATA_PROVIDER"):
+        market_data = CachedMarketData(
+            create_provider(
+                os.getenv("MARKET_DATA_PROVIDER"),
+                path=os.getenv("MARKET_DATA_PATH", "market_data.json"),
+                url=os.getenv("MARKET_DATA_URL"),
+                api_key=os.getenv("MARKET_DATA_API_KEY"),
+            ),
+            ttl=float(os.getenv("MARKET_DATA_TTL", "60")),
+            batch_window=float(os.getenv("MARKET_DATA_BATCH_WINDOW", "0.005")),
+        )
+        tool_runner = ToolRunner(
+            market_data_tools(market_data),
+            max_workers=int(os.getenv("TOOL_WORKERS", "8")),
+            max_rounds=int(os.getenv("TOOL_MAX_ROUNDS", "3")),
+            call_timeout=float(os.getenv("TOOL_CALL_TIMEOUT", "10")),
+            on_call=record_tool_call,
+        )
+
+# Readiness: set once warm_up() has run, cleared again when the worker starts draining
+ready = threading.Event()
+draining = threading.Event()
 
 # Enhanced HTML Template with responsive design
 HTML_TEMPLATE = """
@@ -46,338 +267,9 @@ HTML_TEMPLATE = """
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Finance Chatbot</title>
     <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css" rel="stylesheet">
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            height: 100vh;
-            padding: 10px;
-            overflow: hidden;
-        }
-        
-        .container {
-            max-width: 95%;
-            width: 100%;
-            height: 90vh;
-            margin: 0 auto;
-            background: rgba(255, 255, 255, 0.95);
-            border-radius: 20px;
-            box-shadow: 0 20px 40px rgba(0, 0, 0, 0.1);
-            overflow: hidden;
-            backdrop-filter: blur(10px);
-            display: flex;
-            flex-direction: column;
-        }
-        
-        .header {
-            background: linear-gradient(135deg, #2c3e50 0%, #3498db 100%);
-            color: white;
-            padding: 15px 20px;
-            text-align: center;
-            position: relative;
-        }
-        
-        .header::before {
-            content: '';
-            position: absolute;
-            top: 0;
-            left: 0;
-            right: 0;
-            bottom: 0;
-            background: url('data:image/svg+xml,<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100"><circle cx="20" cy="20" r="2" fill="rgba(255,255,255,0.1)"/><circle cx="80" cy="40" r="1.5" fill="rgba(255,255,255,0.1)"/><circle cx="40" cy="80" r="1" fill="rgba(255,255,255,0.1)"/></svg>');
-        }
-        
-        .header h1 {
-            font-size: 1.5em;
-            margin: 0;
-            position: relative;
-            z-index: 1;
-        }
-        
-        .chat-container {
-            display: flex;
-            flex-direction: column;
-            flex: 1;
-            min-height: 0;
-        }
-        
-        .chat-history {
-            flex: 1;
-            overflow-y: auto;
-            padding: 20px;
-            background: #f8f9fa;
-        }
-        
-        .chat-history::-webkit-scrollbar {
-            width: 6px;
-        }
-        
-        .chat-history::-webkit-scrollbar-track {
-            background: #f1f1f1;
-            border-radius: 10px;
-        }
-        
-        .chat-history::-webkit-scrollbar-thumb {
-            background: #888;
-            border-radius: 10px;
-        }
-        
-        .chat-history::-webkit-scrollbar-thumb:hover {
-            background: #555;
-        }
-        
-        .message {
-            margin-bottom: 20px;
-            animation: slideIn 0.3s ease-out;
-        }
-        
-        @keyframes slideIn {
-            from {
-                opacity: 0;
-                transform: translateY(20px);
-            }
-            to {
-                opacity: 1;
-                transform: translateY(0);
-            }
-        }
-        
-        .user-message {
-            display: flex;
-            justify-content: flex-end;
-            align-items: flex-start;
-            gap: 15px;
-        }
-        
-        .bot-message {
-            display: flex;
-            justify-content: flex-start;
-            align-items: flex-start;
-            gap: 15px;
-        }
-        
-        .message-bubble {
-            max-width: 70%;
-            padding: 15px 20px;
-            border-radius: 20px;
-            box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
-            position: relative;
-        }
-        
-        .user-bubble {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-        }
-        
-        .bot-bubble {
-            background: white;
-            color: #333;
-            border: 1px solid #e0e0e0;
-        }
-        
-        .message-avatar {
-            width: 40px;
-            height: 40px;
-            border-radius: 50%;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-size: 1.2em;
-            flex-shrink: 0;
-        }
-        
-        .user-avatar {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-        }
-        
-        .bot-avatar {
-            background: linear-gradient(135deg, #2c3e50 0%, #3498db 100%);
-            color: white;
-        }
-        
-        .message-time {
-            font-size: 0.8em;
-            opacity: 0.7;
-            margin-top: 5px;
-        }
-        
-        .input-area {
-            padding: 20px;
-            background: white;
-            border-top: 1px solid #e0e0e0;
-        }
-        
-        .input-form {
-            display: flex;
-            gap: 15px;
-            align-items: center;
-        }
-        
-        .input-field {
-            flex: 1;
-            padding: 15px 20px;
-            border: 2px solid #e0e0e0;
-            border-radius: 25px;
-            font-size: 16px;
-            outline: none;
-            transition: all 0.3s ease;
-        }
-        
-        .input-field:focus {
-            border-color: #667eea;
-            box-shadow: 0 0 0 3px rgba(102, 126, 234, 0.1);
-        }
-        
-        .send-button {
-            width: 50px;
-            height: 50px;
-            border: none;
-            border-radius: 50%;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            font-size: 1.2em;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-        }
-        
-        .send-button:hover {
-            transform: scale(1.1);
-            box-shadow: 0 5px 15px rgba(102, 126, 234, 0.4);
-        }
-        
-        .send-button:active {
-            transform: scale(0.95);
-        }
-        
-        .clear-button {
-            padding: 8px 16px;
-            border: 1px solid #dc3545;
-            border-radius: 20px;
-            background: transparent;
-            color: #dc3545;
-            cursor: pointer;
-            font-size: 0.9em;
-            transition: all 0.3s ease;
-        }
-        
-        .clear-button:hover {
-            background: #dc3545;
-            color: white;
-        }
-        
-        .empty-state {
-            text-align: center;
-            padding: 60px 20px;
-            color: #666;
-        }
-        
-        .empty-state i {
-            font-size: 4em;
-            margin-bottom: 20px;
-            color: #ddd;
-        }
-        
-        .empty-state h3 {
-            font-size: 1.5em;
-            margin-bottom: 10px;
-        }
-        
-        .empty-state p {
-            font-size: 1.1em;
-            opacity: 0.8;
-        }
-        
-        .markdown {
-            line-height: 1.6;
-        }
-        
-        .markdown h1, .markdown h2, .markdown h3 {
-            margin-bottom: 10px;
-            color: #2c3e50;
-        }
-        
-        .markdown ul, .markdown ol {
-            margin-left: 20px;
-            margin-bottom: 10px;
-        }
-        
-        .markdown code {
-            background: #f4f4f4;
-            padding: 2px 6px;
-            border-radius: 4px;
-            font-family: 'Courier New', monospace;
-        }
-        
-        .markdown blockquote {
-            border-left: 4px solid #667eea;
-            padding-left: 15px;
-            margin: 10px 0;
-            color: #555;
-        }
-        
-        /* Responsive Design */
-        @media (max-width: 768px) {
-            body {
-                padding: 5px;
-            }
-            
-            .container {
-                border-radius: 15px;
-                height: 95vh;
-            }
-            
-            .header {
-                padding: 10px 15px;
-            }
-            
-            .header h1 {
-                font-size: 1.3em;
-            }
-            
-            .message-bubble {
-                max-width: 85%;
-            }
-            
-            .input-area {
-                padding: 15px;
-            }
-            
-            .input-field {
-                font-size: 16px; /* Prevents zoom on iOS */
-            }
-        }
-        
-        @media (max-width: 480px) {
-            .header h1 {
-                font-size: 1.2em;
-            }
-            
-            .message-bubble {
-                max-width: 90%;
-                padding: 12px 16px;
-            }
-            
-            .message-avatar {
-                width: 35px;
-                height: 35px;
-                font-size: 1em;
-            }
-            
-            .container {
-                height: 98vh;
-            }
-        }
-    </style>
+    <script src="https://cdnjs.cloudflare.com/ajax/libs/marked/4.3.0/marked.min.js" defer></script>
+    <script src="https://cdnjs.cloudflare.com/ajax/libs/dompurify/3.0.6/purify.min.js" defer></script>
+    <link href="{{ asset_url('chat.css') }}" rel="stylesheet">
 </head>
 <body>
     <div class="container">
@@ -386,36 +278,12 @@ HTML_TEMPLATE = """
         </div>
         
         <div class="chat-container">
-            <div class="chat-history" id="chatHistory">
+            <div class="chat-history" id="chatHistory"{% if cursor is not none %} data-cursor="{{ cursor }}"{% endif %}>
+                {% if cursor is not none %}
+                    <div class="history-more"><i class="fas fa-spinner"></i> Scroll up for earlier messages</div>
+                {% endif %}
                 {% if chat_history and chat_history|length > 0 %}
-                    {% for message in chat_history %}
-                        {% if message|length >= 3 %}
-                            {% set role, content, timestamp = message[0], message[1], message[2] %}
-                            <div class="message">
-                                {% if role == 'user' %}
-                                    <div class="user-message">
-                                        <div class="message-bubble user-bubble">
-                                            <div>{{ content }}</div>
-                                            <div class="message-time">{{ timestamp }}</div>
-                                        </div>
-                                        <div class="message-avatar user-avatar">
-                                            <i class="fas fa-user"></i>
-                                        </div>
-                                    </div>
-                                {% else %}
-                                    <div class="bot-message">
-                                        <div class="message-avatar bot-avatar">
-                                            <i class="fas fa-robot"></i>
-                                        </div>
-                                        <div class="message-bubble bot-bubble">
-                                            <div class="markdown">{{ content | safe }}</div>
-                                            <div class="message-time">{{ timestamp }}</div>
-                                        </div>
-                                    </div>
-                                {% endif %}
-                            </div>
-                        {% endif %}
-                    {% endfor %}
+                    {{ render_turns(chat_history) }}
                 {% else %}
                     <div class="empty-state">
                         <i class="fas fa-comments"></i>
@@ -426,6 +294,9 @@ HTML_TEMPLATE = """
             </div>
             
             <div class="input-area">
+                {% if notice %}
+                    <div class="notice">{{ notice }}</div>
+                {% endif %}
                 <form method="POST" action="/chat" class="input-form">
                     <input type="text" name="user_input" class="input-field" 
                            placeholder="Ask a financial question..." required autofocus />
@@ -437,220 +308,586 @@ HTML_TEMPLATE = """
         </div>
     </div>
 
-    <script>
-        // Auto-scroll to bottom of chat only for new messages
-        let shouldScrollToBottom = true;
-        
-        function scrollToBottom() {
-            const chatHistory = document.getElementById('chatHistory');
-            if (shouldScrollToBottom) {
-                chatHistory.scrollTop = chatHistory.scrollHeight;
-            }
-        }
-        
-        // Check if user has scrolled up
-        function checkScroll() {
-            const chatHistory = document.getElementById('chatHistory');
-            const threshold = 100; // pixels from bottom
-            shouldScrollToBottom = (chatHistory.scrollTop + chatHistory.clientHeight + threshold >= chatHistory.scrollHeight);
-        }
-        
-        // Clear chat history
-        function clearChat() {
-            if (confirm('Are you sure you want to clear the chat history?')) {
-                fetch('/clear', { method: 'POST' })
-                    .then(response => response.json())
-                    .then(data => {
-                        if (data.status === 'success') {
-                            location.reload();
-                        }
-                    })
-                    .catch(error => {
-                        console.error('Error clearing chat:', error);
-                        location.reload();
-                    });
-            }
-        }
-        
-        // Initialize event listeners
-        window.addEventListener('load', function() {
-            const chatHistory = document.getElementById('chatHistory');
-            
-            // Add scroll listener to detect if user scrolled up
-            chatHistory.addEventListener('scroll', checkScroll);
-            
-            // Initially scroll to bottom if there are messages
-            const messages = chatHistory.querySelectorAll('.message');
-            if (messages.length > 0) {
-                setTimeout(scrollToBottom, 100);
-            }
-        });
-        
-        // Handle form submission
-        document.querySelector('form').addEventListener('submit', function(e) {
-            // Set flag to scroll to bottom for new messages
-            shouldScrollToBottom = true;
-            
-            // Clear the input field after submission
-            setTimeout(function() {
-                document.querySelector('.input-field').value = '';
-            }, 100);
-        });
-        
-        // Auto-resize input field
-        const inputField = document.querySelector('.input-field');
-        if (inputField) {
-            inputField.addEventListener('input', function() {
-                this.style.height = 'auto';
-                this.style.height = this.scrollHeight + 'px';
-            });
-        }
-        
-        // Add visual feedback for scroll position
-        function updateScrollIndicator() {
-            const chatHistory = document.getElementById('chatHistory');
-            const isAtBottom = chatHistory.scrollTop + chatHistory.clientHeight >= chatHistory.scrollHeight - 10;
-            
-            if (!isAtBottom && chatHistory.scrollHeight > chatHistory.clientHeight) {
-                if (!document.querySelector('.scroll-indicator')) {
-                    const indicator = document.createElement('div');
-                    indicator.className = 'scroll-indicator';
-                    indicator.innerHTML = '<i class="fas fa-chevron-down"></i>';
-                    indicator.style.cssText = `
-                        position: absolute;
-                        bottom: 80px;
-                        right: 30px;
-                        background: rgba(102, 126, 234, 0.9);
-                        color: white;
-                        width: 40px;
-                        height: 40px;
-                        border-radius: 50%;
-                        display: flex;
-                        align-items: center;
-                        justify-content: center;
-                        cursor: pointer;
-                        box-shadow: 0 2px 10px rgba(0,0,0,0.2);
-                        z-index: 1000;
-                        animation: bounce 2s infinite;
-                    `;
-                    indicator.onclick = function() {
-                        shouldScrollToBottom = true;
-                        scrollToBottom();
-                    };
-                    document.querySelector('.container').style.position = 'relative';
-                    document.querySelector('.container').appendChild(indicator);
-                }
-            } else {
-                const indicator = document.querySelector('.scroll-indicator');
-                if (indicator) {
-                    indicator.remove();
-                }
-            }
-        }
-        
-        // Add bounce animation for scroll indicator
-        const style = document.createElement('style');
-        style.textContent = `
-            @keyframes bounce {
-                0%, 20%, 50%, 80%, 100% {
-                    transform: translateY(0);
-                }
-                40% {
-                    transform: translateY(-10px);
-                }
-                60% {
-                    transform: translateY(-5px);
-                }
-            }
-        `;
-        document.head.appendChild(style);
-        
-        // Update scroll indicator on scroll
-        document.addEventListener('DOMContentLoaded', function() {
-            const chatHistory = document.getElementById('chatHistory');
-            if (chatHistory) {
-                chatHistory.addEventListener('scroll', updateScrollIndicator);
-                setTimeout(updateScrollIndicator, 500);
-            }
-        });
-    </script>
+    <script src="{{ asset_url('chat.js') }}"></script>
 </body>
 </html>
 """
 
-@app.route("/", methods=["GET"])
+# Markup for a run of turns, shared by the full page and the JSON chat API
+TURNS_HTML_TEMPLATE = """
+{% for message in turns %}
+    {% if message|length >= 3 %}
+        {% set role, content, timestamp = message[0], message[1], message[2] %}
+        <div class="message">
+            {% if role == 'user' %}
+                <div class="user-message">
+                    <div class="message-bubble user-bubble">
+                        <div>{{ content }}</div>
+                        <div class="message-time">{{ timestamp }}</div>
+                    </div>
+                    <div class="message-avatar user-avatar">
+                        <i class="fas fa-user"></i>
+                    </div>
+                </div>
+            {% else %}
+                <div class="bot-message">
+                    <div class="message-avatar bot-avatar">
+                        <i class="fas fa-robot"></i>
+                    </div>
+                    <div class="message-bubble bot-bubble">
+                        <div class="markdown">{{ content | safe }}</div>
+                        <div class="message-time">{{ timestamp }}</div>
+                    </div>
+                </div>
+            {% endif %}
+        </div>
+    {% endif %}
+{% endfor %}
+"""
+
+def render_turns(turns):
+    with TEMPLATE_RENDER.time(template="turns"), stage("template"):
+        return Markup(TURNS_TEMPLATE.render(turns=turns))
+
+ERROR_MESSAGE = "❌ Sorry, something went wrong while getting a response. Please try again."
+BUSY_MESSAGE = "⏳ The assistant is busy right now. Please try again in a few seconds."
+OFF_TOPIC_MESSAGE = ("I can only help with finance, investing and economics questions. "
+                     "Try asking about budgeting, saving, loans, markets or retirement planning.")
+RATE_LIMIT_MESSAGE = "You're sending messages too quickly. Please wait a moment and try again."
+TIMEOUT_MESSAGE = "⌛ That took too long to answer. Please try again, perhaps with a shorter question."
+CANCELLED_MESSAGE = "This answer was cancelled because the page was closed before it arrived."
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def get_session_id():
+    # The cookie only carries an opaque id; the conversation lives in the store
+    if "sid" not in session:
+        session["sid"] = uuid.uuid4().hex
+    return session["sid"]
+
+def render_chat_page(sid, notice=None):
+    # Only the newest page is rendered; older turns load from /api/history on scroll
+    chat_history, cursor = conversation_store.page(sid, limit=HISTORY_PAGE_SIZE)
+    with TEMPLATE_RENDER.time(template="page"), stage("template"):
+        return CHAT_TEMPLATE.render(chat_history=chat_history, cursor=cursor, notice=notice)
+
+def request_deadline():
+    # Both the development server and gunicorn expose the client connection, so a closed tab is noticed
+    sock = request.environ.get("gunicorn.socket") or request.environ.get("werkzeug.socket")
+    return Deadline(REQUEST_DEADLINE, (lambda: socket_disconnected(sock)) if sock is not None else None)
+
+def client_closed():
+    # nginx's "client closed request"; nobody reads the body
+    return Response(status=499)
+
+def skip_render(deadline):
+    """Whether the client left, so the page need not be rendered; the turn itself is already stored."""
+    if deadline.client_gone():
+        CANCELLED_WORK.inc(stage="render", reason="disconnect")
+        return True
+    return False
+
+def too_many_requests(body, rejection):
+    response = current_app.make_response(body)
+    response.status_code = 429
+    response.headers["Retry-After"] = str(max(1, math.ceil(rejection.retry_after)))
+    return response
+
+# The turn helpers below are shared by the threaded views and the async path in asgi.py
+
+def calculator_route(question):
+    # calc_router pulls in NumPy, so it is only imported once a calculator is used (or by warm_up)
+    from calc_router import route
+    return route(question)
+
+def local_answer(user_input):
+    """``(reply, reply_html)`` answered without the model, or None if the model is needed."""
+    with stage("calculator"):
+        routed = calculator_route(user_input) if CALCULATORS_ENABLED else None
+    if routed is not None:
+        intent, reply = routed
+        CALCULATOR_ANSWERS.inc(intent=intent)
+    elif topic_filter is not None and topic_filter.is_off_topic(user_input):
+        OFF_TOPIC_REJECTIONS.inc()
+        reply = OFF_TOPIC_MESSAGE
+    else:
+        return None
+    with MARKDOWN_RENDER.time(), stage("markdown"):
+        return reply, markdown_renderer.render(reply)
+
+def start_turn(sid, user_input):
+    """Record the user turn and return ``(user_turn, payload, cache_key, local_reply)``.
+
+    ``local_reply`` is a ``(reply, reply_html)`` pair when no upstream call is
+    needed, because a calculator answered or the response cache had a hit.
+    """
+    # Add timestamp to messages
+    timestamp = datetime.now().strftime("%I:%M %p")
+    user_turn = ("user", user_input, timestamp)
+    conversation_store.append(sid, user_turn)
+
+    calculated = local_answer(user_input)
+    if calculated is not None:
+        return user_turn, None, None, calculated
+
+    with stage("context"):
+        history = conversation_store.turns(sid)
+        HISTORY_LENGTH.observe(len(history))
+        messages = context_builder.build(sid, history)
+        payload = chat_payload(messages)
+        key = cache_key(messages, RESPONSE_CACHE_CONTEXT_TURNS)
+    with stage("cache"):
+        return user_turn, payload, key, response_cache.get(key)
+
+def record_completion(result, latency):
+    """Record latency and token usage of a finished (non-streamed) completion."""
+    usage = result.get("usage") or {}
+    UPSTREAM_LATENCY.observe(latency, mode="complete")
+    TOKENS.inc(usage.get("prompt_tokens", 0), kind="prompt")
+    TOKENS.inc(usage.get("completion_tokens", 0), kind="completion")
+    logger.info("Upstream completion", extra={
+        "latency_ms": round(latency * 1000, 1),
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+    })
+
+def timed_completion(payload, deadline=None):
+    started = time.perf_counter()
+    result = upstream_client.chat_completion(payload, deadline=deadline)
+    record_completion(result, time.perf_counter() - started)
+    return result
+
+def admitted_completion(sid, payload, deadline=None):
+    # One slot covers every round of a tool conversation
+    with admission.slot(sid, deadline):
+        if tool_runner is None:
+            return timed_completion(payload, deadline)
+        return tool_runner.converse(lambda p: timed_completion(p, deadline), payload, deadline)
+
+def stream_reply(payload, deadline=None, outcome=None):
+    """Content deltas of the reply; with tools configured, their rounds run between streamed requests."""
+    if tool_runner is None:
+        return upstream_client.stream_chat_completion(payload, deadline=deadline)
+
+    def open_stream(round_payload, tool_calls):
+        return upstream_client.stream_chat_completion(round_payload, deadline=deadline, tool_calls=tool_calls)
+
+    return tool_runner.stream(open_stream, payload, deadline, outcome)
+
+def cacheable_key(result, key):
+    # Replies built on live quotes go stale with them, so they are not cached
+    return None if result.get("tool_rounds") else key
+
+def complete(sid, payload, key, deadline=None):
+    """Fetch the reply for a prompt, sharing the upstream call with identical in-flight prompts.
+
+    Returns ``(reply, key)``, where ``key`` is None if the reply must not be cached.
+    """
+    # Only the leader of a coalesced group takes an admission slot
+    timeout = COALESCE_WAIT_TIMEOUT if deadline is None else deadline.timeout(COALESCE_WAIT_TIMEOUT)
+    # Covers the admission queue, coalescing and tool rounds as well as the model itself
+    with stage("upstream"):
+        try:
+            result = coalescer.do(key, lambda: admitted_completion(sid, payload, deadline), timeout=timeout)
+        except CoalesceTimeout:
+            # A follower waits no longer than its own deadline
+            if deadline is not None and deadline.cancelled():
+                raise Cancelled(deadline.reason, "upstream")
+            raise
+        except Cancelled:
+            if deadline is not None and deadline.cancelled():
+                raise
+            # The leader's client went away, not ours: make the call ourselves
+            result = admitted_completion(sid, payload, deadline)
+    reply = result["choices"][0]["message"]["content"]
+    logger.info(f"AI Response: {reply[:100]}", extra={"sample": True})
+    return reply, cacheable_key(result, key)
+
+def finish_turn(sid, key, reply, reply_html=None):
+    """Store the bot reply (rendering and caching it if new) and return the stored turn.
+
+    A None ``key`` stores the reply without caching it.
+    """
+    if reply_html is None:
+        # Convert markdown to HTML
+        with MARKDOWN_RENDER.time(), stage("markdown"):
+            reply_html = markdown_renderer.render(reply)
+        if key is not None:
+            response_cache.set(key, reply, reply_html)
+
+    # Add bot response with timestamp
+    bot_timestamp = datetime.now().strftime("%I:%M %p")
+    bot_turn = ("bot", reply_html, bot_timestamp, reply)
+    conversation_store.append(sid, bot_turn)
+    return bot_turn
+
+def fail_turn(sid, error):
+    logger.error(f"API error: {error}")
+    error_timestamp = datetime.now().strftime("%I:%M %p")
+    error_turn = ("bot", ERROR_MESSAGE, error_timestamp)
+    conversation_store.append(sid, error_turn)
+    return error_turn
+
+def cancel_turn(sid, error):
+    """Record a turn abandoned by its deadline or a disconnect, counting the stage it skipped."""
+    CANCELLED_WORK.inc(stage=error.stage, reason=error.reason)
+    logger.info(str(error), extra={"stage": error.stage, "reason": error.reason})
+    message = TIMEOUT_MESSAGE if error.reason == "deadline" else CANCELLED_MESSAGE
+    cancelled_turn = ("bot", message, datetime.now().strftime("%I:%M %p"))
+    conversation_store.append(sid, cancelled_turn)
+    return cancelled_turn
+
+def shed_turn(sid, rejection):
+    logger.warning(f"Request shed: {rejection.reason}")
+    busy_turn = ("bot", BUSY_MESSAGE, datetime.now().strftime("%I:%M %p"))
+    conversation_store.append(sid, busy_turn)
+    return busy_turn
+
+def warm_up():
+    """Do the work a cold first request would: lazy imports, renders and upstream connections.
+
+    Readiness is only reported once this has run, so a restarted worker gets
+    traffic with its pools already open.
+    """
+    started = time.perf_counter()
+    if CALCULATORS_ENABLED:
+        calculator_route("How much will $1,000 grow to at 5% for 10 years?")
+    markdown_renderer.render("**Warm-up**")
+    if context_builder.knowledge is not None:
+        # Pages in the postings and embedding rows a typical question touches
+        context_builder.reference("interest rate savings account fees")
+    CHAT_TEMPLATE.render(chat_history=[], cursor=None, notice=None)
+    connections = sum(backend.client.warm(WARM_CONNECTIONS) for backend in upstream_client.backends)
+    ready.set()
+    logger.info(f"Warmed up in {time.perf_counter() - started:.2f}s", extra={"upstream_connections": connections})
+
+def begin_drain():
+    # Fail readiness so the load balancer stops sending new requests; in-flight ones finish
+    draining.set()
+    logger.info("Draining: readiness now reports 503")
+
+def start_request_log(request_id=None):
+    # Honour an id from the proxy so log lines can be joined across hops
+    request_id_var.set(request_id or uuid.uuid4().hex)
+    return time.perf_counter()
+
+def log_request(response, started):
+    response.headers["X-Request-ID"] = request_id_var.get()
+    logger.info(f"{request.method} {request.path} {response.status_code}", extra={
+        # Probes arrive every few seconds per worker; keep only a sample of them
+        "sample": request.endpoint in PROBE_ENDPOINTS,
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+    return response
+
+def before_request():
+    request.environ["chat.started"] = start_request_log(request.headers.get("X-Request-ID"))
+    if request.endpoint in ("chat", "chat_stream", "api_chat"):
+        REQUEST_SIZE.observe(request.content_length or 0, endpoint=request.endpoint)
+
+def request_log(response):
+    return log_request(response, request.environ.get("chat.started", time.perf_counter()))
+
+def compress(response):
+    with stage("compress"):
+        return compress_response(response, request.headers.get("Accept-Encoding"))
+
+def static_asset(filename):
+    asset = assets.lookup(filename)
+    if asset is None:
+        return Response("Not Found", status=404, mimetype="text/plain")
+
+    headers = {"Cache-Control": asset["cache_control"], "ETag": f'"{asset["etag"]}"', "Vary": "Accept-Encoding"}
+    if asset["etag"] in request.if_none_match:
+        return Response(status=304, headers=headers)
+
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+    if encoding in asset["variants"]:
+        headers["Content-Encoding"] = encoding
+    body = asset["variants"][encoding if encoding in asset["variants"] else None]
+    return Response(body, mimetype=asset["mimetype"], headers=headers)
+
 def index():
-    if "chat_history" not in session:
-        session["chat_history"] = []
-    return render_template_string(HTML_TEMPLATE, chat_history=session["chat_history"])
+    return render_chat_page(get_session_id())
 
-@app.route("/chat", methods=["POST"])
 def chat():
+    sid = get_session_id()
     user_input = request.form.get("user_input", "").strip()
     if not user_input:
-        return render_template_string(HTML_TEMPLATE, chat_history=session.get("chat_history", []))
+        return render_chat_page(sid)
+    try:
+        admission.check_rate(sid, request.remote_addr)
+    except AdmissionRejected as e:
+        return too_many_requests(render_chat_page(sid, notice=RATE_LIMIT_MESSAGE), e)
 
-    # Initialize chat history if not exists
-    if "chat_history" not in session:
-        session["chat_history"] = []
+    deadline = request_deadline()
+    _, payload, key, cached = start_turn(sid, user_input)
+    if cached is not None:
+        finish_turn(sid, key, *cached)
+    else:
+        try:
+            reply, key = complete(sid, payload, key, deadline)
+            finish_turn(sid, key, reply)
+        except AdmissionRejected as e:
+            shed_turn(sid, e)
+            return too_many_requests(render_chat_page(sid), e)
+        except Cancelled as e:
+            cancel_turn(sid, e)
+            if e.reason == "disconnect":
+                return client_closed()
+        except Exception as e:
+            fail_turn(sid, e)
 
-    # Add timestamp to messages
-    timestamp = datetime.now().strftime("%I:%M %p")
-    session["chat_history"].append(("user", user_input, timestamp))
-
-    # Prepare messages for AI (only use message content, not timestamps)
-    messages = [{"role": "system", "content": "You are a helpful and professional financial assistant. Only answer finance, investment, or economics-related questions. Provide clear, accurate, and helpful information."}]
-    
-    # Add conversation history (without timestamps for AI)
-    for item in session["chat_history"]:
-        if len(item) >= 2:  # Ensure we have at least role and content
-            role, content = item[0], item[1]
-            if role == "user":
-                messages.append({"role": "user", "content": content})
-            elif role == "bot":
-                # Strip HTML tags for AI context
-                import re
-                clean_content = re.sub('<[^<]+?>', '', content)
-                messages.append({"role": "assistant", "content": clean_content})
-
-    payload = {
-        "messages": messages,
-        "temperature": 0.7,
-        "max_tokens": 800
-    }
+    if skip_render(deadline):
+        return client_closed()
+    return render_chat_page(sid)
 
+def chat_stream():
+    sid = get_session_id()
+    user_input = request.form.get("user_input", "").strip()
+    if not user_input:
+        return jsonify({"status": "error", "message": "Empty message"}), 400
     try:
-        response = requests.post(API_URL, headers=HEADERS, json=payload, timeout=30)
-        response.raise_for_status()
-        result = response.json()
-        reply = result["choices"][0]["message"]["content"]
-        logger.info(f"AI Response: {reply[:100]}")
-        
-        # Convert markdown to HTML
-        reply_html = markdown2.markdown(reply)
-        
-        # Add bot response with timestamp
-        bot_timestamp = datetime.now().strftime("%I:%M %p")
-        session["chat_history"].append(("bot", reply_html, bot_timestamp))
-        
-        # Mark session as modified to ensure it's saved
-        session.modified = True
-        
-    except Exception as e:
-        logger.error(f"API error: {e}")
-        error_msg = "❌ Sorry, something went wrong while getting a response. Please try again."
-        error_timestamp = datetime.now().strftime("%I:%M %p")
-        session["chat_history"].append(("bot", error_msg, error_timestamp))
-        session.modified = True
+        admission.check_rate(sid, request.remote_addr)
+    except AdmissionRejected as e:
+        return too_many_requests(jsonify({"status": "error", "message": RATE_LIMIT_MESSAGE}), e)
+
+    deadline = request_deadline()
+    _, payload, key, cached = start_turn(sid, user_input)
+
+    def generate():
+        if cached is not None:
+            bot_turn = finish_turn(sid, key, *cached)
+            yield sse_event("done", {"html": bot_turn[1], "timestamp": bot_turn[2]})
+            return
+
+        parts = []
+        outcome = {}
+        try:
+            with admission.slot(sid, deadline):
+                started = time.perf_counter()
+                stream = stream_reply(payload, deadline, outcome)
+                try:
+                    for delta in stream:
+                        if not parts:
+                            TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started)
+                        parts.append(delta)
+                        yield sse_event("delta", {"content": delta})
+                finally:
+                    # Also runs when the server closes us after a failed write; ends the generation upstream
+                    stream.close()
+                # Streamed responses carry no usage field, so only the latency is recorded
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, mode="stream")
+        except AdmissionRejected as e:
+            bot_turn = shed_turn(sid, e)
+            yield sse_event("error", {"message": bot_turn[1]})
+            return
+        except Cancelled as e:
+            bot_turn = cancel_turn(sid, e)
+            if e.reason == "deadline":
+                yield sse_event("error", {"message": bot_turn[1]})
+            return
+        except GeneratorExit:
+            CANCELLED_WORK.inc(stage="upstream", reason="disconnect")
+            raise
+        except Exception as e:
+            bot_turn = fail_turn(sid, e)
+            yield sse_event("error", {"message": bot_turn[1]})
+            return
+
+        reply = "".join(parts)
+        logger.info(f"AI Response (stream): {reply[:100]}", extra={"sample": True})
+        # The store is server-side, so the finished reply can be saved after the headers went out
+        bot_turn = finish_turn(sid, cacheable_key(outcome, key), reply)
+        yield sse_event("done", {"html": bot_turn[1], "timestamp": bot_turn[2]})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+def api_chat():
+    """Answer one message and return only the new turns, rendered to HTML."""
+    sid = get_session_id()
+    data = request.get_json(silent=True)
+    if data is None:
+        user_input = request.form.get("user_input", "")
+    elif isinstance(data, dict) and isinstance(data.get("message", ""), str):
+        user_input = data.get("message", "")
+    else:
+        return jsonify({"status": "error", "message": "Expected a JSON object with a string message"}), 400
+    user_input = user_input.strip()
+    if not user_input:
+        return jsonify({"status": "error", "message": "Empty message"}), 400
+    try:
+        admission.check_rate(sid, request.remote_addr)
+    except AdmissionRejected as e:
+        return too_many_requests(jsonify({"status": "error", "message": RATE_LIMIT_MESSAGE}), e)
+
+    deadline = request_deadline()
+    user_turn, payload, key, cached = start_turn(sid, user_input)
+    if cached is not None:
+        bot_turn = finish_turn(sid, key, *cached)
+    else:
+        try:
+            reply, key = complete(sid, payload, key, deadline)
+            bot_turn = finish_turn(sid, key, reply)
+        except AdmissionRejected as e:
+            bot_turn = shed_turn(sid, e)
+            body = jsonify({"status": "error", "message": BUSY_MESSAGE, "html": render_turns([user_turn, bot_turn])})
+            return too_many_requests(body, e)
+        except Cancelled as e:
+            bot_turn = cancel_turn(sid, e)
+            if e.reason == "disconnect":
+                return client_closed()
+            body = {"status": "error", "message": TIMEOUT_MESSAGE, "html": render_turns([user_turn, bot_turn])}
+            return jsonify(body), 504
+        except Exception as e:
+            bot_turn = fail_turn(sid, e)
 
-    return render_template_string(HTML_TEMPLATE, chat_history=session["chat_history"])
+    if skip_render(deadline):
+        return client_closed()
+    return jsonify({"status": "success", "html": render_turns([user_turn, bot_turn])})
+
+def api_history():
+    """Return a page of turns older than the ``before`` cursor, rendered to HTML."""
+    try:
+        before = request.args.get("before")
+        before = int(before) if before is not None else None
+        limit = min(int(request.args.get("limit", HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid cursor"}), 400
+    turns, cursor = conversation_store.page(get_session_id(), before=before, limit=max(1, limit))
+    return jsonify({"status": "success", "html": render_turns(turns), "cursor": cursor})
+
+def api_search():
+    """Search the session's past turns; hits carry highlighted snippets and a history cursor."""
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"status": "error", "message": "Empty query"}), 400
+    try:
+        limit = min(int(request.args.get("limit", 10)), SEARCH_MAX_RESULTS)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid limit"}), 400
+    with HISTORY_SEARCH.time():
+        results = conversation_store.search(get_session_id(), query, limit=max(1, limit))
+    return jsonify({"status": "success", "results": results})
+
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.content_type)
 
-@app.route("/clear", methods=["POST"])
 def clear_chat():
-    session["chat_history"] = []
-    session.modified = True
+    conversation_store.clear(get_session_id())
     return jsonify({"status": "success"})
 
+def healthz():
+    """Liveness: the worker is up and answering."""
+    return jsonify({"status": "ok"})
+
+def readyz():
+    """Readiness: warmed up and not draining, so safe to route new requests here."""
+    if draining.is_set():
+        return jsonify({"status": "draining"}), 503
+    if not ready.is_set():
+        return jsonify({"status": "starting"}), 503
+    # Upstream health is reported but not gated on: an outage would take every worker out at once
+    backends = {backend.name: backend.healthy for backend in upstream_client.backends}
+    return jsonify({"status": "ready", "backends": backends})
+
+PROBE_ENDPOINTS = ("healthz", "readyz")
+
+class TimedSessionInterface(SecureCookieSessionInterface):
+    """The signed-cookie session, with loading and saving timed for request profiles."""
+
+    def open_session(self, app, request):
+        with stage("session"):
+            return super().open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with stage("session"):
+            return super().save_session(app, session, response)
+
+def trusted_proxy(wsgi_app):
+    """Take the client address, scheme and host from the X-Forwarded-* headers of trusted proxies."""
+    hops = PROXY_TRUSTED_HOPS
+    return ProxyFix(wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+def create_app():
+    """Application factory: reads the environment, builds the services and the Flask app.
+
+    Serve it with ``gunicorn -c gunicorn.conf.py wsgi:application`` in
+    production; ``python app.py`` runs the single-process development server.
+    """
+    global CHAT_TEMPLATE, TURNS_TEMPLATE, PROXY_TRUSTED_HOPS
+
+    # Load environment variables
+    load_dotenv()
+
+    # Configure logging: JSON lines written by a background thread, with rotation
+    configure_logging(
+        path=os.getenv("LOG_FILE", "app.log"),
+        level=os.getenv("LOG_LEVEL", "INFO"),
+        fmt=os.getenv("LOG_FORMAT", "json"),
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backup_count=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+        rotate_when=os.getenv("LOG_ROTATE_WHEN", ""),
+        sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "0.1")),
+        queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    )
+    init_services()
+
+    app = Flask(__name__, static_folder=None)
+    app.secret_key = os.getenv("FLASK_SECRET_KEY", "your_default_secret_key")
+    app.jinja_env.globals["asset_url"] = assets.url
+    app.jinja_env.globals["render_turns"] = render_turns
+
+    # Compile once here instead of on every render_template_string call
+    CHAT_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
+    TURNS_TEMPLATE = app.jinja_env.from_string(TURNS_HTML_TEMPLATE)
+
+    app.before_request(before_request)
+    # after_request hooks run in reverse order: request_log runs after compress, so its duration includes it
+    app.after_request(request_log)
+    app.after_request(compress)
+
+    app.add_url_rule("/static/<filename>", view_func=static_asset, methods=["GET"])
+    app.add_url_rule("/", view_func=index, methods=["GET"])
+    app.add_url_rule("/chat", view_func=chat, methods=["POST"])
+    app.add_url_rule("/chat/stream", view_func=chat_stream, methods=["POST"])
+    app.add_url_rule("/api/chat", view_func=api_chat, methods=["POST"])
+    app.add_url_rule("/api/history", view_func=api_history, methods=["GET"])
+    app.add_url_rule("/api/search", view_func=api_search, methods=["GET"])
+    app.add_url_rule("/metrics", view_func=metrics_endpoint, methods=["GET"])
+    app.add_url_rule("/clear", view_func=clear_chat, methods=["POST"])
+    app.add_url_rule("/healthz", view_func=healthz, methods=["GET"])
+    app.add_url_rule("/readyz", view_func=readyz, methods=["GET"])
+
+    # Behind a load balancer remote_addr is the balancer's; the per-IP limits need the client's
+    PROXY_TRUSTED_HOPS = int(os.getenv("PROXY_TRUSTED_HOPS", "0"))
+    if PROXY_TRUSTED_HOPS:
+        app.wsgi_app = trusted_proxy(app.wsgi_app)
+
+    # Opt-in profiling: X-Profile: <PROFILE_TOKEN> on a request, or a sampled share of all traffic
+    profile_token = os.getenv("PROFILE_TOKEN") or None
+    profile_sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    if profile_token or profile_sample_rate > 0:
+        app.session_interface = TimedSessionInterface()
+        app.wsgi_app = ProfilingMiddleware(
+            app.wsgi_app,
+            token=profile_token,
+            sample_rate=profile_sample_rate,
+            output_dir=os.getenv("PROFILE_DIR", "profiles"),
+            stack_interval=float(os.getenv("PROFILE_STACK_INTERVAL", "0.005")),
+        )
+    return app
+
 if __name__ == "__main__":
-    logger.info("Starting Flask app on http://127.0.0.1:5000")
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Development server only; production runs wsgi.py under gunicorn.conf.py
+    app = create_app()
+    warm_up()
+    port = int(os.getenv("PORT", "5000"))
+    logger.info(f"Starting Flask development server on http://127.0.0.1:{port}")
+    app.run(host="0.0.0.0", port=port, debug=os.getenv("FLASK_DEBUG") == "1")
+
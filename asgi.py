@@ -0,0 +1,231 @@
+"""ASGI entry point with a non-blocking /chat path.
+
+POST /chat awaits the upstream completion on the event loop instead of
+holding a worker thread, so a handful of workers can keep thousands of
+completions in flight. It goes through the same admission as the threaded
+views, and its place in the queue does not hold a thread either, so
+ADMISSION_MAX_CONCURRENCY may be set well above WEB_THREADS here. The
+completion is cancelled, closing its upstream connection, as soon as the
+client disconnects or the request deadline passes. Every other route is
+served by the regular Flask app through asgiref's WSGI adapter.
+
+Run with, for example::
+
+    uvicorn asgi:application --workers 2
+"""
+import asyncio
+import io
+import os
+import sys
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import request
+
+import app as chatbot
+from admission import AdmissionRejected
+from coalescing import AsyncSingleFlight
+from deadline import Cancelled, Deadline
+from upstream import AsyncUpstreamClient
+from upstream_router import AsyncUpstreamRouter
+
+flask_app = chatbot.create_app()
+wsgi_application = WsgiToAsgi(flask_app)
+
+ASYNC_UPSTREAM_CONCURRENCY = int(os.getenv("ASYNC_UPSTREAM_CONCURRENCY", "1000"))
+
+_client = None
+coalescer = AsyncSingleFlight()
+chatbot.metrics.collect(lambda: chatbot.export_coalescing("async", coalescer.stats()))
+
+
+def get_client():
+    # Created lazily so the httpx pools bind to the running loop
+    global _client
+    if _client is None:
+        router = chatbot.upstream_client
+        clients = {}
+        for spec, backend in zip(chatbot.BACKENDS, router.backends):
+            clients[backend.name] = AsyncUpstreamClient(
+                spec["api_url"],
+                spec["headers"],
+                max_connections=ASYNC_UPSTREAM_CONCURRENCY,
+                # Share the breaker so both serving paths agree on deployment health
+                breaker=backend.client.breaker,
+                **chatbot.upstream_options(backend.name),
+            )
+        _client = AsyncUpstreamRouter(router, clients)
+    return _client
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope into a WSGI environ for Flask's request context."""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name == "CONTENT_LENGTH":
+            environ["CONTENT_LENGTH"] = value
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def forwarded(environ):
+    """Apply the Flask app's X-Forwarded-* handling, which the /chat path would otherwise skip."""
+    if not chatbot.PROXY_TRUSTED_HOPS:
+        return environ
+    # ProxyFix rewrites the environ in place and hands it to the wrapped app
+    return chatbot.trusted_proxy(lambda fixed, start_response: fixed)(environ, None)
+
+
+async def timed_completion(client, payload, deadline):
+    started = time.perf_counter()
+    result = await client.chat_completion(payload, deadline=deadline)
+    chatbot.record_completion(result, time.perf_counter() - started)
+    return result
+
+
+async def limited_completion(client, sid, payload, deadline):
+    # One slot covers every round of a tool conversation, as in admitted_completion
+    async with chatbot.admission.aslot(sid, deadline):
+        if chatbot.tool_runner is None:
+            return await timed_completion(client, payload, deadline)
+        return await chatbot.tool_runner.aconverse(lambda p: timed_completion(client, p, deadline), payload, deadline)
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def wait_for_disconnect(receive):
+    # The body has been read, so the next message only arrives when the client goes away
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def until_cancelled(awaitable, deadline, disconnected):
+    """Await ``awaitable`` unless the deadline passes or the client leaves first; then cancel it."""
+    task = asyncio.ensure_future(awaitable)
+    await asyncio.wait([task, disconnected], timeout=deadline.remaining(), return_when=asyncio.FIRST_COMPLETED)
+    if task.done():
+        return task.result()
+    # The single-flight call is only cancelled once no other request is waiting on it
+    task.cancel()
+    raise Cancelled(deadline.cancelled() or "deadline", "upstream")
+
+
+async def send_response(send, response):
+    body = response.get_data()
+    headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in response.headers.items()]
+    await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def chat(scope, receive, send):
+    body = await read_body(receive)
+    client = get_client()
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    deadline = Deadline(chatbot.REQUEST_DEADLINE, disconnected.done)
+    try:
+        with flask_app.request_context(forwarded(build_environ(scope, body))):
+            response = await chat_turn(client, deadline, disconnected)
+        await send_response(send, response)
+    finally:
+        disconnected.cancel()
+
+
+async def chat_turn(client, deadline, disconnected):
+    # Run the before_request hooks (request id, metrics) as a full dispatch would
+    response = flask_app.preprocess_request()
+    sid = chatbot.get_session_id()
+    user_input = request.form.get("user_input", "").strip() if response is None else ""
+    if user_input:
+        try:
+            chatbot.admission.check_rate(sid, request.remote_addr)
+        except AdmissionRejected as e:
+            notice_page = chatbot.render_chat_page(sid, notice=chatbot.RATE_LIMIT_MESSAGE)
+            response = chatbot.too_many_requests(notice_page, e)
+    if user_input and response is None:
+        _, payload, key, cached = chatbot.start_turn(sid, user_input)
+        if cached is not None:
+            chatbot.finish_turn(sid, key, *cached)
+        else:
+            try:
+                completion = coalescer.do(key, lambda: limited_completion(client, sid, payload, deadline),
+                                          timeout=chatbot.COALESCE_WAIT_TIMEOUT)
+                result = await until_cancelled(completion, deadline, disconnected)
+                reply = result["choices"][0]["message"]["content"]
+                chatbot.logger.info(f"AI Response: {reply[:100]}", extra={"sample": True})
+                # Render on the pool; finish_turn then hits the renderer's memo
+                await asyncio.wrap_future(chatbot.markdown_renderer.submit(reply))
+                chatbot.finish_turn(sid, chatbot.cacheable_key(result, key), reply)
+            except AdmissionRejected as e:
+                chatbot.shed_turn(sid, e)
+                response = chatbot.too_many_requests(chatbot.render_chat_page(sid), e)
+            except Cancelled as e:
+                chatbot.cancel_turn(sid, e)
+                if e.reason == "disconnect":
+                    response = chatbot.client_closed()
+            except Exception as e:
+                chatbot.fail_turn(sid, e)
+    if response is None and chatbot.skip_render(deadline):
+        response = chatbot.client_closed()
+
+    response = flask_app.make_response(response if response is not None else chatbot.render_chat_page(sid))
+
+    # process_response runs the after_request hooks and saves the session cookie
+    return flask_app.process_response(response)
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            get_client()
+            # Blocking I/O, but nothing is being served until startup completes
+            await asyncio.to_thread(chatbot.warm_up)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            chatbot.begin_drain()
+            if _client is not None:
+                await _client.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(scope, receive, send)
+    elif scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == "/chat":
+        await chat(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
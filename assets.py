@@ -0,0 +1,89 @@
+"""Content-hashed static assets and response compression."""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# Hashed URLs never change content, so browsers may keep them for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+COMPRESSIBLE_TYPES = {"text/html", "text/css", "application/javascript", "text/javascript", "application/json"}
+MIN_COMPRESS_BYTES = 512
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick the best content coding the client accepts, or None."""
+    accepted = {part.split(";")[0].strip() for part in (accept_encoding or "").lower().split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class StaticAssets:
+    """Loads a folder once at startup and serves it under content-hashed names.
+
+    Each file is kept in memory together with its precompressed variants,
+    so serving an asset is a dictionary lookup.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._urls = {}
+        self._files = {}
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if not os.path.isfile(path):
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            stem, ext = os.path.splitext(name)
+            hashed = f"{stem}.{digest}{ext}"
+            mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+            variants = {None: data}
+            if mimetype in COMPRESSIBLE_TYPES:
+                variants["gzip"] = _compress(data, "gzip")
+                if brotli is not None:
+                    variants["br"] = _compress(data, "br")
+
+            entry = {"mimetype": mimetype, "etag": digest, "variants": variants}
+            self._urls[name] = hashed
+            self._files[hashed] = dict(entry, cache_control=IMMUTABLE_CACHE_CONTROL)
+            # The plain name still works, but has to be revalidated
+            self._files[name] = dict(entry, cache_control=REVALIDATE_CACHE_CONTROL)
+
+    def url(self, name):
+        return f"/static/{self._urls[name]}"
+
+    def lookup(self, filename):
+        return self._files.get(filename)
+
+
+def compress_response(response, accept_encoding):
+    """Compress a finished, non-streamed Flask response in place when worthwhile."""
+    if (response.is_streamed or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding(accept_encoding)
+    data = response.get_data()
+    if encoding is None or len(data) < MIN_COMPRESS_BYTES:
+        return response
+    response.set_data(_compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,159 @@
+"""Answer a JSONL file of questions through the same prompt pipeline as /chat.
+
+Each input line is ``{"id": ..., "question": ...}`` (``id`` defaults to the
+line number); other lines are skipped with a warning. Questions go to the
+deployments in AZURE_OPENAI_BACKENDS through the app's router. Results are
+appended to the output file one JSON object per line as they finish, so an
+interrupted run picks up where it stopped:
+
+    python batch.py questions.jsonl -o answers.jsonl --concurrency 16
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+import app as chatbot
+from conversation_store import MemoryConversationStore
+from prompts import build_context_builder, chat_payload
+from upstream import UpstreamError
+
+logger = logging.getLogger("batch")
+
+
+def read_questions(path, malformed=None):
+    """``(id, question)`` per input line; numbers of unusable lines are appended to ``malformed``."""
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                item = None
+            question = item.get("question") if isinstance(item, dict) else None
+            if not isinstance(question, str) or not question.strip():
+                logger.warning(f"Line {number}: expected an object with a \"question\" string; skipped")
+                if malformed is not None:
+                    malformed.append(number)
+                continue
+            yield str(item.get("id", number)), question
+
+
+def finished_ids(path):
+    """Ids already answered in a previous run of the same output file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by the interruption; it will be redone
+                continue
+            if item.get("error") is None:
+                done.add(str(item["id"]))
+    return done
+
+
+def ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class BatchRunner:
+    def __init__(self, client, retries=2):
+        self.client = client
+        self.retries = retries
+        # A scratch store: every question is its own single-turn conversation, built as chat() builds it
+        self.context_builder = build_context_builder(MemoryConversationStore())
+
+    def answer(self, question_id, question):
+        turn = ("user", question, datetime.now().strftime("%I:%M %p"))
+        payload = chat_payload(self.context_builder.build(question_id, [turn]))
+        started = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                result = self.client.chat_completion(payload)
+                return {
+                    "id": question_id,
+                    "question": question,
+                    "answer": result["choices"][0]["message"]["content"],
+                    "usage": result.get("usage", {}),
+                    "latency": round(time.perf_counter() - started, 3),
+                    "error": None,
+                }
+            except (UpstreamError, KeyError, ValueError) as e:
+                error = e
+                status = getattr(e, "status_code", None)
+                if status is not None and status < 500 and status != 429:
+                    # Bad request, auth or content filter: another attempt won't help
+                    break
+                logger.warning(f"{question_id}: attempt {attempt + 1} failed: {e}")
+        return {
+            "id": question_id,
+            "question": question,
+            "answer": None,
+            "usage": {},
+            "latency": round(time.perf_counter() - started, 3),
+            "error": str(error),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of finance questions.")
+    parser.add_argument("input", help="JSONL file with one {\"id\", \"question\"} object per line")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file to append results to")
+    parser.add_argument("--concurrency", type=int, default=8, help="questions in flight at once")
+    parser.add_argument("--retries", type=int, default=2, help="extra attempts per question after the client's own retries")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    # The same deployments, weights and failover as the app
+    client = chatbot.build_router(chatbot.backend_specs(), pool_size=args.concurrency)
+    runner = BatchRunner(client, retries=args.retries)
+
+    done = finished_ids(args.output)
+    malformed = []
+    pending = [(qid, q) for qid, q in read_questions(args.input, malformed) if qid not in done]
+    logger.info(f"{len(done)} already answered, {len(pending)} to go, {len(malformed)} malformed lines skipped")
+
+    answered = failed = completion_tokens = total_tokens = 0
+    started = time.perf_counter()
+    with open(args.output, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        if out.tell() and not ends_with_newline(args.output):
+            # Keep the next record off the line an interrupted run left unfinished
+            out.write("\n")
+        futures = [pool.submit(runner.answer, qid, q) for qid, q in pending]
+        for future in as_completed(futures):
+            result = future.result()
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            if result["error"] is None:
+                answered += 1
+                completion_tokens += result["usage"].get("completion_tokens", 0)
+                total_tokens += result["usage"].get("total_tokens", 0)
+            else:
+                failed += 1
+
+    client.close()
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"answered {answered}, failed {failed}, skipped {len(malformed)} malformed in {elapsed:.1f}s")
+    print(f"throughput: {answered / elapsed:.2f} questions/s, "
+          f"{completion_tokens / elapsed:.1f} completion tokens/s, {total_tokens / elapsed:.1f} total tokens/s")
+    return 0 if failed == 0 and not malformed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
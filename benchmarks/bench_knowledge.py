@@ -0,0 +1,98 @@
+"""Build time and query latency of the knowledge index at scale.
+
+Generates synthetic finance chunks (a Zipf-distributed draw from a finance
+vocabulary, so some terms have very long posting lists, plus rare product
+codes), builds an index in a temporary directory and times queries on it:
+
+    python benchmarks/bench_knowledge.py --chunks 100000 --queries 500
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge import KnowledgeIndex, build_index, make_embedder  # noqa: E402
+from topic_filter import FINANCE_PHRASES  # noqa: E402
+
+FILLER = ("account balance monthly annual rate plan fee customer transfer limit statement period card online "
+          "branch support policy minimum maximum deposit withdrawal schedule option standard premium").split()
+
+QUESTIONS = [
+    "What is the annual fee on the premium card?",
+    "How do I set up a monthly transfer to my savings account?",
+    "What is the withdrawal limit for the retirement account?",
+    "Explain dollar cost averaging into index funds",
+    "How is mortgage interest calculated?",
+    "Are dividends taxed as income?",
+    "What does the expense ratio of an ETF mean?",
+    "minimum deposit for a certificate of deposit",
+]
+
+
+def synthetic_chunks(count, words_per_chunk, seed=7):
+    rng = random.Random(seed)
+    vocabulary = [p.strip() for p in FINANCE_PHRASES.split(",") if p.strip()] + FILLER
+    # Zipf-like weights: a few very common terms, a long tail of rare ones
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    rng.shuffle(weights)
+    chunks = []
+    for i in range(count):
+        words = rng.choices(vocabulary, weights, k=words_per_chunk)
+        # Product codes give the index a realistic long tail of rare terms
+        words += [f"code{rng.randrange(count // 2)}" for _ in range(4)]
+        chunks.append({"source": f"doc{i // 20}.md", "heading": f"Section {i % 20}", "text": " ".join(words)})
+    return chunks
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the knowledge index.")
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=120, help="words per synthetic chunk")
+    parser.add_argument("--dim", type=int, default=256, help="hashing embedder dimensions")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=4)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    chunks = synthetic_chunks(args.chunks, args.words)
+    print(f"generated {len(chunks)} chunks in {time.perf_counter() - started:.1f}s")
+
+    out_dir = tempfile.mkdtemp(prefix="knowledge-bench-")
+    try:
+        started = time.perf_counter()
+        meta = build_index(chunks, out_dir, make_embedder("hashing", args.dim))
+        build_seconds = time.perf_counter() - started
+        size = sum(os.path.getsize(os.path.join(out_dir, name)) for name in os.listdir(out_dir))
+        print(f"build: {build_seconds:.1f}s, {meta['terms']} terms, {size / 1e6:.0f} MB on disk")
+
+        started = time.perf_counter()
+        index = KnowledgeIndex(out_dir)
+        print(f"load: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        # The first pass pages the index in; the timed passes measure the warm path
+        for question in QUESTIONS:
+            index.search(question, k=args.k)
+        latencies = []
+        for i in range(args.queries):
+            question = QUESTIONS[i % len(QUESTIONS)]
+            started = time.perf_counter()
+            index.search(question, k=args.k)
+            latencies.append((time.perf_counter() - started) * 1000)
+        print(f"query ms: p50 {percentile(latencies, 50):.2f}  p95 {percentile(latencies, 95):.2f}  "
+              f"p99 {percentile(latencies, 99):.2f}  max {max(latencies):.2f}")
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
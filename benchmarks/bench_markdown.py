@@ -0,0 +1,95 @@
+"""Micro-benchmark of the markdown rendering stage.
+
+Compares the available renderer backends on a long, table-heavy finance
+answer, with and without sanitizing, against a memoized hit:
+
+    python benchmarks/bench_markdown.py --repeat 200
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markdown_render import MarkdownRenderer, markdown2_backend, sanitize_html  # noqa: E402
+
+SAMPLE_REPLY = """## Comparing retirement accounts
+
+Here is how a **Roth IRA** compares with a *traditional IRA*:
+
+| Feature | Roth IRA | Traditional IRA |
+|:--|:--|:--|
+| Contributions | After-tax | Pre-tax (often deductible) |
+| Withdrawals in retirement | Tax-free | Taxed as income |
+| Required minimum distributions | None for the owner | From age 73 |
+| Income limits | Yes | No (deduction may phase out) |
+
+### Things to consider
+
+1. Your current tax bracket versus the bracket you expect in retirement.
+2. Whether you want flexibility to withdraw contributions early.
+3. Estate planning goals.
+
+- Diversify across account types for *tax flexibility*.
+- Rebalance at least once a year.
+- Keep an emergency fund of 3-6 months of expenses.
+
+> Past performance does not guarantee future results.
+
+```
+future_value = principal * (1 + rate) ** years
+```
+"""
+
+
+def available_backends():
+    backends = {"markdown2": markdown2_backend}
+    try:
+        import markdown
+
+        backends["python-markdown"] = lambda text: markdown.markdown(text, extensions=["tables", "fenced_code"])
+    except ImportError:
+        pass
+    try:
+        import mistune
+
+        render = mistune.create_markdown(plugins=["table", "strikethrough"])
+        backends["mistune"] = render
+    except ImportError:
+        pass
+    return backends
+
+
+def per_call_us(func, repeat):
+    return timeit.timeit(func, number=repeat) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--scale", type=int, default=4, help="copies of the sample reply per document")
+    args = parser.parse_args()
+
+    text = "\n\n".join([SAMPLE_REPLY] * args.scale)
+    print(f"document: {len(text)} chars, {args.repeat} renders per row")
+    print(f"{'backend':<28}{'us/render':>12}")
+
+    baseline = None
+    for name, backend in available_backends().items():
+        raw = per_call_us(lambda: backend(text), args.repeat)
+        html = backend(text)
+        sanitized = raw + per_call_us(lambda: sanitize_html(html), args.repeat)
+        baseline = baseline or sanitized
+        print(f"{name:<28}{raw:>12.1f}")
+        print(f"{name + ' + sanitize':<28}{sanitized:>12.1f}")
+
+    renderer = MarkdownRenderer()
+    renderer.render(text)
+    memoized = per_call_us(lambda: renderer.render(text), args.repeat)
+    print(f"{'memoized hit':<28}{memoized:>12.1f}")
+    print(f"speedup of a memoized hit over markdown2 + sanitize: {baseline / memoized:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Search latency over long conversations, for both conversation stores.
+
+Fills a store with one conversation of ``--turns`` turns plus ``--others``
+conversations of the same length (so the SQLite index is shared, as in
+production), then times /api/search style queries against the first:
+
+    python benchmarks/bench_search.py --turns 50000 --others 2 --queries 300
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation_store import MemoryConversationStore, SQLiteConversationStore  # noqa: E402
+from topic_filter import FINANCE_PHRASES  # noqa: E402
+
+FILLER = ("the a your this that with for of and to in on rate plan fee account balance monthly annual "
+          "more less higher lower risk return market").split()
+QUERIES = [
+    "what did it say about bond ladders?",
+    "roth ira contribution limit",
+    "mortgage refinanc",
+    "emergency fund",
+    "expense ratio index funds",
+    "capital gains tax",
+]
+
+
+def synthetic_turns(count, seed):
+    rng = random.Random(seed)
+    vocabulary = [p.strip() for p in FINANCE_PHRASES.split(",") if p.strip()] + ["bond ladders", "ladder"]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    rng.shuffle(weights)
+    for i in range(count):
+        words = rng.choices(vocabulary, weights, k=6) + rng.choices(FILLER, k=30)
+        rng.shuffle(words)
+        text = " ".join(words).capitalize() + "."
+        if i % 2:
+            yield ("bot", f"<p>{text}</p>", "10:00 AM", f"**Answer:** {text}")
+        else:
+            yield ("user", text[:120], "10:00 AM", None)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def bench(name, store, args):
+    started = time.perf_counter()
+    for number in range(args.others + 1):
+        sid = f"session{number}"
+        for turn in synthetic_turns(args.turns, seed=number):
+            store.append(sid, turn)
+    total = args.turns * (args.others + 1)
+    print(f"{name}: appended {total} turns in {time.perf_counter() - started:.1f}s")
+
+    # The memory store builds its index on the first search
+    started = time.perf_counter()
+    hits = store.search("session0", QUERIES[0])
+    print(f"{name}: first search {(time.perf_counter() - started) * 1000:.0f} ms, top hit: {hits[0]['snippet']}")
+
+    latencies = []
+    for i in range(args.queries):
+        started = time.perf_counter()
+        store.search("session0", QUERIES[i % len(QUERIES)], limit=10)
+        latencies.append((time.perf_counter() - started) * 1000)
+    print(f"{name}: query ms p50 {percentile(latencies, 50):.2f}  p95 {percentile(latencies, 95):.2f}  "
+          f"p99 {percentile(latencies, 99):.2f}")
+
+    started = time.perf_counter()
+    store.append("session0", ("user", "One more question about bond ladders", "10:01 AM"))
+    store.search("session0", "bond ladders")
+    print(f"{name}: append + search {(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark conversation history search.")
+    parser.add_argument("--turns", type=int, default=50000, help="turns per conversation")
+    parser.add_argument("--others", type=int, default=2, help="other conversations in the store")
+    parser.add_argument("--queries", type=int, default=300)
+    args = parser.parse_args()
+
+    bench("memory", MemoryConversationStore(max_bytes=2 ** 40), args)
+    with tempfile.TemporaryDirectory() as folder:
+        bench("sqlite", SQLiteConversationStore(os.path.join(folder, "bench.db")), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""End-to-end latency of multi-symbol questions through the tool-calling loop.
+
+Runs each question through ToolRunner.converse against the stub upstream,
+which asks for one ``get_quotes`` call per symbol in the question. Quotes
+come from benchmarks/market_data.json behind a simulated per-request
+provider latency. Compares serial execution with the parallel pool plus
+batched lookups, on a cold and on a warm quote cache:
+
+    python benchmarks/bench_tools.py --latency 0.3 --provider-latency 0.15 --repeat 10
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stub_server  # noqa: E402
+from market_data import CachedMarketData, LocalMarketData  # noqa: E402
+from tools import ToolRunner, market_data_tools  # noqa: E402
+from upstream import UpstreamClient  # noqa: E402
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "market_data.json")
+QUESTIONS = {
+    1: "What is AAPL trading at?",
+    3: "Compare AAPL, MSFT and NVDA today",
+    5: "Quote SPY, VTI, BND, US10Y and FEDFUNDS",
+    8: "Where are AAPL MSFT NVDA AMZN GOOGL EURUSD US2Y MORTGAGE30 now?",
+}
+
+
+class SlowProvider(LocalMarketData):
+    """The local file behind the round-trip time of a remote quote API."""
+
+    def __init__(self, path, latency):
+        super().__init__(path)
+        self.latency = latency
+        self.requests = 0
+
+    def quotes(self, symbols):
+        self.requests += 1
+        time.sleep(self.latency)
+        return super().quotes(symbols)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def measure(client, runner_options, cache_options, args, warm):
+    provider = SlowProvider(DATA, args.provider_latency)
+    market_data = CachedMarketData(provider, **cache_options)
+    runner = ToolRunner(market_data_tools(market_data), **runner_options)
+    results = {}
+    for count, question in QUESTIONS.items():
+        payload = {"messages": [{"role": "user", "content": question}]}
+        latencies = []
+        requests_before = provider.requests
+        for _ in range(args.repeat):
+            if not warm:
+                market_data._entries.clear()
+            started = time.perf_counter()
+            runner.converse(client.chat_completion, payload)
+            latencies.append(time.perf_counter() - started)
+        results[count] = (latencies, (provider.requests - requests_before) / args.repeat)
+    runner.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tool-calling loop.")
+    parser.add_argument("--latency", type=float, default=0.3, help="stub upstream seconds per completion")
+    parser.add_argument("--provider-latency", type=float, default=0.15, help="seconds per market data request")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    server = stub_server.start(stub_server.StubConfig(latency=args.latency, jitter=0))
+    client = UpstreamClient(f"http://127.0.0.1:{server.server_port}/chat", {"Content-Type": "application/json"},
+                            pool_size=4)
+    variants = [
+        ("serial", {"max_workers": 1}, {"batch_window": 0}),
+        ("parallel+batched", {"max_workers": 8}, {"batch_window": 0.005}),
+    ]
+    print(f"upstream {args.latency * 1000:.0f} ms/round, provider {args.provider_latency * 1000:.0f} ms/request")
+    print(f"{'variant':<18} {'cache':<5} {'symbols':>7} {'p50 ms':>8} {'p95 ms':>8} {'fetches':>8}")
+    for name, runner_options, cache_options in variants:
+        for warm in (False, True):
+            results = measure(client, runner_options, cache_options, args, warm)
+            for count, (latencies, fetches) in results.items():
+                print(f"{name:<18} {'warm' if warm else 'cold':<5} {count:>7} "
+                      f"{percentile(latencies, 50) * 1000:>8.0f} {percentile(latencies, 95) * 1000:>8.0f} "
+                      f"{fetches:>8.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Offline evaluation of the off-topic pre-filter.
+
+Scores a labelled JSONL file of ``{"text", "on_topic"}`` samples and reports
+precision and recall of the reject decision (off-topic is the positive
+class) and per-question latency:
+
+    python benchmarks/eval_topic_filter.py --threshold 0.2
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from topic_filter import TopicFilter  # noqa: E402
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "topic_samples.jsonl")
+
+
+def load_samples(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the off-topic pre-filter.")
+    parser.add_argument("--samples", default=SAMPLES, help="labelled JSONL file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="reject below this on-topic probability")
+    parser.add_argument("--repeat", type=int, default=200, help="timed passes over the samples")
+    parser.add_argument("-v", "--verbose", action="store_true", help="list every misclassified sample")
+    args = parser.parse_args()
+
+    topic_filter = TopicFilter(threshold=args.threshold)
+    samples = load_samples(args.samples)
+
+    true_pos = false_pos = false_neg = true_neg = 0
+    for sample in samples:
+        rejected = topic_filter.is_off_topic(sample["text"])
+        off_topic = not sample["on_topic"]
+        if rejected and off_topic:
+            true_pos += 1
+        elif rejected:
+            false_pos += 1
+            if args.verbose:
+                print(f"wrongly rejected ({topic_filter.score(sample['text']):.2f}): {sample['text']}")
+        elif off_topic:
+            false_neg += 1
+            if args.verbose:
+                print(f"passed through ({topic_filter.score(sample['text']):.2f}): {sample['text']}")
+        else:
+            true_neg += 1
+
+    latencies = []
+    for _ in range(args.repeat):
+        for sample in samples:
+            started = time.perf_counter_ns()
+            topic_filter.is_off_topic(sample["text"])
+            latencies.append((time.perf_counter_ns() - started) / 1000)
+
+    precision = true_pos / max(1, true_pos + false_pos)
+    recall = true_pos / max(1, true_pos + false_neg)
+    print(f"{len(samples)} samples, threshold {args.threshold}")
+    print(f"rejected: {true_pos} off-topic, {false_pos} on-topic (false rejects)")
+    print(f"passed:   {true_neg} on-topic, {false_neg} off-topic (left to the model)")
+    print(f"precision {precision:.3f}  recall {recall:.3f}")
+    print(f"latency us: p50 {percentile(latencies, 50):.1f}  p99 {percentile(latencies, 99):.1f}  "
+          f"max {max(latencies):.1f}")
+
+
+if __name__ == "__main__":
+    main()
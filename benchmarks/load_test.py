@@ -0,0 +1,169 @@
+"""Offline load test of the chat app against the stub upstream.
+
+Starts benchmarks/stub_server.py and the Flask app in-process on local
+ports, then runs ``--users`` concurrent virtual users per conversation
+length. Each user loads ``/``, sends ``turns`` messages to ``/chat`` and
+finishes with ``/clear``:
+
+    python benchmarks/load_test.py --users 32 --turns 1,5,20 --latency 0.3 --rate-429 0.01
+
+Reports p50/p95/p99 latency, throughput and response bytes per endpoint,
+and the cookie and server-side store size of a conversation at its longest.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+import stub_server  # noqa: E402
+
+QUESTIONS = [
+    "What is an ETF?",
+    "How does compound interest work?",
+    "Should I pay off debt or invest?",
+    "What is dollar-cost averaging?",
+    "How much should I keep in an emergency fund?",
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.session_sizes = []
+
+    def add(self, endpoint, latency, size, status):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((latency, size))
+            if status >= 400:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+def start_app(upstream_port, args):
+    # create_app() reads its configuration from the environment, so point it at the stub first
+    os.environ.update({
+        "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{upstream_port}",
+        "AZURE_OPENAI_DEPLOYMENT": "stub",
+        "AZURE_OPENAI_API_VERSION": "2024-02-15-preview",
+        "AZURE_OPENAI_API_KEY": "stub",
+        "UPSTREAM_POOL_SIZE": str(args.users),
+        "UPSTREAM_BREAKER_THRESHOLD": "1000000",
+        "ADMISSION_MAX_CONCURRENCY": str(args.users),
+        # Every virtual user comes from 127.0.0.1; keep the rate limits out of the measurement
+        "SESSION_RATE_PER_MIN": "1000000",
+        "SESSION_BURST": "1000000",
+        "IP_RATE_PER_MIN": "1000000",
+        "IP_BURST": "1000000",
+    })
+    import logging
+
+    import app as chat_app
+
+    flask_app = chat_app.create_app()
+    for name in ("", "werkzeug"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return chat_app, flask_app, server
+
+
+def session_size(chat_app, flask_app, client):
+    """Bytes of the session cookie and of the conversation it points to in the store."""
+    cookie = client.cookies.get(flask_app.config["SESSION_COOKIE_NAME"]) or ""
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    sid = serializer.loads(cookie).get("sid") if cookie else None
+    turns = chat_app.conversation_store.turns(sid) if sid else []
+    stored = sum(len(part.encode("utf-8")) for turn in turns for part in turn if part)
+    return len(cookie), stored
+
+
+def run_user(base_url, turns, recorder, chat_app, flask_app):
+    client = requests.Session()
+    client.headers["Accept-Encoding"] = "gzip"
+
+    def timed(endpoint, method, path, **kwargs):
+        started = time.perf_counter()
+        response = client.request(method, base_url + path, **kwargs)
+        # Bytes on the wire, i.e. after any Content-Encoding
+        size = int(response.headers.get("Content-Length", len(response.content)))
+        recorder.add(endpoint, time.perf_counter() - started, size, response.status_code)
+
+    timed("GET /", "GET", "/")
+    for turn in range(turns):
+        # A unique suffix keeps the response cache and coalescing out of the way
+        question = f"{QUESTIONS[turn % len(QUESTIONS)]} ({uuid.uuid4().hex[:8]})"
+        timed("POST /chat", "POST", "/chat", data={"user_input": question})
+    with recorder.lock:
+        recorder.session_sizes.append(session_size(chat_app, flask_app, client))
+    timed("POST /clear", "POST", "/clear")
+
+
+def report(turns, recorder, elapsed):
+    print(f"\n== {turns} turns per conversation ({elapsed:.1f}s) ==")
+    print(f"{'endpoint':<14}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'req/s':>8}{'wire bytes':>11}")
+    for endpoint, samples in recorder.samples.items():
+        latencies = [latency * 1000 for latency, _ in samples]
+        sizes = [size for _, size in samples]
+        print(f"{endpoint:<14}{len(samples):>9}{recorder.errors.get(endpoint, 0):>8}"
+              f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}{percentile(latencies, 99):>9.1f}"
+              f"{len(samples) / elapsed:>8.1f}{sum(sizes) / len(sizes):>11.0f}")
+    if recorder.session_sizes:
+        cookies = [c for c, _ in recorder.session_sizes]
+        stored = [s for _, s in recorder.session_sizes]
+        print(f"session: cookie {max(cookies)} bytes, stored conversation "
+              f"{sum(stored) / len(stored):.0f} bytes avg / {max(stored)} max")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of /, /chat and /clear.")
+    parser.add_argument("--users", type=int, default=16, help="concurrent virtual users")
+    parser.add_argument("--turns", default="1,5,20", help="comma-separated conversation lengths to run")
+    parser.add_argument("--latency", type=float, default=0.3, help="mean stub completion latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--ttft", type=float, default=0.1)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-500", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = stub_server.StubConfig(args.latency, args.jitter, args.ttft, args.chunks, args.rate_429, args.rate_500)
+    stub = stub_server.start(config)
+    chat_app, flask_app, server = start_app(stub.server_port, args)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    print(f"app on {base_url}, stub upstream on port {stub.server_port}, {args.users} users")
+
+    try:
+        for turns in [int(t) for t in args.turns.split(",") if t.strip()]:
+            recorder = Recorder()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.users) as pool:
+                futures = [pool.submit(run_user, base_url, turns, recorder, chat_app, flask_app) for _ in range(args.users)]
+                for future in futures:
+                    future.result()
+            report(turns, recorder, time.perf_counter() - started)
+        print(f"\nupstream requests served by the stub: {config.requests}")
+    finally:
+        server.shutdown()
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Local stand-in for the Azure OpenAI chat-completions endpoint.
+
+Answers any POST with a canned reply after a configurable delay, streams it
+in chunks when the request asks for ``stream: true``, and injects 429 and
+500 responses at the requested rates. When the request offers tools, upper
+case symbols in the question (AAPL, US10Y) are requested as parallel
+``get_quotes`` calls and the next reply lists the returned quotes:
+
+    python benchmarks/stub_server.py --port 8765 --latency 0.8 --rate-429 0.02
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SYMBOL = re.compile(r"\b[A-Z][A-Z0-9]{1,9}\b")
+
+REPLY = (
+    "An **ETF** (exchange-traded fund) is a basket of securities that trades on an exchange like a stock.\n\n"
+    "- Usually lower fees than mutual funds\n"
+    "- Intraday liquidity\n"
+    "- Tax efficiency through in-kind creations and redemptions\n"
+)
+
+
+class StubConfig:
+    def __init__(self, latency=0.5, jitter=0.1, ttft=0.2, chunks=20, rate_429=0.0, rate_500=0.0, reply=REPLY):
+        self.latency = latency
+        self.jitter = jitter
+        self.ttft = ttft
+        self.chunks = chunks
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.reply = reply
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with config.lock:
+                config.requests += 1
+
+            roll = random.random()
+            if roll < config.rate_429:
+                self._send_json(429, {"error": {"code": "429", "message": "Rate limit"}}, {"Retry-After": "1"})
+                return
+            if roll < config.rate_429 + config.rate_500:
+                self._send_json(500, {"error": {"code": "500", "message": "Internal error"}})
+                return
+
+            prompt_tokens = sum(len(m.get("content") or "") for m in payload.get("messages", [])) // 4
+            completion_tokens = len(config.reply) // 4
+            if payload.get("stream"):
+                self._stream(payload)
+                return
+
+            time.sleep(max(0.0, random.gauss(config.latency, config.jitter)))
+            message, finish_reason = self._tool_turn(payload)
+            self._send_json(200, {
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
+
+        def _tool_turn(self, payload):
+            messages = payload.get("messages") or [{}]
+            if payload.get("tools") and payload.get("tool_choice") != "none" and messages[-1].get("role") == "user":
+                symbols = list(dict.fromkeys(SYMBOL.findall(messages[-1].get("content") or "")))
+                if symbols:
+                    calls = [{"id": f"call_{i}", "type": "function",
+                              "function": {"name": "get_quotes", "arguments": json.dumps({"symbols": [symbol]})}}
+                             for i, symbol in enumerate(symbols)]
+                    return {"role": "assistant", "content": None, "tool_calls": calls}, "tool_calls"
+            results = [json.loads(m["content"]) for m in messages if m.get("role") == "tool"]
+            if not results:
+                return {"role": "assistant", "content": config.reply}, "stop"
+            lines = [f"- **{symbol}**: {quote.get('price', quote.get('rate'))}"
+                     for result in results for symbol, quote in (result.get("quotes") or {}).items()]
+            return {"role": "assistant", "content": "Latest quotes:\n\n" + "\n".join(lines)}, "stop"
+
+        def _stream(self, payload):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            time.sleep(config.ttft)
+            message, _ = self._tool_turn(payload)
+            if message.get("tool_calls"):
+                # Like the real service: name and id first, then the arguments in pieces
+                for index, call in enumerate(message["tool_calls"]):
+                    arguments = call["function"]["arguments"]
+                    half = len(arguments) // 2
+                    fragments = [{"index": index, "id": call["id"], "type": "function",
+                                  "function": {"name": call["function"]["name"], "arguments": arguments[:half]}},
+                                 {"index": index, "function": {"arguments": arguments[half:]}}]
+                    for fragment in fragments:
+                        chunk = {"choices": [{"index": 0, "delta": {"tool_calls": [fragment]}}]}
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+                return
+            reply = message["content"]
+            size = max(1, len(reply) // config.chunks)
+            pause = max(0.0, config.latency - config.ttft) / config.chunks
+            for start in range(0, len(reply), size):
+                chunk = {"choices": [{"index": 0, "delta": {"content": reply[start:start + size]}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(pause)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+    return Handler
+
+
+def start(config, host="127.0.0.1", port=0):
+    """Start the stub on a daemon thread and return the server (``server.server_port``)."""
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Azure OpenAI chat-completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.1, help="standard deviation of the latency")
+    parser.add_argument("--ttft", type=float, default=0.2, help="seconds to the first streamed chunk")
+    parser.add_argument("--chunks", type=int, default=20, help="streamed chunks per reply")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-500", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.jitter, args.ttft, args.chunks, args.rate_429, args.rate_500)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"Stub Azure OpenAI listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
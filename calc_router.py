@@ -0,0 +1,359 @@
+"""Answer computable finance questions locally instead of asking the model.
+
+``route`` spots the intent by keyword, pulls amounts, rates, terms and cash
+flows out of the question with regular expressions, and formats the
+calculator result as markdown. Anything it cannot parse with confidence
+returns None so the question goes to the model as before, and so does a
+question that asks for advice or a comparison, is about income or extra
+payments, or gives more than one rate or term: a calculator would answer
+only one reading of it.
+"""
+import math
+import re
+
+import numpy as np
+
+import calculators
+
+# Rate offsets shown in the "what if" sweeps
+SWEEP_OFFSETS = (-0.02, -0.01, 0.0, 0.01, 0.02)
+MAX_TABLE_ROWS = 12
+MAX_YEARS = 100
+
+QUANTITY = re.compile(
+    r"(?P<sign>-)?\s*(?P<dollar>\$)?\s*"
+    r"(?P<number>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|\.\d+)"
+    r"\s*(?P<unit>%|percent\b|k\b|thousand\b|mm\b|m\b|million\b|years?\b|yrs?\b|months?\b|mos?\b)?"
+)
+PER_MONTH = re.compile(r"^\s*(?:(?:per|a|each|every|/)\s*(?:month|mo)\b|monthly\b)")
+PER_YEAR = re.compile(r"^\s*(?:(?:per|a|each|every|/)\s*(?:year|yr)\b|annually\b|yearly\b)")
+CURRENT_AGE = re.compile(r"(?:\bi'?m|\bi am|\bage[d]?)\s+(\d{2})\b|\b(\d{2})\s*(?:years?|yrs?)[\s-]*old\b")
+RETIRE_AGE = re.compile(r"retir\w*\s+(?:at|by|when i'?m)\s+(?:age\s+)?(\d{2})\b")
+COMPOUNDING = {"daily": 365, "monthly": 12, "quarterly": 4, "semi-annually": 2, "annually": 1, "yearly": 1}
+MULTIPLIERS = {"k": 1e3, "thousand": 1e3, "m": 1e6, "mm": 1e6, "million": 1e6}
+# Advice, comparisons and real-terms questions are for the model, whatever numbers they contain
+JUDGEMENT = re.compile(r"\b(?:should|or|vs|versus|compare\w*|refinanc\w*|inflation|erode\w*)\b")
+# "10% of my salary" is a recurring share of income, not a rate of return on a lump sum
+SHARE_OF_INCOME = re.compile(r"%\s*(?:of|from)\b[^.?!]{0,40}?\b(?:salary|income|pay|paycheck|earnings|wages)\b")
+# Earnings and extra payments ("$100 extra each month") change the question none of the calculators answer
+INCOME_OR_EXTRA = re.compile(r"\b(?:earn\w*|make|makes|making|salary|income|wages?|paycheck|extra|additional)\b")
+
+
+class ParseError(ValueError):
+    """The question looked computable but a required parameter is missing."""
+
+
+class Quantity:
+    def __init__(self, value, kind, period, span):
+        self.value = value
+        self.kind = kind  # money, number, rate, years or months
+        self.period = period  # month or year for recurring amounts
+        self.span = span
+
+
+def quantities(text):
+    found = []
+    for match in QUANTITY.finditer(text):
+        value = float(match.group("number").replace(",", ""))
+        unit = (match.group("unit") or "").strip()
+        if unit in ("%", "percent"):
+            kind, value = "rate", value / 100
+        elif unit.startswith(("year", "yr")):
+            kind = "years"
+        elif unit.startswith(("month", "mo")):
+            kind = "months"
+        elif unit in MULTIPLIERS:
+            kind, value = "money", value * MULTIPLIERS[unit]
+        else:
+            kind = "money" if match.group("dollar") else "number"
+        if match.group("sign") and kind in ("money", "number", "rate"):
+            value = -value
+        tail = text[match.end():match.end() + 20]
+        period = "month" if PER_MONTH.match(tail) else "year" if PER_YEAR.match(tail) else None
+        found.append(Quantity(value, kind, period, match.span()))
+    return found
+
+
+def first(items, kind, period=None):
+    for item in items:
+        if item.kind == kind and item.period == period:
+            return item
+    return None
+
+
+def only(items, kind, what):
+    """The single quantity of ``kind``; two of them leave the question open to more than one reading."""
+    found = [item for item in items if item.kind == kind]
+    if len(found) > 1:
+        raise ParseError(f"more than one {what}")
+    return found[0] if found else None
+
+
+def require(item, what):
+    if item is None:
+        raise ParseError(f"missing {what}")
+    return item.value
+
+
+def term_years(items):
+    if sum(item.kind in ("years", "months") for item in items) > 1:
+        raise ParseError("more than one term")
+    years, months = first(items, "years"), first(items, "months")
+    if years is not None:
+        value = years.value
+    elif months is not None:
+        value = months.value / 12
+    else:
+        raise ParseError("missing term")
+    if not 0 < value <= MAX_YEARS:
+        raise ParseError("term out of range")
+    return value
+
+
+def principal(items):
+    """The first lump-sum amount written as money; a bare number may be a count or an index name."""
+    return abs(require(first(items, "money"), "amount"))
+
+
+def recurring(items):
+    """A recurring contribution as ``(amount per month, found)``."""
+    monthly = first(items, "money", "month") or first(items, "number", "month")
+    if monthly is not None:
+        return abs(monthly.value), True
+    yearly = first(items, "money", "year") or first(items, "number", "year")
+    if yearly is not None:
+        return abs(yearly.value) / 12, True
+    return 0.0, False
+
+
+def money(value):
+    return f"-${abs(value):,.2f}" if value < 0 else f"${value:,.2f}"
+
+
+def percent(value):
+    return f"{value * 100:.2f}%"
+
+
+def table(headers, rows):
+    lines = ["| " + " | ".join(headers) + " |", "|" + "|".join(["--:"] * len(headers)) + "|"]
+    lines.extend("| " + " | ".join(row) + " |" for row in rows)
+    return "\n".join(lines)
+
+
+def sample_rows(count):
+    """Indices of at most MAX_TABLE_ROWS evenly spaced rows, always keeping the last."""
+    if count <= MAX_TABLE_ROWS:
+        return list(range(count))
+    step = math.ceil(count / MAX_TABLE_ROWS)
+    return sorted(set(range(step - 1, count, step)) | {count - 1})
+
+
+def sweep(rate, value_at):
+    # Never sweep below zero, or below a negative rate the question gave
+    rates = np.array([rate + offset for offset in SWEEP_OFFSETS if rate + offset >= min(rate, 0)])
+    values = value_at(rates)
+    rows = [[percent(r), money(v)] for r, v in zip(rates, values)]
+    return rates, rows
+
+
+def compound_answer(text):
+    items = quantities(text)
+    rate = require(only(items, "rate", "rate"), "rate")
+    years = term_years(items)
+    contribution, _ = recurring(items)
+    start = principal([item for item in items if item.period is None] or items)
+    per_year = next((n for word, n in COMPOUNDING.items() if f"compounded {word}" in text or f"compounding {word}" in text), 12)
+    per_period = contribution * 12 / per_year
+
+    periods, balances = calculators.future_value(start, rate, years, per_year, per_period)
+    contributed = start + per_period * periods
+    rows = [[f"{periods[i] / per_year:g}", money(contributed[i]), money(balances[i] - contributed[i]), money(balances[i])]
+            for i in sample_rows(len(periods))]
+    _, sweep_rows = sweep(rate, lambda rates: calculators.future_value(start, rates, years, per_year, per_period)[1][:, -1])
+
+    lines = [
+        f"**Future value after {years:g} years: {money(balances[-1])}**",
+        "",
+        f"Starting with {money(start)} at {percent(rate)} a year, compounded {per_year} times a year"
+        + (f", adding {money(contribution)} a month." if contribution else "."),
+        "",
+        table(["Year", "Total contributed", "Interest earned", "Balance"], rows),
+        "",
+        "What if the rate were different?",
+        "",
+        table(["Annual rate", f"Balance after {years:g} years"], sweep_rows),
+    ]
+    return "\n".join(lines)
+
+
+def amortization_answer(text):
+    items = quantities(text)
+    rate = require(only(items, "rate", "rate"), "rate")
+    if rate < 0:
+        raise ParseError("negative loan rate")
+    months = int(round(term_years(items) * 12))
+    amount = principal(items)
+
+    level, interest, principal_paid, balance = calculators.amortization(amount, rate, months)
+    # Roll the monthly schedule up into years with one reduceat per column
+    starts = np.arange(0, months, 12)
+    year_interest = np.add.reduceat(interest, starts)
+    year_principal = np.add.reduceat(principal_paid, starts)
+    year_balance = balance[np.minimum(starts + 11, months - 1)]
+    rows = [[str(i + 1), money(year_principal[i]), money(year_interest[i]), money(year_balance[i])]
+            for i in sample_rows(len(starts))]
+    _, sweep_rows = sweep(rate, lambda rates: calculators.payment(amount, rates, months))
+
+    lines = [
+        f"**Monthly payment: {money(level)}**",
+        "",
+        f"For {money(amount)} at {percent(rate)} over {months} months: "
+        f"total paid {money(level * months)}, of which {money(level * months - amount)} is interest.",
+        "",
+        table(["Year", "Principal paid", "Interest paid", "Ending balance"], rows),
+        "",
+        "Monthly payment at other rates:",
+        "",
+        table(["Annual rate", "Monthly payment"], sweep_rows),
+    ]
+    return "\n".join(lines)
+
+
+def cashflows(text, items):
+    flows = [item.value for item in items if item.kind in ("money", "number") and item.period is None]
+    if len(flows) < 2:
+        raise ParseError("need at least two cash flows")
+    if flows[0] > 0 and all(f >= 0 for f in flows) and re.search(r"\b(?:invest\w*|initial|cost|outlay)\b", text):
+        # "an initial investment of 1000 returning 300, 400..." means the first flow is paid out
+        flows[0] = -flows[0]
+    return flows
+
+
+def npv_answer(text):
+    items = quantities(text)
+    rate = require(only(items, "rate", "discount rate"), "discount rate")
+    if rate <= -1:
+        raise ParseError("discount rate of -100% or less")
+    flows = cashflows(text, [item for item in items if item.kind != "rate"])
+    value = float(calculators.npv(rate, flows))
+    present = np.asarray(flows) / (1 + rate) ** np.arange(len(flows))
+    rows = [[str(t), money(flow), money(pv)] for t, (flow, pv) in enumerate(zip(flows, present))]
+    _, sweep_rows = sweep(rate, lambda rates: calculators.npv(rates, flows))
+    lines = [
+        f"**NPV at {percent(rate)}: {money(value)}**",
+        "",
+        table(["Period", "Cash flow", "Present value"], rows),
+        "",
+        table(["Discount rate", "NPV"], sweep_rows),
+    ]
+    return "\n".join(lines)
+
+
+def irr_answer(text):
+    items = quantities(text)
+    flows = cashflows(text, [item for item in items if item.kind not in ("rate", "years", "months")])
+    if min(flows) >= 0 or max(flows) <= 0:
+        raise ParseError("cash flows need both signs")
+    rate = calculators.irr(flows)
+    if math.isnan(rate):
+        raise ParseError("no real IRR")
+    rows = [[str(t), money(flow)] for t, flow in enumerate(flows)]
+    lines = [
+        f"**IRR: {percent(rate)}**",
+        "",
+        "The discount rate at which these cash flows have an NPV of zero:",
+        "",
+        table(["Period", "Cash flow"], rows),
+    ]
+    return "\n".join(lines)
+
+
+def retirement_answer(text):
+    current = CURRENT_AGE.search(text)
+    retire = RETIRE_AGE.search(text)
+    # Ages are not amounts or terms; keep them out of the quantity scan
+    spans = [m.span() for m in (current, retire) if m]
+    items = [item for item in quantities(text)
+             if not any(start <= item.span[0] < end for start, end in spans)]
+    rate = require(only(items, "rate", "expected return"), "expected return")
+    if current and retire:
+        age = int(current.group(1) or current.group(2))
+        years = int(retire.group(1)) - age
+        if not 0 < years <= MAX_YEARS:
+            raise ParseError("retirement age before current age")
+    else:
+        age, years = None, term_years(items)
+    contribution, _ = recurring(items)
+    lump = [item for item in items if item.period is None and item.kind == "money"]
+    savings = abs(lump[0].value) if lump else 0.0
+    if not savings and not contribution:
+        raise ParseError("missing savings or contributions")
+
+    periods, balances = calculators.future_value(savings, rate, years, 12, contribution)
+    contributed = savings + contribution * periods
+    label = "Age" if age is not None else "Year"
+    offset = age if age is not None else 0
+    rows = [[f"{offset + periods[i] / 12:g}", money(contributed[i]), money(balances[i])] for i in sample_rows(len(periods))]
+    _, sweep_rows = sweep(rate, lambda rates: calculators.future_value(savings, rates, years, 12, contribution)[1][:, -1])
+    final = balances[-1]
+    lines = [
+        f"**Projected savings at retirement: {money(final)}**",
+        "",
+        f"{money(savings)} saved today, {money(contribution)} a month, {percent(rate)} a year for {years:g} years. "
+        f"At a 4% withdrawal rate that supports about {money(final * 0.04)} a year.",
+        "",
+        table([label, "Total contributed", "Balance"], rows),
+        "",
+        table(["Annual return", "Balance at retirement"], sweep_rows),
+    ]
+    return "\n".join(lines)
+
+
+def dca_answer(text):
+    marker = re.search(r"\bprices?\b", text)
+    if not marker:
+        raise ParseError("missing prices")
+    amount = abs(require(first(quantities(text[:marker.start()]), "money", "month")
+                         or first(quantities(text[:marker.start()]), "money"), "amount per purchase"))
+    prices = [item.value for item in quantities(text[marker.end():]) if item.kind in ("money", "number")]
+    if len(prices) < 2 or min(prices) <= 0:
+        raise ParseError("need at least two positive prices")
+
+    shares, invested, value = calculators.dollar_cost_average(amount, prices)
+    rows = [[str(i + 1), money(prices[i]), f"{amount / prices[i]:,.4f}", f"{shares[i]:,.4f}", money(invested[i]), money(value[i])]
+            for i in sample_rows(len(prices))]
+    average_cost = invested[-1] / shares[-1]
+    gain = value[-1] / invested[-1] - 1
+    lines = [
+        f"**Final value: {money(value[-1])} on {money(invested[-1])} invested ({percent(gain)})**",
+        "",
+        f"Average cost per share {money(average_cost)} versus an average price of {money(float(np.mean(prices)))}.",
+        "",
+        table(["Purchase", "Price", "Shares bought", "Total shares", "Invested", "Value"], rows),
+    ]
+    return "\n".join(lines)
+
+
+# Checked in order; the first intent whose keywords appear handles the question
+INTENTS = [
+    ("irr", ("irr", "internal rate of return"), irr_answer),
+    ("npv", ("npv", "net present value"), npv_answer),
+    ("dca", ("dollar cost averag", "dollar-cost averag", "dca"), dca_answer),
+    ("amortization", ("mortgage", "amortiz", "loan", "monthly payment"), amortization_answer),
+    ("retirement", ("retire",), retirement_answer),
+    ("compound", ("compound", "grow", "future value", "worth in", "invest"), compound_answer),
+]
+
+
+def route(question):
+    """Return ``(intent, markdown)`` for a computable question, or None to ask the model."""
+    text = question.lower()
+    if JUDGEMENT.search(text) or SHARE_OF_INCOME.search(text) or INCOME_OR_EXTRA.search(text):
+        return None
+    for intent, keywords, handler in INTENTS:
+        if any(re.search(rf"\b{re.escape(keyword)}", text) for keyword in keywords):
+            try:
+                return intent, handler(text)
+            except (ParseError, ValueError, ZeroDivisionError, OverflowError, FloatingPointError):
+                return None
+    return None
@@ -0,0 +1,78 @@
+"""Vectorized finance calculators.
+
+Every schedule is computed in closed form over a NumPy array of periods, and
+rate arguments broadcast, so a scenario sweep over several rates costs one
+array operation instead of a loop per rate.
+"""
+import numpy as np
+
+
+def future_value(principal, annual_rate, years, periods_per_year=12, contribution=0.0):
+    """Balance at the end of each year with ``contribution`` added every period.
+
+    Returns ``(periods, balances)``; ``balances`` has one row per rate when
+    ``annual_rate`` is an array. A fractional final year gets its own column.
+    """
+    total = int(round(years * periods_per_year))
+    periods = np.unique(np.append(np.arange(periods_per_year, total + 1, periods_per_year), total))
+    rate = np.asarray(annual_rate, dtype=float)[..., None] / periods_per_year
+    growth = (1 + rate) ** periods
+    with np.errstate(divide="ignore", invalid="ignore"):
+        annuity = np.where(rate == 0, periods, (growth - 1) / rate)
+    return periods, principal * growth + contribution * annuity
+
+
+def payment(principal, annual_rate, months):
+    """Level monthly payment of a fully amortizing loan; broadcasts over ``annual_rate``."""
+    rate = np.asarray(annual_rate, dtype=float) / 12
+    with np.errstate(divide="ignore", invalid="ignore"):
+        level = principal * rate / (1 - (1 + rate) ** -months)
+    return np.where(rate == 0, principal / months, level)
+
+
+def amortization(principal, annual_rate, months):
+    """Full monthly schedule: ``(payment, interest, principal_paid, balance)`` arrays."""
+    rate = annual_rate / 12
+    level = float(payment(principal, annual_rate, months))
+    k = np.arange(1, months + 1)
+    if rate == 0:
+        balance = principal - level * k
+    else:
+        growth = (1 + rate) ** k
+        balance = principal * growth - level * (growth - 1) / rate
+    balance = np.maximum(balance, 0.0)
+    opening = np.concatenate(([principal], balance[:-1]))
+    interest = opening * rate
+    return level, interest, level - interest, balance
+
+
+def npv(rate, cashflows):
+    """Net present value of ``cashflows`` (the first at t=0); broadcasts over ``rate``."""
+    cashflows = np.asarray(cashflows, dtype=float)
+    t = np.arange(len(cashflows))
+    discount = (1 + np.asarray(rate, dtype=float)[..., None]) ** t
+    return (cashflows / discount).sum(axis=-1)
+
+
+def irr(cashflows):
+    """Internal rate of return, or NaN when the cash flows have none.
+
+    NPV is a polynomial in ``1 / (1 + r)``, so its real positive roots give
+    every candidate rate; the one closest to zero is returned.
+    """
+    cashflows = np.asarray(cashflows, dtype=float)
+    roots = np.roots(cashflows[::-1])
+    roots = roots[np.isreal(roots)].real
+    roots = roots[roots > 0]
+    if roots.size == 0:
+        return float("nan")
+    rates = 1 / roots - 1
+    return float(rates[np.argmin(np.abs(rates))])
+
+
+def dollar_cost_average(amount, prices):
+    """Invest ``amount`` at each price; returns cumulative shares, invested and value arrays."""
+    prices = np.asarray(prices, dtype=float)
+    shares = np.cumsum(amount / prices)
+    invested = amount * np.arange(1, len(prices) + 1)
+    return shares, invested, shares * prices
@@ -0,0 +1,135 @@
+"""Single-flight coalescing of identical in-flight upstream calls."""
+import asyncio
+import threading
+
+
+class CoalesceTimeout(TimeoutError):
+    """A follower gave up waiting for the in-flight call it joined."""
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.cancelled = False
+
+
+class SingleFlight:
+    """Runs at most one ``fn`` per key at a time; concurrent callers share its result.
+
+    Ordinary exceptions are shared with the followers, so a failing upstream
+    is not hit once per waiting request. If the leader is cancelled instead
+    (a BaseException such as GeneratorExit or KeyboardInterrupt), followers
+    start the call again themselves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.cancelled = 0
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except Exception as e:
+                call.error = e
+                raise
+            except BaseException:
+                call.cancelled = True
+                with self._lock:
+                    self.cancelled += 1
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.event.set()
+
+        if not call.event.wait(timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise CoalesceTimeout(f"Timed out after {timeout}s waiting for an in-flight call")
+        if call.cancelled:
+            return self.do(key, fn, timeout)
+        with self._lock:
+            self.coalesced += 1
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts,
+                "cancelled": self.cancelled,
+                "in_flight": len(self._calls),
+            }
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight, for the ASGI path.
+
+    The shared call runs as its own task, so one waiter being cancelled does
+    not cancel it for the others; it is only cancelled once nobody waits.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.cancelled = 0
+
+    async def do(self, key, fn, timeout=None):
+        entry = self._calls.get(key)
+        leader = entry is None
+        if leader:
+            self.leaders += 1
+            entry = self._calls[key] = {"task": asyncio.ensure_future(fn()), "waiters": 0}
+
+            def forget(_):
+                if self._calls.get(key) is entry:
+                    del self._calls[key]
+
+            entry["task"].add_done_callback(forget)
+
+        entry["waiters"] += 1
+        try:
+            result = await asyncio.wait_for(asyncio.shield(entry["task"]), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise CoalesceTimeout(f"Timed out after {timeout}s waiting for an in-flight call")
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not entry["task"].done():
+                # Nobody is left to use the answer; stop the upstream call too
+                entry["task"].cancel()
+        if not leader:
+            self.coalesced += 1
+        return result
+
+    def stats(self):
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "in_flight": len(self._calls),
+        }
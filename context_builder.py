@@ -0,0 +1,172 @@
+"""Token-budgeted prompt construction with background rolling summaries."""
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Per-message framing the chat format adds on top of the content tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+KNOWLEDGE_PROMPT = (
+    "Reference material from our own documentation. Use it when it answers the question "
+    "and prefer it over general knowledge; ignore it otherwise."
+)
+
+SUMMARY_PROMPT = (
+    "Summarize the following conversation between a user and a financial assistant. "
+    "Keep facts, figures, and the user's goals; drop pleasantries. Reply with the summary only."
+)
+
+
+def _make_counter():
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.get_encoding("o200k_base")
+            return lambda text: len(encoding.encode(text))
+        except Exception:
+            pass
+    # Roughly four characters per token for English prose
+    return lambda text: len(text) // 4 + 1
+
+
+count_tokens = _make_counter()
+
+
+def turn_text(turn):
+    """Return the text the model should see for a stored turn."""
+    # Bot turns keep their original markdown next to the rendered HTML
+    if len(turn) >= 4 and turn[3] is not None:
+        return turn[3]
+    return turn[1]
+
+
+class ContextBuilder:
+    """Builds ``messages`` for a conversation within a fixed token budget.
+
+    Turns that no longer fit are compacted into a summary by a background
+    worker; until the summary lands they are simply left out of the prompt.
+    With a ``knowledge`` index, the chunks retrieved for the newest user turn
+    go in as one system message capped at ``knowledge_budget`` tokens.
+    """
+
+    def __init__(self, store, system_prompt, summarize=None, token_budget=3000,
+                 recent_turns=6, cache_size=10000, max_workers=2,
+                 knowledge=None, knowledge_top_k=4, knowledge_budget=600):
+        self.store = store
+        self.system_prompt = system_prompt
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.knowledge = knowledge
+        self.knowledge_top_k = knowledge_top_k
+        self.knowledge_budget = knowledge_budget
+        self.cache_size = cache_size
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summarize")
+        self._system_tokens = count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+
+    def tokens(self, role, text):
+        """Token count for one message, counted once and then cached."""
+        key = (role, len(text), hash(text))
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                return count
+        count = count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+        with self._lock:
+            self._counts[key] = count
+            if len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return count
+
+    def reference(self, query):
+        """Retrieved chunks for ``query`` as one message's content, or None when nothing relevant fits."""
+        if self.knowledge is None or not query:
+            return None
+        parts = []
+        used = count_tokens(KNOWLEDGE_PROMPT)
+        for hit in self.knowledge.search(query, k=self.knowledge_top_k):
+            title = f"{hit['source']} - {hit['heading']}" if hit["heading"] else hit["source"]
+            part = f"[{title}]\n{hit['text']}"
+            tokens = count_tokens(part)
+            # A long chunk that does not fit may still leave room for a shorter, lower-ranked one
+            if used + tokens <= self.knowledge_budget:
+                parts.append(part)
+                used += tokens
+        return "\n\n".join([KNOWLEDGE_PROMPT] + parts) if parts else None
+
+    def build(self, sid, turns):
+        summary, upto = self.store.summary(sid) or ("", 0)
+        if upto > len(turns):
+            # Conversation was cleared while a summary was being written
+            summary, upto = "", 0
+        live = list(turns[upto:])
+        used = self._system_tokens
+        if summary:
+            used += self.tokens("system", summary)
+        reference = self.reference(turn_text(live[-1]) if live and live[-1][0] == "user" else None)
+        if reference:
+            used += count_tokens(reference) + MESSAGE_OVERHEAD_TOKENS
+
+        sizes = [self.tokens(turn[0], turn_text(turn)) for turn in live]
+        if used + sum(sizes) > self.token_budget and len(live) > self.recent_turns:
+            # Compact everything older than the recent window in one go, so the
+            # summarizer runs once per overflow rather than on every turn
+            cut = len(live) - self.recent_turns
+            self._schedule_summary(sid, summary, live[:cut], upto + cut)
+            live, sizes = live[cut:], sizes[cut:]
+
+        # Still over budget: drop the oldest verbatim turns, but never the newest
+        while len(live) > 1 and used + sum(sizes) > self.token_budget:
+            live.pop(0)
+            sizes.pop(0)
+
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+        if reference:
+            messages.append({"role": "system", "content": reference})
+        for turn in live:
+            if turn[0] == "user":
+                messages.append({"role": "user", "content": turn_text(turn)})
+            elif turn[0] == "bot":
+                messages.append({"role": "assistant", "content": turn_text(turn)})
+        return messages
+
+    def _schedule_summary(self, sid, summary, turns, upto):
+        if self.summarize is None:
+            return
+        with self._lock:
+            if sid in self._pending:
+                return
+            self._pending.add(sid)
+        # A summary that finishes after /clear must not land on the turns sent since
+        generation = self.store.generation(sid)
+        self._executor.submit(self._run_summary, sid, summary, turns, upto, generation)
+
+    def _run_summary(self, sid, summary, turns, upto, generation):
+        try:
+            lines = [f"Earlier summary: {summary}"] if summary else []
+            for turn in turns:
+                speaker = "User" if turn[0] == "user" else "Assistant"
+                lines.append(f"{speaker}: {turn_text(turn)}")
+            messages = [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": "\n".join(lines)},
+            ]
+            self.store.set_summary(sid, self.summarize(messages), upto, generation)
+        except Exception as e:
+            logger.error(f"Summary error: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(sid)
@@ -0,0 +1,360 @@
+"""Server-side conversation storage keyed by an opaque session id.
+
+Turns are ``(role, content, timestamp, raw)`` tuples, appended one at a time
+so a new message never rewrites the rest of the conversation. ``content`` is
+what the page shows (rendered HTML for bot turns) and ``raw`` is the original
+markdown sent back to the model, or None when it equals ``content``. Each
+conversation may also carry a rolling summary of its first ``upto`` turns,
+tied to the conversation's ``generation`` so that a summary finishing after
+a clear is not attached to the turns that came after it.
+Both backends can search a conversation's turns (see history_search).
+"""
+import itertools
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from history_search import MARK_END, MARK_START, SNIPPET_WORDS, TurnIndex, fts_query, marked_snippet, searchable_text
+
+logger = logging.getLogger(__name__)
+
+# Rough per-turn bookkeeping cost on top of the string payloads
+TURN_OVERHEAD_BYTES = 64
+
+
+class ConversationStore:
+    """Interface shared by the storage backends."""
+
+    def append(self, sid, turn):
+        raise NotImplementedError
+
+    def turns(self, sid):
+        raise NotImplementedError
+
+    def page(self, sid, before=None, limit=20):
+        """Return ``(turns, cursor)``: up to ``limit`` turns older than ``before``, oldest first.
+
+        ``before`` is a cursor from a previous page (None for the newest turns);
+        the returned cursor fetches the next older page, or is None at the start.
+        """
+        turns = self.turns(sid)
+        end = len(turns) if before is None else max(0, min(before, len(turns)))
+        start = max(0, end - limit)
+        return turns[start:end], (start if start > 0 else None)
+
+    def clear(self, sid):
+        raise NotImplementedError
+
+    def search(self, sid, query, limit=10):
+        """Return up to ``limit`` ranked hits for ``query`` (see history_search).
+
+        This fallback indexes the whole conversation on every call.
+        """
+        index = TurnIndex()
+        for position, turn in enumerate(self.turns(sid)):
+            index.add(position, turn)
+        return index.search(query, limit)
+
+    def generation(self, sid):
+        """An opaque value that changes when the conversation is cleared and started again."""
+        raise NotImplementedError
+
+    def summary(self, sid):
+        """Return ``(text, upto)`` for the conversation, or None."""
+        raise NotImplementedError
+
+    def set_summary(self, sid, text, upto, generation):
+        """Store a summary, unless the conversation is no longer at ``generation``."""
+        raise NotImplementedError
+
+
+def turn_size(turn):
+    return TURN_OVERHEAD_BYTES + sum(len(field.encode("utf-8")) for field in turn if field)
+
+
+class MemoryConversationStore(ConversationStore):
+    """Per-process LRU of conversations bounded by a total byte budget."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conversations = OrderedDict()
+        self._sizes = {}
+        self._summaries = {}
+        self._generations = {}
+        self._next_generation = itertools.count(1)
+        # Search indexes, built on a conversation's first search and kept current after that.
+        # An indexed turn is charged twice against max_bytes: its text is held again by the index.
+        self._indexes = {}
+        self._total_bytes = 0
+
+    def append(self, sid, turn):
+        turn = tuple(turn)
+        size = turn_size(turn)
+        with self._lock:
+            turns = self._conversations.get(sid)
+            if turns is None:
+                turns = self._conversations[sid] = []
+                self._generations[sid] = next(self._next_generation)
+            turns.append(turn)
+            if sid in self._indexes:
+                self._indexes[sid].add(len(turns) - 1, turn)
+                size *= 2
+            self._conversations.move_to_end(sid)
+            self._sizes[sid] = self._sizes.get(sid, 0) + size
+            self._total_bytes += size
+            self._evict(keep=sid)
+
+    def turns(self, sid):
+        with self._lock:
+            if sid not in self._conversations:
+                return []
+            self._conversations.move_to_end(sid)
+            return list(self._conversations[sid])
+
+    def page(self, sid, before=None, limit=20):
+        # Cursors are list positions; only the requested slice is copied
+        with self._lock:
+            if sid not in self._conversations:
+                return [], None
+            self._conversations.move_to_end(sid)
+            turns = self._conversations[sid]
+            end = len(turns) if before is None else max(0, min(before, len(turns)))
+            start = max(0, end - limit)
+            return turns[start:end], (start if start > 0 else None)
+
+    def clear(self, sid):
+        with self._lock:
+            self._drop(sid)
+
+    def search(self, sid, query, limit=10):
+        with self._lock:
+            if sid not in self._conversations:
+                return []
+            index = self._indexes.get(sid)
+            if index is None:
+                generation = self._generations[sid]
+                snapshot = list(self._conversations[sid])
+        if index is None:
+            index = self._build_index(sid, generation, snapshot)
+            if index is None:
+                # Cleared or evicted while the index was built; look again
+                return self.search(sid, query, limit)
+        # Scoring takes only the index's own lock, so other conversations carry on meanwhile
+        return index.search(query, limit)
+
+    def _build_index(self, sid, generation, snapshot):
+        """Index ``snapshot`` without holding the store lock, then install it; None if the conversation changed."""
+        index = TurnIndex()
+        size = 0
+        for position, turn in enumerate(snapshot):
+            index.add(position, turn)
+            size += turn_size(turn)
+        with self._lock:
+            if self._generations.get(sid) != generation:
+                return None
+            if sid in self._indexes:
+                # Another search got there first
+                return self._indexes[sid]
+            turns = self._conversations[sid]
+            for position in range(len(snapshot), len(turns)):
+                index.add(position, turns[position])
+                size += turn_size(turns[position])
+            self._indexes[sid] = index
+            self._sizes[sid] += size
+            self._total_bytes += size
+            self._evict(keep=sid)
+            return index
+
+    def generation(self, sid):
+        with self._lock:
+            return self._generations.get(sid)
+
+    def summary(self, sid):
+        with self._lock:
+            return self._summaries.get(sid)
+
+    def set_summary(self, sid, text, upto, generation):
+        with self._lock:
+            if sid not in self._conversations or self._generations[sid] != generation:
+                return
+            previous = self._summaries.get(sid)
+            size = len(text.encode("utf-8")) - (len(previous[0].encode("utf-8")) if previous else 0)
+            self._summaries[sid] = (text, upto)
+            self._sizes[sid] += size
+            self._total_bytes += size
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def _drop(self, sid):
+        if self._conversations.pop(sid, None) is not None:
+            self._total_bytes -= self._sizes.pop(sid)
+            self._summaries.pop(sid, None)
+            self._generations.pop(sid, None)
+            self._indexes.pop(sid, None)
+
+    def _evict(self, keep):
+        # Least recently used conversations go first; the active one always survives
+        while self._total_bytes > self.max_bytes and len(self._conversations) > 1:
+            oldest = next(iter(self._conversations))
+            if oldest == keep:
+                self._conversations.move_to_end(keep)
+                continue
+            self._drop(oldest)
+
+
+class SQLiteConversationStore(ConversationStore):
+    """SQLite-backed store in WAL mode, shareable by several worker processes."""
+
+    def __init__(self, path="conversations.db"):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " sid TEXT NOT NULL,"
+            " role TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " timestamp TEXT NOT NULL,"
+            " raw TEXT)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(turns)")}
+        if "raw" not in columns:
+            conn.execute("ALTER TABLE turns ADD COLUMN raw TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS turns_sid ON turns (sid, id)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            " sid TEXT PRIMARY KEY,"
+            " text TEXT NOT NULL,"
+            " upto INTEGER NOT NULL)"
+        )
+        self.fts = self._create_search_index(conn)
+
+    def _create_search_index(self, conn):
+        """Set up the FTS5 index of turns; False when this SQLite build lacks FTS5."""
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'turns_fts'").fetchone()
+        try:
+            # sid is indexed too, so a search only intersects the postings of one conversation
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(sid, body, tokenize='porter unicode61')"
+            )
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite FTS5 unavailable, history search will scan conversations: {e}")
+            return False
+        # Triggers keep the index current in the same transaction as every insert and delete
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS turns_fts_insert AFTER INSERT ON turns BEGIN"
+            " INSERT INTO turns_fts (rowid, sid, body) VALUES (new.id, new.sid, COALESCE(new.raw, new.content));"
+            " END"
+        )
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS turns_fts_delete AFTER DELETE ON turns BEGIN"
+            " DELETE FROM turns_fts WHERE rowid = old.id;"
+            " END"
+        )
+        if not exists:
+            # Turns stored before the index existed; older bot turns may only have HTML
+            rows = conn.execute("SELECT id, sid, role, content, timestamp, raw FROM turns")
+            conn.executemany(
+                "INSERT INTO turns_fts (rowid, sid, body) VALUES (?, ?, ?)",
+                ((row[0], row[1], searchable_text(row[2:])) for row in rows.fetchall()),
+            )
+        return True
+
+    def _connection(self):
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, sid, turn):
+        role, content, timestamp = turn[:3]
+        raw = turn[3] if len(turn) > 3 else None
+        self._connection().execute(
+            "INSERT INTO turns (sid, role, content, timestamp, raw) VALUES (?, ?, ?, ?, ?)",
+            (sid, role, content, timestamp, raw),
+        )
+
+    def turns(self, sid):
+        rows = self._connection().execute(
+            "SELECT role, content, timestamp, raw FROM turns WHERE sid = ? ORDER BY id", (sid,)
+        )
+        return rows.fetchall()
+
+    def page(self, sid, before=None, limit=20):
+        # Cursors are row ids, so pages stay stable while new turns are appended
+        rows = self._connection().execute(
+            "SELECT id, role, content, timestamp, raw FROM turns WHERE sid = ? AND id < ?"
+            " ORDER BY id DESC LIMIT ?",
+            (sid, before if before is not None else 2 ** 63 - 1, limit + 1),
+        ).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit][::-1]
+        return [row[1:] for row in rows], (rows[0][0] if more else None)
+
+    def clear(self, sid):
+        conn = self._connection()
+        conn.execute("DELETE FROM turns WHERE sid = ?", (sid,))
+        conn.execute("DELETE FROM summaries WHERE sid = ?", (sid,))
+
+    def search(self, sid, query, limit=10):
+        match = fts_query(query)
+        if match is None:
+            return []
+        if not self.fts:
+            index = TurnIndex()
+            for row in self._connection().execute(
+                "SELECT id, role, content, timestamp, raw FROM turns WHERE sid = ? ORDER BY id", (sid,)
+            ):
+                index.add(row[0], row[1:])
+            return index.search(query, limit)
+        # Cursors are row ids here, so the page ending with a hit starts below id + 1
+        sid_phrase = '"' + sid.replace('"', '""') + '"'
+        # Rank on the body alone; the sid term matches every row of the conversation
+        rows = self._connection().execute(
+            "SELECT t.id, t.role, t.timestamp, snippet(turns_fts, 1, ?, ?, '…', ?),"
+            " bm25(turns_fts, 0.0, 1.0) AS score"
+            " FROM turns_fts JOIN turns t ON t.id = turns_fts.rowid"
+            " WHERE turns_fts MATCH ? ORDER BY score LIMIT ?",
+            (MARK_START, MARK_END, SNIPPET_WORDS, f"sid:{sid_phrase} AND {match}", limit),
+        )
+        return [
+            {"cursor": row[0] + 1, "role": row[1], "timestamp": row[2],
+             "snippet": marked_snippet(row[3]), "score": -row[4]}
+            for row in rows
+        ]
+
+    def summary(self, sid):
+        return self._connection().execute(
+            "SELECT text, upto FROM summaries WHERE sid = ?", (sid,)
+        ).fetchone()
+
+    def generation(self, sid):
+        # The first turn's id; a cleared conversation starts again with a new one
+        return self._connection().execute("SELECT MIN(id) FROM turns WHERE sid = ?", (sid,)).fetchone()[0]
+
+    def set_summary(self, sid, text, upto, generation):
+        # Checked in the same statement, so a clear cannot slip in between
+        self._connection().execute(
+            "INSERT INTO summaries (sid, text, upto)"
+            " SELECT ?, ?, ? WHERE (SELECT MIN(id) FROM turns WHERE sid = ?) = ?"
+            " ON CONFLICT(sid) DO UPDATE SET text = excluded.text, upto = excluded.upto",
+            (sid, text, upto, sid, generation),
+        )
+
+
+def create_store(kind="memory", **options):
+    """Build a store from a backend name (``memory`` or ``sqlite``)."""
+    if kind == "memory":
+        return MemoryConversationStore(max_bytes=options.get("max_bytes", 64 * 1024 * 1024))
+    if kind == "sqlite":
+        return SQLiteConversationStore(path=options.get("path", "conversations.db"))
+    raise ValueError(f"Unknown conversation store: {kind}")
@@ -0,0 +1,67 @@
+"""Per-request deadlines, checked by every stage of a chat turn.
+
+A Deadline is created when a request arrives and handed to admission, the
+upstream client and the renderer. Each stage bounds its waits by
+``remaining()``, and ``check()`` stops the turn between steps once the
+deadline has passed or the client has disconnected.
+"""
+import select
+import socket
+import time
+
+
+class Cancelled(Exception):
+    """The turn was abandoned; ``reason`` is "deadline" or "disconnect", ``stage`` where it stopped."""
+
+    def __init__(self, reason, stage):
+        what = "client disconnected" if reason == "disconnect" else "deadline exceeded"
+        super().__init__(f"Request cancelled during {stage}: {what}")
+        self.reason = reason
+        self.stage = stage
+
+
+def socket_disconnected(sock):
+    """Whether the peer has closed ``sock``: readable, yet a peek returns nothing."""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b""
+    except ValueError:
+        # TLS sockets do not support peeking; treat the client as still there
+        return False
+    except OSError:
+        return True
+
+
+class Deadline:
+    """Time budget for one request, plus an optional probe for a client that went away."""
+
+    def __init__(self, seconds, disconnected=None):
+        self.expires = time.monotonic() + seconds
+        self._disconnected = disconnected
+        self.reason = None
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def timeout(self, limit):
+        """``limit`` shortened to the time that is left."""
+        return min(limit, self.remaining())
+
+    def client_gone(self):
+        if self.reason != "disconnect" and self._disconnected is not None and self._disconnected():
+            self.reason = "disconnect"
+        return self.reason == "disconnect"
+
+    def cancel(self, reason="disconnect"):
+        self.reason = self.reason or reason
+
+    def cancelled(self):
+        """Why the request should stop ("disconnect" or "deadline"), or None to carry on."""
+        if self.reason is None and not self.client_gone() and time.monotonic() >= self.expires:
+            self.reason = "deadline"
+        return self.reason
+
+    def check(self, stage):
+        reason = self.cancelled()
+        if reason is not None:
+            raise Cancelled(reason, stage)
@@ -0,0 +1,43 @@
+"""Gunicorn settings for production, read from the environment.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+The app is not preloaded in the master: the log listener thread and the
+upstream keep-alive sockets cannot be shared across a fork, so each worker
+builds and warms its own. The memory conversation store and the admission
+limits are per worker too; use CONVERSATION_STORE=sqlite with more than one
+worker and size ADMISSION_MAX_CONCURRENCY per worker.
+"""
+import os
+import signal
+import threading
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_WORKERS", "2"))
+# Threads block on upstream I/O, so give each worker at least its admission concurrency
+threads = int(os.getenv("WEB_THREADS", "16"))
+worker_class = "gthread"
+preload_app = False
+# gthread workers heartbeat from the main loop, so long streams do not trip this
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+# Recycle workers now and then to bound memory growth; jitter keeps them from restarting together
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+# On SIGTERM a worker first fails readiness and keeps serving for this long,
+# so the load balancer can take it out before it stops accepting
+DRAIN_DELAY = float(os.getenv("WEB_DRAIN_DELAY", "5"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30")) + int(DRAIN_DELAY)
+
+
+def post_worker_init(worker):
+    from app import begin_drain
+
+    stop = signal.getsignal(signal.SIGTERM)
+
+    def drain(signum, frame):
+        begin_drain()
+        threading.Timer(DRAIN_DELAY, stop, (signum, frame)).start()
+
+    signal.signal(signal.SIGTERM, drain)
@@ -0,0 +1,196 @@
+"""Full-text search over a conversation's stored turns.
+
+The SQLite store answers from an FTS5 table kept up to date by triggers;
+the memory store keeps a TurnIndex per conversation, built on its first
+search and then updated as turns are appended. Both rank with BM25 and
+return hits as::
+
+    {"cursor": ..., "role": ..., "timestamp": ..., "snippet": ..., "score": ...}
+
+``snippet`` is escaped HTML with the matched words in ``<mark>``, and
+``cursor`` is the ``before`` value of the history page that ends with the hit.
+"""
+import heapq
+import html
+import math
+import re
+import threading
+from bisect import bisect_left
+
+SNIPPET_WORDS = 16
+MAX_QUERY_TERMS = 8
+# Prefix matching on the last word, so results appear while it is being typed
+MIN_PREFIX = 3
+
+_WORD = re.compile(r"\w+")
+_TAG = re.compile(r"<[^>]+>")
+_SPACE = re.compile(r"\s+")
+# Snippet markers from SQLite, swapped for <mark> once the text is escaped
+MARK_START, MARK_END = "\x02", "\x03"
+
+STOPWORDS = frozenset(
+    "a about an and any are as at be but by can could did do does for from had has have how i if in is it "
+    "its me my of on or our said say says so tell that the their them then there these they this to told "
+    "was we were what when where which who why will with would you your".split()
+)
+
+
+def stem(word):
+    """A light plural folding, enough for "ladders" to find "ladder"."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def searchable_text(turn):
+    """The text of a turn to index: the raw markdown of bot turns, tags stripped when there is none."""
+    role, content = turn[0], turn[1]
+    raw = turn[3] if len(turn) > 3 else None
+    if raw:
+        return raw
+    if role == "user":
+        return content
+    return _SPACE.sub(" ", html.unescape(_TAG.sub(" ", content))).strip()
+
+
+def query_terms(query):
+    """``(terms, prefix)``: the query's stemmed keywords, and its last word when it may be cut short."""
+    words = [word for word in _WORD.findall(query.lower()) if word not in STOPWORDS]
+    if not words:
+        return [], None
+    words = words[:MAX_QUERY_TERMS]
+    # A trailing space or punctuation means the last word is complete
+    prefix = words[-1] if len(words[-1]) >= MIN_PREFIX and _WORD.match(query[-1:]) else None
+    return list(dict.fromkeys(stem(word) for word in words)), prefix
+
+
+def fts_query(query):
+    """An FTS5 MATCH expression for the body column: any keyword, the last one as a prefix too."""
+    terms, prefix = query_terms(query)
+    if not terms:
+        return None
+    parts = [f'"{term}"' for term in terms]
+    if prefix is not None:
+        parts.append(f'"{prefix}"*')
+    return "body:(" + " OR ".join(parts) + ")"
+
+
+def marked_snippet(text):
+    """Escape an FTS5 snippet and turn its markers into <mark> tags."""
+    escaped = html.escape(_SPACE.sub(" ", text).strip())
+    return escaped.replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def highlight(text, matches, words=SNIPPET_WORDS):
+    """The ``words``-long window of ``text`` with the most matches, escaped, matches in <mark>."""
+    tokens = list(_WORD.finditer(text))
+    if not tokens:
+        return ""
+    hits = [i for i, token in enumerate(tokens) if matches(token.group().lower())]
+    best, best_count = 0, -1
+    for start in hits or [0]:
+        # A couple of words of context before the first match, but never a short window at the end
+        first = max(0, min(start - 2, len(tokens) - words))
+        count = bisect_left(hits, first + words) - bisect_left(hits, first)
+        if count > best_count:
+            best, best_count = first, count
+    window = tokens[best:best + words]
+    hit_set = set(hits)
+    parts = ["…"] if best > 0 else []
+    position = window[0].start()
+    for i, token in enumerate(window, best):
+        parts.append(html.escape(_SPACE.sub(" ", text[position:token.start()])))
+        word = html.escape(token.group())
+        parts.append(f"<mark>{word}</mark>" if i in hit_set else word)
+        position = token.end()
+    if best + words < len(tokens):
+        parts.append("…")
+    else:
+        parts.append(html.escape(_SPACE.sub(" ", text[position:]).rstrip()))
+    return "".join(parts)
+
+
+class TurnIndex:
+    """In-process inverted index over one conversation, for stores without FTS5.
+
+    Postings map a stemmed term to ``{cursor: term frequency}``; turns are
+    added one at a time as they are stored.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = {}
+        self.turns = {}
+        self.total_length = 0
+        self._vocabulary = None
+        self._lock = threading.Lock()
+
+    def add(self, cursor, turn):
+        text = searchable_text(turn)
+        counts = {}
+        for word in _WORD.findall(text.lower()):
+            term = stem(word)
+            counts[term] = counts.get(term, 0) + 1
+        with self._lock:
+            for term, count in counts.items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = {}
+                    self._vocabulary = None
+                postings[cursor] = count
+            length = sum(counts.values())
+            self.lengths[cursor] = length
+            self.total_length += length
+            self.turns[cursor] = (turn[0], turn[2], text)
+
+    def _expand(self, prefix):
+        # Sorted lazily: only rebuilt after a new term arrived
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        prefix = stem(prefix)
+        start = bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in self._vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, query, limit=10):
+        terms, prefix = query_terms(query)
+        if not terms:
+            return []
+        with self._lock:
+            if not self.lengths:
+                return []
+            wanted = set(terms)
+            if prefix is not None:
+                wanted.update(self._expand(prefix))
+            count = len(self.lengths)
+            average = self.total_length / count
+            scores = {}
+            for term in wanted:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for cursor, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[cursor] / average)
+                    scores[cursor] = scores.get(cursor, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            found = [(cursor, score, self.turns[cursor]) for cursor, score in best]
+
+        def matches(word):
+            return stem(word) in wanted
+
+        return [
+            {"cursor": cursor + 1, "role": role, "timestamp": timestamp,
+             "snippet": highlight(text, matches), "score": score}
+            for cursor, score, (role, timestamp, text) in found
+        ]
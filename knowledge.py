@@ -0,0 +1,315 @@
+"""Local knowledge index over the product docs and glossary.
+
+Built offline from a folder of Markdown and text files::
+
+    python knowledge.py build docs/ knowledge_index/
+    python knowledge.py query knowledge_index/ "What does the premium plan cost?"
+
+The index directory holds a BM25 inverted index with the per-posting weights
+precomputed, an embedding matrix, and the chunk records. All of them are
+``.npy`` arrays opened with ``mmap_mode="r"``, so loading takes milliseconds
+and workers share the pages through the OS cache. A query scores BM25 over the
+postings of its terms, then reranks the best candidates by cosine similarity
+against their rows of the embedding matrix.
+"""
+import argparse
+import json
+import os
+import re
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # pragma: no cover - optional dependency
+    SentenceTransformer = None
+
+DOC_EXTENSIONS = (".md", ".markdown", ".txt", ".rst")
+TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+STOPWORDS = frozenset("""
+a about an and are as at be by can do does for from has have how i in is it its me my of on or our should so
+that the their there this to was we what when where which who why will with you your
+""".split())
+
+INDEX_VERSION = 1
+
+
+def tokenize(text):
+    return [t for t in TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def split_document(text, source, max_words=180, overlap=30):
+    """Split a document into chunks of about ``max_words`` words along paragraph boundaries.
+
+    Each chunk records the Markdown heading it falls under. A paragraph longer
+    than ``max_words`` is cut into windows that overlap by ``overlap`` words.
+    """
+    if not 0 <= overlap < max_words:
+        raise ValueError("overlap must be at least 0 and less than max_words")
+    chunks = []
+    heading = ""
+    words = []
+
+    def flush():
+        if words:
+            chunks.append({"source": source, "heading": heading, "text": " ".join(words)})
+            words.clear()
+
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if paragraph.startswith("#") and "\n" not in paragraph:
+            flush()
+            heading = paragraph.lstrip("#").strip()
+            continue
+        tokens = paragraph.split()
+        if len(words) + len(tokens) > max_words:
+            flush()
+        while len(tokens) > max_words:
+            chunks.append({"source": source, "heading": heading, "text": " ".join(tokens[:max_words])})
+            tokens = tokens[max_words - overlap:]
+        words.extend(tokens)
+    flush()
+    return chunks
+
+
+def load_documents(folder, max_words=180, overlap=30):
+    """Chunks of every document under ``folder``, with paths relative to it as sources."""
+    chunks = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.lower().endswith(DOC_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+            chunks.extend(split_document(text, os.path.relpath(path, folder), max_words, overlap))
+    return chunks
+
+
+class HashingEmbedder:
+    """Stand-in embedder: signed feature hashing of unigrams and bigrams, L2-normalized.
+
+    Needs nothing beyond NumPy and is deterministic across processes, which
+    makes it the default until a local model is configured.
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _slot(self, feature):
+        # Column and sign packed into one signed int: sign * (column + 1)
+        digest = zlib.crc32(feature.encode("utf-8"))
+        return (digest % self.dim + 1) * (1 if digest & 0x80000000 else -1)
+
+    def embed(self, texts):
+        return self.embed_tokens([tokenize(text) for text in texts])
+
+    def embed_tokens(self, token_lists, slots=None):
+        """Embed already tokenized texts; the index build tokenizes each chunk only once.
+
+        ``slots`` memoizes feature hashes; the build passes one dict for all its
+        batches, so the memo lives no longer than the build.
+        """
+        slots = {} if slots is None else slots
+        codes, counts = [], []
+        for tokens in token_lists:
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            codes.extend([slots.get(feature) or slots.setdefault(feature, self._slot(feature)) for feature in features])
+            counts.append(len(features))
+        codes = np.asarray(codes, dtype=np.int64)
+        rows = len(token_lists)
+        cells = np.repeat(np.arange(rows) * self.dim, counts) + np.abs(codes) - 1
+        vectors = np.bincount(cells, weights=np.sign(codes), minlength=rows * self.dim)
+        vectors = vectors.reshape(rows, self.dim).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class ModelEmbedder:
+    """Embeddings from a local sentence-transformers model."""
+
+    def __init__(self, model_name):
+        if SentenceTransformer is None:
+            raise RuntimeError("sentence-transformers is not installed; use the hashing embedder")
+        self.name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts):
+        return self.model.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+
+def make_embedder(name="hashing", dim=256):
+    """``hashing`` (optionally ``hashing-<dim>``) or the name of a sentence-transformers model."""
+    if name == "hashing" or name.startswith("hashing-"):
+        return HashingEmbedder(int(name.split("-", 1)[1]) if "-" in name else dim)
+    return ModelEmbedder(name)
+
+
+def build_index(chunks, out_dir, embedder=None, k1=1.2, b=0.75, batch_size=1024):
+    """Write the index for ``chunks`` (dicts with source, heading and text) to ``out_dir``."""
+    embedder = embedder or HashingEmbedder()
+    os.makedirs(out_dir, exist_ok=True)
+    n = len(chunks)
+
+    # Embeddings are written batch by batch straight into the memory-mapped file
+    embeddings = np.lib.format.open_memmap(os.path.join(out_dir, "embeddings.npy"), mode="w+",
+                                           dtype=np.float32, shape=(n, embedder.dim))
+
+    # Inverted index: one (term, chunk, tf) triple per distinct term in a chunk
+    vocab = {}
+    term_ids, doc_ids, freqs = [], [], []
+    lengths = np.zeros(n, dtype=np.float32)
+    slots = {}
+    for start in range(0, n, batch_size):
+        batch = chunks[start:start + batch_size]
+        texts = [f"{chunk['heading']} {chunk['text']}" for chunk in batch]
+        token_lists = [tokenize(text) for text in texts]
+        for doc, tokens in enumerate(token_lists, start):
+            lengths[doc] = len(tokens)
+            for token, tf in Counter(tokens).items():
+                term_ids.append(vocab.setdefault(token, len(vocab)))
+                doc_ids.append(doc)
+                freqs.append(tf)
+        if hasattr(embedder, "embed_tokens"):
+            embeddings[start:start + len(batch)] = embedder.embed_tokens(token_lists, slots)
+        else:
+            embeddings[start:start + len(batch)] = embedder.embed(texts)
+    embeddings.flush()
+    del embeddings
+
+    term_ids = np.asarray(term_ids, dtype=np.int32)
+    doc_ids = np.asarray(doc_ids, dtype=np.int32)
+    freqs = np.asarray(freqs, dtype=np.float32)
+
+    # Group postings by term; offsets[t]:offsets[t + 1] is term t's slice
+    order = np.argsort(term_ids, kind="stable")
+    doc_ids, freqs, term_ids = doc_ids[order], freqs[order], term_ids[order]
+    df = np.bincount(term_ids, minlength=len(vocab))
+    offsets = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+
+    # Precompute BM25 so a query only sums weights
+    avgdl = float(lengths.mean()) if n else 0.0
+    idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+    norm = k1 * (1 - b + b * lengths[doc_ids] / max(avgdl, 1e-9))
+    weights = idf[term_ids] * freqs * (k1 + 1) / (freqs + norm)
+
+    np.save(os.path.join(out_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(out_dir, "postings.npy"), doc_ids)
+    np.save(os.path.join(out_dir, "weights.npy"), weights.astype(np.float32))
+
+    # Chunk records as one byte blob plus offsets, so a hit is read without loading the rest
+    records = [json.dumps(chunk, ensure_ascii=False).encode("utf-8") for chunk in chunks]
+    record_offsets = np.concatenate(([0], np.cumsum([len(r) for r in records]))).astype(np.int64)
+    np.save(os.path.join(out_dir, "chunks.npy"), np.frombuffer(b"".join(records), dtype=np.uint8))
+    np.save(os.path.join(out_dir, "chunk_offsets.npy"), record_offsets)
+
+    with open(os.path.join(out_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    meta = {"version": INDEX_VERSION, "chunks": n, "terms": len(vocab), "embedder": embedder.name,
+            "dim": embedder.dim, "k1": k1, "b": b, "avgdl": avgdl}
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class KnowledgeIndex:
+    """Read-only view of an index directory written by ``build_index``."""
+
+    def __init__(self, path, embedder=None, rerank=200, dense_weight=0.5, min_similarity=0.05):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported knowledge index version in {path}; rebuild it")
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            self.vocab = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.offsets = load("offsets.npy")
+        self.postings = load("postings.npy")
+        self.weights = load("weights.npy")
+        self.embeddings = load("embeddings.npy")
+        self.records = load("chunks.npy")
+        self.record_offsets = load("chunk_offsets.npy")
+        self.size = self.meta["chunks"]
+        self.embedder = embedder or make_embedder(self.meta["embedder"], self.meta["dim"])
+        self.rerank = rerank
+        self.dense_weight = dense_weight
+        self.min_similarity = min_similarity
+
+    def chunk(self, doc):
+        start, end = self.record_offsets[doc], self.record_offsets[doc + 1]
+        return json.loads(self.records[start:end].tobytes().decode("utf-8"))
+
+    def search(self, query, k=4):
+        """Top ``k`` chunks for ``query`` as dicts with source, heading, text and score, best first."""
+        terms = {self.vocab[token] for token in tokenize(query) if token in self.vocab}
+        if not terms or not self.size:
+            return []
+        ids = np.concatenate([self.postings[self.offsets[t]:self.offsets[t + 1]] for t in terms])
+        weights = np.concatenate([self.weights[self.offsets[t]:self.offsets[t + 1]] for t in terms])
+        scores = np.bincount(ids, weights=weights, minlength=self.size)
+
+        # Rerank only the best BM25 candidates; the gather reads just their embedding rows
+        limit = min(self.rerank, np.count_nonzero(scores))
+        candidates = np.argpartition(-scores, limit - 1)[:limit]
+        candidates.sort()
+        similarity = self.embeddings[candidates] @ self.embedder.embed([query])[0]
+        lexical = scores[candidates] / scores[candidates].max()
+        combined = (1 - self.dense_weight) * lexical + self.dense_weight * np.maximum(similarity, 0)
+
+        hits = []
+        for i in np.argsort(-combined)[:k]:
+            if similarity[i] < self.min_similarity:
+                continue
+            hit = self.chunk(int(candidates[i]))
+            hit["score"] = round(float(combined[i]), 4)
+            hits.append(hit)
+        return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the local knowledge index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="chunk a document folder and write the index")
+    build.add_argument("docs", help="folder of .md, .txt and .rst documents")
+    build.add_argument("out", help="index directory to write")
+    build.add_argument("--embedder", default="hashing", help="'hashing' or a sentence-transformers model name")
+    build.add_argument("--dim", type=int, default=256, help="dimensions of the hashing embedder")
+    build.add_argument("--chunk-words", type=int, default=180)
+    build.add_argument("--overlap", type=int, default=30)
+    query = commands.add_parser("query", help="print the top chunks for a question")
+    query.add_argument("index", help="index directory")
+    query.add_argument("question")
+    query.add_argument("-k", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if not 0 <= args.overlap < args.chunk_words:
+            parser.error("--overlap must be at least 0 and less than --chunk-words")
+        started = time.perf_counter()
+        chunks = load_documents(args.docs, args.chunk_words, args.overlap)
+        meta = build_index(chunks, args.out, make_embedder(args.embedder, args.dim))
+        print(f"{meta['chunks']} chunks, {meta['terms']} terms, {meta['embedder']} embeddings "
+              f"in {time.perf_counter() - started:.1f}s -> {args.out}")
+    else:
+        index = KnowledgeIndex(args.index)
+        started = time.perf_counter()
+        hits = index.search(args.question, k=args.k)
+        print(f"{len(hits)} hits in {(time.perf_counter() - started) * 1000:.1f} ms")
+        for hit in hits:
+            preview = hit["text"] if len(hit["text"]) <= 200 else hit["text"][:200] + "..."
+            print(f"\n[{hit['score']:.3f}] {hit['source']} - {hit['heading']}\n{preview}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Memoized, sanitized markdown rendering that can run on a thread pool."""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+from html.parser import HTMLParser
+
+import markdown2
+
+MARKDOWN_EXTRAS = ["tables", "fenced-code-blocks", "strike", "cuddled-lists"]
+
+ALLOWED_TAGS = {
+    "a", "b", "blockquote", "br", "code", "del", "em", "h1", "h2", "h3", "h4", "h5", "h6",
+    "hr", "i", "li", "ol", "p", "pre", "s", "strong", "sub", "sup", "table", "tbody", "td",
+    "th", "thead", "tr", "ul",
+}
+VOID_TAGS = {"br", "hr"}
+ALLOWED_ATTRIBUTES = {"a": {"href", "title"}, "td": {"align", "style"}, "th": {"align", "style"}}
+# Table cells only ever get column alignment from the tables extra
+ALLOWED_STYLE = re.compile(r"^\s*text-align:\s*(left|right|center);?\s*$")
+ALLOWED_SCHEMES = ("http://", "https://", "mailto:")
+# Dropped together with everything inside them
+DROP_CONTENT_TAGS = {"script", "style", "iframe", "object", "embed", "template", "textarea"}
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.out = []
+        self.open_tags = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.skip_depth += 1
+            return
+        if self.skip_depth or tag not in ALLOWED_TAGS:
+            return
+        allowed = ALLOWED_ATTRIBUTES.get(tag, set())
+        parts = [tag]
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name == "href" and not value.strip().lower().startswith(ALLOWED_SCHEMES):
+                continue
+            if name == "style" and not ALLOWED_STYLE.match(value):
+                continue
+            parts.append(f'{name}="{escape(value, quote=True)}"')
+        if tag == "a":
+            parts.append('rel="nofollow noopener noreferrer"')
+        self.out.append(f"<{' '.join(parts)}>")
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+            return
+        if self.skip_depth or tag not in self.open_tags:
+            return
+        # Close anything left open inside this element so the output stays balanced
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.out.append(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.out.append(escape(data, quote=False))
+
+    def handle_entityref(self, name):
+        if not self.skip_depth:
+            self.out.append(f"&{name};")
+
+    def handle_charref(self, name):
+        if not self.skip_depth:
+            self.out.append(f"&#{name};")
+
+    def result(self):
+        self.close()
+        self.out.extend(f"</{tag}>" for tag in reversed(self.open_tags))
+        return "".join(self.out)
+
+
+def sanitize_html(html):
+    """Strip everything but a small allowlist of formatting tags and safe links."""
+    parser = _Sanitizer()
+    parser.feed(html)
+    return parser.result()
+
+
+def markdown2_backend(text):
+    return markdown2.markdown(text, extras=MARKDOWN_EXTRAS)
+
+
+class MarkdownRenderer:
+    """Renders markdown to sanitized HTML, memoized by content hash.
+
+    ``render`` works inline; ``submit`` runs the same work on a small pool
+    and returns a Future, for callers that must not block (the asyncio path).
+    """
+
+    def __init__(self, backend=markdown2_backend, cache_size=1024, max_workers=2):
+        self.backend = backend
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="markdown")
+
+    def render(self, text):
+        key = hashlib.sha256(text.encode("utf-8")).digest()
+        with self._lock:
+            html = self._cache.get(key)
+            if html is not None:
+                self._cache.move_to_end(key)
+                return html
+        html = sanitize_html(self.backend(text))
+        with self._lock:
+            self._cache[key] = html
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return html
+
+    def submit(self, text):
+        return self._executor.submit(self.render, text)
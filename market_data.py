@@ -0,0 +1,180 @@
+"""Market quotes and rates for the tool-calling flow.
+
+A provider answers a batch of symbols (tickers, currency pairs, rate series
+such as US10Y) in one request. CachedMarketData sits in front of it: fresh
+quotes come from a TTL cache, and the misses of tool calls that run in
+parallel are merged into a single provider request.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+
+class MarketDataError(Exception):
+    pass
+
+
+class MarketDataProvider:
+    """Interface: ``quotes(symbols)`` returns ``{symbol: quote}`` for the symbols it knows.
+
+    A quote is a JSON object, typically ``price`` (or ``rate``), ``currency``,
+    ``change_pct`` and ``as_of``. Unknown symbols are left out.
+    """
+
+    # Most quote APIs cap the symbols per request
+    max_batch = 50
+
+    def quotes(self, symbols):
+        raise NotImplementedError
+
+
+class LocalMarketData(MarketDataProvider):
+    """Quotes from a JSON file of ``{symbol: quote}``, reread when it changes; for offline runs."""
+
+    def __init__(self, path):
+        self.path = path
+        self._mtime = None
+        self._quotes = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            raise MarketDataError(f"Market data file unavailable: {e}")
+        with self._lock:
+            if mtime != self._mtime:
+                with open(self.path, encoding="utf-8") as f:
+                    self._quotes = {symbol.upper(): quote for symbol, quote in json.load(f).items()}
+                self._mtime = mtime
+            return self._quotes
+
+    def quotes(self, symbols):
+        known = self._load()
+        return {symbol: known[symbol] for symbol in symbols if symbol in known}
+
+
+class HttpMarketData(MarketDataProvider):
+    """A quote API answering ``GET url?symbols=A,B`` with ``{symbol: quote}``."""
+
+    def __init__(self, url, api_key=None, timeout=3.0, max_batch=50):
+        self.url = url
+        self.timeout = timeout
+        self.max_batch = max_batch
+        self.session = requests.Session()
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def quotes(self, symbols):
+        try:
+            response = self.session.get(self.url, params={"symbols": ",".join(symbols)}, timeout=self.timeout)
+            response.raise_for_status()
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise MarketDataError(f"Market data request failed: {e}")
+        return {symbol.upper(): quote for symbol, quote in body.items()}
+
+
+def create_provider(kind, **options):
+    """Build a provider from a backend name (``local`` or ``http``)."""
+    if kind == "local":
+        return LocalMarketData(options["path"])
+    if kind == "http":
+        return HttpMarketData(options["url"], api_key=options.get("api_key"),
+                              timeout=options.get("timeout", 3.0))
+    raise ValueError(f"Unknown market data provider: {kind}")
+
+
+class _Batch:
+    def __init__(self):
+        self.symbols = set()
+        self.done = threading.Event()
+        self.result = {}
+        self.error = None
+
+
+class CachedMarketData:
+    """TTL + LRU cache in front of a provider that batches concurrent misses.
+
+    The first miss opens a batch and waits ``batch_window`` seconds for other
+    lookups to add their symbols, then fetches the lot in ``max_batch``
+    sized requests. Quotes are kept for ``ttl`` seconds.
+    """
+
+    def __init__(self, provider, ttl=60.0, max_entries=4096, batch_window=0.005):
+        self.provider = provider
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.batch_window = batch_window
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self._entries = OrderedDict()
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def quotes(self, symbols, timeout=None):
+        """``{symbol: quote}`` for the known ``symbols``, waiting at most ``timeout`` for a fetch."""
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for symbol in symbols:
+                entry = self._entries.get(symbol)
+                if entry is not None and entry[1] > now:
+                    self._entries.move_to_end(symbol)
+                    found[symbol] = entry[0]
+                else:
+                    missing.append(symbol)
+            self.hits += len(found)
+            self.misses += len(missing)
+            if not missing:
+                return found
+            batch = self._pending
+            leader = batch is None
+            if leader:
+                batch = self._pending = _Batch()
+            batch.symbols.update(missing)
+
+        if leader:
+            self._fetch(batch)
+        elif not batch.done.wait(timeout):
+            raise MarketDataError(f"Timed out after {timeout}s waiting for market data")
+        if batch.error is not None:
+            raise batch.error
+        found.update((symbol, batch.result[symbol]) for symbol in missing if symbol in batch.result)
+        return found
+
+    def _fetch(self, batch):
+        try:
+            if self.batch_window:
+                time.sleep(self.batch_window)
+            with self._lock:
+                # Later misses open the next batch
+                self._pending = None
+                symbols = sorted(batch.symbols)
+            size = self.provider.max_batch
+            for start in range(0, len(symbols), size):
+                self.fetches += 1
+                batch.result.update(self.provider.quotes(symbols[start:start + size]))
+            self._remember(batch.result)
+        except Exception as e:
+            batch.error = e if isinstance(e, MarketDataError) else MarketDataError(f"Market data lookup failed: {e}")
+        finally:
+            batch.done.set()
+
+    def _remember(self, quotes):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for symbol, quote in quotes.items():
+                self._entries[symbol] = (quote, expires)
+                self._entries.move_to_end(symbol)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "fetches": self.fetches, "entries": len(self._entries)}
@@ -0,0 +1,197 @@
+"""Opt-in profiling of where a request's time goes.
+
+A request is profiled when it carries ``X-Profile: <PROFILE_TOKEN>`` or is
+picked at PROFILE_SAMPLE_RATE. Code marks its stages with ``stage(name)``,
+which costs a context-variable lookup on unprofiled requests. For profiled
+ones the wall and CPU time of every stage goes back in a ``Server-Timing``
+header and into the log.
+
+Requests with the token may also send ``X-Profile-Capture: cprofile`` for
+a pstats dump, or ``stacks`` for sampled collapsed stacks (the input of
+flamegraph.pl and speedscope), written to PROFILE_DIR under the request id.
+"""
+import contextlib
+import contextvars
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from logging_setup import request_id_var
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("profile", default=None)
+_NOT_PROFILED = contextlib.nullcontext()
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class RequestProfile:
+    """Wall and CPU time per stage of one request; a stage nested in itself is timed once."""
+
+    def __init__(self):
+        self.stages = {}
+        self._active = set()
+        self.started = time.perf_counter()
+        self.cpu_started = time.thread_time()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if name in self._active:
+            yield
+            return
+        self._active.add(name)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self._active.discard(name)
+            # CPU time is this thread's only; work handed to a pool shows as wall time
+            entry = self.stages.setdefault(name, [0.0, 0.0, 0])
+            entry[0] += time.perf_counter() - wall
+            entry[1] += time.thread_time() - cpu
+            entry[2] += 1
+
+    def timings(self):
+        """``{stage: {"wall_ms", "cpu_ms", "calls"}}``, with the whole request as ``total``."""
+        result = {name: {"wall_ms": round(wall * 1000, 2), "cpu_ms": round(cpu * 1000, 2), "calls": calls}
+                  for name, (wall, cpu, calls) in self.stages.items()}
+        result["total"] = {
+            "wall_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "cpu_ms": round((time.thread_time() - self.cpu_started) * 1000, 2),
+            "calls": 1,
+        }
+        return result
+
+
+def server_timing(timings):
+    """A ``Server-Timing`` header value; browsers show it in the network panel."""
+    return ", ".join(f'{name};dur={timing["wall_ms"]};desc="cpu {timing["cpu_ms"]}ms"'
+                     for name, timing in timings.items())
+
+
+def stage(name):
+    """Time the enclosed block as ``name`` when the current request is being profiled."""
+    profile = _current.get()
+    return _NOT_PROFILED if profile is None else profile.stage(name)
+
+
+def collapse(frame):
+    """A frame's stack in collapsed form, outermost first: ``file:function;file:function``."""
+    names = []
+    while frame is not None:
+        names.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Samples one thread's stack every ``interval`` seconds and counts the collapsed stacks."""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[collapse(frame)] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+
+class ProfilingMiddleware:
+    """WSGI middleware that profiles the requests picked by token or by sampling.
+
+    It wraps the whole Flask app, so session loading and saving and the
+    after_request hooks are inside the measured time. Streamed bodies are
+    generated after the headers are sent, so only their setup is timed.
+    """
+
+    def __init__(self, app, token=None, sample_rate=0.0, output_dir="profiles", stack_interval=0.005):
+        self.app = app
+        self.token = token
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.stack_interval = stack_interval
+
+    def _selected(self, environ):
+        """``(profiled, capture)`` for a request; only the token may ask for a capture."""
+        header = environ.get("HTTP_X_PROFILE")
+        if header and self.token and hmac.compare_digest(header.encode("utf-8"), self.token.encode("utf-8")):
+            return True, environ.get("HTTP_X_PROFILE_CAPTURE")
+        return self.sample_rate > 0 and random.random() < self.sample_rate, None
+
+    def _start_capture(self, capture):
+        if capture == "stacks":
+            return StackSampler(threading.get_ident(), self.stack_interval).start()
+        if capture == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e:
+                # Newer Pythons allow one cProfile at a time per process
+                logger.warning(f"cProfile capture skipped: {e}")
+                return None
+            return profiler
+        return None
+
+    def _save_capture(self, capturer):
+        os.makedirs(self.output_dir, exist_ok=True)
+        # The request id may come from the client; only use it as a file name when it is harmless
+        name = request_id_var.get()
+        base = os.path.join(self.output_dir, name if _SAFE_NAME.match(name) else uuid.uuid4().hex)
+        if isinstance(capturer, StackSampler):
+            path = f"{base}.folded"
+            samples = capturer.stop()
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+        else:
+            capturer.disable()
+            path = f"{base}.prof"
+            capturer.dump_stats(path)
+        return path
+
+    def __call__(self, environ, start_response):
+        profiled, capture = self._selected(environ)
+        if not profiled:
+            return self.app(environ, start_response)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        capturer = self._start_capture(capture)
+        timings = {}
+
+        def profiled_start_response(status, headers, exc_info=None):
+            timings.update(profile.timings())
+            return start_response(status, list(headers) + [("Server-Timing", server_timing(timings))], exc_info)
+
+        try:
+            return self.app(environ, profiled_start_response)
+        finally:
+            path = self._save_capture(capturer) if capturer is not None else None
+            _current.reset(token)
+            logger.info("Request profile", extra={
+                "path": environ.get("PATH_INFO"),
+                "stages": timings or profile.timings(),
+                "capture": path,
+            })
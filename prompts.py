@@ -0,0 +1,39 @@
+"""Prompt and request settings shared by the web app and the batch CLI."""
+import os
+
+from context_builder import ContextBuilder
+
+SYSTEM_PROMPT = "You are a helpful and professional financial assistant. Only answer finance, investment, or economics-related questions. Provide clear, accurate, and helpful information."
+
+CHAT_TEMPERATURE = 0.7
+CHAT_MAX_TOKENS = 800
+
+
+def chat_payload(messages):
+    """Wrap built ``messages`` in the chat-completions request body."""
+    return {
+        "messages": messages,
+        "temperature": CHAT_TEMPERATURE,
+        "max_tokens": CHAT_MAX_TOKENS
+    }
+
+
+def build_context_builder(store, summarize=None):
+    """The ContextBuilder for ``store``, configured from the environment, knowledge index included."""
+    # Product docs and glossary, indexed offline with `python knowledge.py build`
+    knowledge = None
+    if os.getenv("KNOWLEDGE_INDEX_PATH"):
+        # Imported here so NumPy is only loaded when an index is configured
+        from knowledge import KnowledgeIndex
+        knowledge = KnowledgeIndex(os.getenv("KNOWLEDGE_INDEX_PATH"))
+
+    return ContextBuilder(
+        store,
+        SYSTEM_PROMPT,
+        summarize=summarize,
+        token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000")),
+        recent_turns=int(os.getenv("CONTEXT_RECENT_TURNS", "6")),
+        knowledge=knowledge,
+        knowledge_top_k=int(os.getenv("KNOWLEDGE_TOP_K", "4")),
+        knowledge_budget=int(os.getenv("KNOWLEDGE_TOKEN_BUDGET", "600")),
+    )
@@ -0,0 +1,104 @@
+"""TTL + LRU cache of finished replies, with an optional SQLite tier."""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text):
+    """Fold case, whitespace and trailing punctuation so trivial variants share an entry."""
+    return _WHITESPACE.sub(" ", text).strip().rstrip("?!. ").lower()
+
+
+def cache_key(messages, context_turns=2):
+    """Key a built ``messages`` list on its system prompt, user prompt and context tail."""
+    system_prompt = messages[0]["content"]
+    user_prompt = normalize_prompt(messages[-1]["content"])
+    tail = messages[1:-1][-context_turns:] if context_turns else []
+    tail_hash = hashlib.sha256(json.dumps(tail, sort_keys=True).encode("utf-8")).hexdigest()
+    raw = json.dumps([system_prompt, user_prompt, tail_hash])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Maps a cache key to ``(markdown, html)`` for ``ttl`` seconds."""
+
+    def __init__(self, max_entries=1024, ttl=3600.0, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if path:
+            self._connection().execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " markdown TEXT NOT NULL,"
+                " html TEXT NOT NULL,"
+                " expires REAL NOT NULL)"
+            )
+            self._connection().execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0], entry[1]
+                del self._entries[key]
+
+        if self.path:
+            row = self._connection().execute(
+                "SELECT markdown, html, expires FROM responses WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            if row is not None:
+                self._remember(key, row)
+                with self._lock:
+                    self.hits += 1
+                return row[0], row[1]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, markdown, html):
+        entry = (markdown, html, time.time() + self.ttl)
+        self._remember(key, entry)
+        if self.path:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, markdown, html, expires) VALUES (?, ?, ?, ?)",
+                (key, *entry),
+            )
+            conn.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = tuple(entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
@@ -0,0 +1,399 @@
+// Auto-scroll to bottom of chat only for new messages
+let shouldScrollToBottom = true;
+
+function scrollToBottom() {
+    const chatHistory = document.getElementById('chatHistory');
+    if (shouldScrollToBottom) {
+        chatHistory.scrollTop = chatHistory.scrollHeight;
+    }
+}
+
+// Check if user has scrolled up
+function checkScroll() {
+    const chatHistory = document.getElementById('chatHistory');
+    const threshold = 100; // pixels from bottom
+    shouldScrollToBottom = (chatHistory.scrollTop + chatHistory.clientHeight + threshold >= chatHistory.scrollHeight);
+}
+
+// Clear chat history
+function clearChat() {
+    if (confirm('Are you sure you want to clear the chat history?')) {
+        fetch('/clear', { method: 'POST' })
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'success') {
+                    location.reload();
+                }
+            })
+            .catch(error => {
+                console.error('Error clearing chat:', error);
+                location.reload();
+            });
+    }
+}
+
+// Fetch the page of turns before the cursor and prepend it, keeping the view in place
+let loadingOlder = false;
+
+async function loadOlderTurns() {
+    const chatHistory = document.getElementById('chatHistory');
+    const cursor = chatHistory.dataset.cursor;
+    if (loadingOlder || cursor === undefined || chatHistory.scrollTop > 200) {
+        return;
+    }
+    loadingOlder = true;
+    try {
+        const response = await fetch('/api/history?before=' + encodeURIComponent(cursor));
+        if (!response.ok) {
+            throw new Error('History unavailable');
+        }
+        const data = await response.json();
+        const marker = chatHistory.querySelector('.history-more');
+        const previousHeight = chatHistory.scrollHeight;
+        (marker || chatHistory).insertAdjacentHTML(marker ? 'afterend' : 'afterbegin', data.html);
+        chatHistory.scrollTop += chatHistory.scrollHeight - previousHeight;
+        if (data.cursor === null) {
+            delete chatHistory.dataset.cursor;
+            if (marker) {
+                marker.remove();
+            }
+        } else {
+            chatHistory.dataset.cursor = data.cursor;
+        }
+    } catch (error) {
+        console.error('Error loading earlier messages:', error);
+    } finally {
+        loadingOlder = false;
+    }
+}
+
+// Initialize event listeners
+window.addEventListener('load', function() {
+    const chatHistory = document.getElementById('chatHistory');
+
+    // Add scroll listener to detect if user scrolled up
+    chatHistory.addEventListener('scroll', checkScroll);
+    chatHistory.addEventListener('scroll', loadOlderTurns);
+
+    // Initially scroll to bottom if there are messages
+    const messages = chatHistory.querySelectorAll('.message');
+    if (messages.length > 0) {
+        setTimeout(scrollToBottom, 100);
+    }
+});
+
+function removeEmptyState(chatHistory) {
+    const emptyState = chatHistory.querySelector('.empty-state');
+    if (emptyState) {
+        emptyState.remove();
+    }
+}
+
+// Append server-rendered turns without reloading the page
+function appendTurns(html) {
+    const chatHistory = document.getElementById('chatHistory');
+    removeEmptyState(chatHistory);
+    chatHistory.insertAdjacentHTML('beforeend', html);
+}
+
+// Build a message bubble matching the server-rendered markup
+function appendMessage(role, timestamp) {
+    const chatHistory = document.getElementById('chatHistory');
+    removeEmptyState(chatHistory);
+
+    const message = document.createElement('div');
+    message.className = 'message';
+    if (role === 'user') {
+        message.innerHTML = `
+            <div class="user-message">
+                <div class="message-bubble user-bubble">
+                    <div class="message-content"></div>
+                    <div class="message-time"></div>
+                </div>
+                <div class="message-avatar user-avatar">
+                    <i class="fas fa-user"></i>
+                </div>
+            </div>`;
+    } else {
+        message.innerHTML = `
+            <div class="bot-message">
+                <div class="message-avatar bot-avatar">
+                    <i class="fas fa-robot"></i>
+                </div>
+                <div class="message-bubble bot-bubble">
+                    <div class="markdown message-content"></div>
+                    <div class="message-time"></div>
+                </div>
+            </div>`;
+    }
+    message.querySelector('.message-time').textContent = timestamp || '';
+    chatHistory.appendChild(message);
+    return message;
+}
+
+function formatTime(date) {
+    return date.toLocaleTimeString('en-US', { hour: '2-digit', minute: '2-digit' });
+}
+
+// Render partial markdown; fall back to plain text if the libraries failed to load
+function renderMarkdown(target, text) {
+    if (window.marked && window.DOMPurify) {
+        target.innerHTML = DOMPurify.sanitize(marked.parse(text));
+    } else {
+        target.textContent = text;
+    }
+}
+
+// Read a Server-Sent Events body and call onEvent(name, data) per event
+async function readEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let name = 'message';
+            let data = '';
+            frame.split('\n').forEach(function(line) {
+                if (line.startsWith('event:')) {
+                    name = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            if (data) {
+                onEvent(name, JSON.parse(data));
+            }
+        }
+    }
+}
+
+function showNotice(message) {
+    let notice = document.querySelector('.notice');
+    if (!notice) {
+        const inputArea = document.querySelector('.input-area');
+        notice = document.createElement('div');
+        notice.className = 'notice';
+        inputArea.insertBefore(notice, inputArea.firstChild);
+    }
+    notice.textContent = message;
+}
+
+// A 429 or 504 carries either the stored turns or a notice; the message may already be saved,
+// so never fall back to the form and send it again
+async function handleErrorReply(response, userInput) {
+    let data = {};
+    try {
+        data = await response.json();
+    } catch (error) {
+        // Not a JSON body; fall through to the generic notice
+    }
+    if (data.html) {
+        appendTurns(data.html);
+        scrollToBottom();
+    } else {
+        showNotice(data.message || 'Something went wrong. Please try again.');
+        document.querySelector('.input-field').value = userInput;
+    }
+}
+
+// Stream the reply token by token instead of waiting for the full page
+async function streamChat(form, userInput) {
+    const response = await fetch('/chat/stream', {
+        method: 'POST',
+        body: new URLSearchParams({ user_input: userInput })
+    });
+    if (response.status === 429) {
+        await handleErrorReply(response, userInput);
+        return;
+    }
+    if (!response.ok || !response.body) {
+        throw new Error('Streaming unavailable');
+    }
+
+    appendMessage('user', formatTime(new Date()))
+        .querySelector('.message-content').textContent = userInput;
+    const botMessage = appendMessage('bot', '');
+    const content = botMessage.querySelector('.message-content');
+    content.innerHTML = '<i class="fas fa-ellipsis-h"></i>';
+    scrollToBottom();
+
+    let text = '';
+    let pending = false;
+    const onEvent = function(name, data) {
+        if (name === 'delta') {
+            text += data.content;
+            if (!pending) {
+                pending = true;
+                requestAnimationFrame(function() {
+                    pending = false;
+                    renderMarkdown(content, text);
+                    scrollToBottom();
+                });
+            }
+        } else if (name === 'done') {
+            content.innerHTML = data.html;
+            botMessage.querySelector('.message-time').textContent = data.timestamp;
+        } else if (name === 'error') {
+            content.textContent = data.message;
+            botMessage.querySelector('.message-time').textContent = formatTime(new Date());
+        }
+    };
+    try {
+        await readEvents(response, onEvent);
+    } catch (error) {
+        // The user turn is already saved, so don't resubmit the form
+        console.error('Stream interrupted:', error);
+        content.textContent = '❌ Sorry, the response was interrupted. Please try again.';
+    }
+    scrollToBottom();
+}
+
+// Send the message to the JSON API and append only the new turns
+async function postChat(form, userInput) {
+    const pending = appendMessage('bot', '');
+    pending.querySelector('.message-content').innerHTML = '<i class="fas fa-ellipsis-h"></i>';
+    scrollToBottom();
+
+    let response;
+    try {
+        response = await fetch('/api/chat', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ message: userInput })
+        });
+    } finally {
+        pending.remove();
+    }
+    if (!response.ok) {
+        // Only a failed fetch falls back to a form post
+        await handleErrorReply(response, userInput);
+        return;
+    }
+
+    const data = await response.json();
+    appendTurns(data.html);
+    scrollToBottom();
+}
+
+// Handle form submission
+document.querySelector('form').addEventListener('submit', function(e) {
+    // Set flag to scroll to bottom for new messages
+    shouldScrollToBottom = true;
+
+    const form = this;
+    const input = form.querySelector('.input-field');
+    const userInput = input.value.trim();
+    if (!userInput || !window.fetch) {
+        // Clear the input field after submission
+        setTimeout(function() {
+            input.value = '';
+        }, 100);
+        return;
+    }
+
+    e.preventDefault();
+    const notice = document.querySelector('.notice');
+    if (notice) {
+        notice.remove();
+    }
+    input.value = '';
+    input.disabled = true;
+    const send = (window.ReadableStream && window.TextDecoder) ? streamChat : postChat;
+    send(form, userInput)
+        .catch(function(error) {
+            // Fall back to a regular form post
+            console.error('Sending failed:', error);
+            input.value = userInput;
+            input.disabled = false;
+            form.submit();
+        })
+        .finally(function() {
+            input.disabled = false;
+            input.focus();
+        });
+});
+
+// Auto-resize input field
+const inputField = document.querySelector('.input-field');
+if (inputField) {
+    inputField.addEventListener('input', function() {
+        this.style.height = 'auto';
+        this.style.height = this.scrollHeight + 'px';
+    });
+}
+
+// Add visual feedback for scroll position
+function updateScrollIndicator() {
+    const chatHistory = document.getElementById('chatHistory');
+    const isAtBottom = chatHistory.scrollTop + chatHistory.clientHeight >= chatHistory.scrollHeight - 10;
+
+    if (!isAtBottom && chatHistory.scrollHeight > chatHistory.clientHeight) {
+        if (!document.querySelector('.scroll-indicator')) {
+            const indicator = document.createElement('div');
+            indicator.className = 'scroll-indicator';
+            indicator.innerHTML = '<i class="fas fa-chevron-down"></i>';
+            indicator.style.cssText = `
+                position: absolute;
+                bottom: 80px;
+                right: 30px;
+                background: rgba(102, 126, 234, 0.9);
+                color: white;
+                width: 40px;
+                height: 40px;
+                border-radius: 50%;
+                display: flex;
+                align-items: center;
+                justify-content: center;
+                cursor: pointer;
+                box-shadow: 0 2px 10px rgba(0,0,0,0.2);
+                z-index: 1000;
+                animation: bounce 2s infinite;
+            `;
+            indicator.onclick = function() {
+                shouldScrollToBottom = true;
+                scrollToBottom();
+            };
+            document.querySelector('.container').style.position = 'relative';
+            document.querySelector('.container').appendChild(indicator);
+        }
+    } else {
+        const indicator = document.querySelector('.scroll-indicator');
+        if (indicator) {
+            indicator.remove();
+        }
+    }
+}
+
+// Add bounce animation for scroll indicator
+const style = document.createElement('style');
+style.textContent = `
+    @keyframes bounce {
+        0%, 20%, 50%, 80%, 100% {
+            transform: translateY(0);
+        }
+        40% {
+            transform: translateY(-10px);
+        }
+        60% {
+            transform: translateY(-5px);
+        }
+    }
+`;
+document.head.appendChild(style);
+
+// Update scroll indicator on scroll
+document.addEventListener('DOMContentLoaded', function() {
+    const chatHistory = document.getElementById('chatHistory');
+    if (chatHistory) {
+        chatHistory.addEventListener('scroll', updateScrollIndicator);
+        setTimeout(updateScrollIndicator, 500);
+    }
+});
@@ -0,0 +1,19 @@
+"""Malformed input lines are skipped and reported, not fatal.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import read_questions  # noqa: E402
+
+
+def test_malformed_lines_are_skipped(tmp_path):
+    path = tmp_path / "questions.jsonl"
+    path.write_text('{"id": "a", "question": "What is a bond?"}\n{"id": "b"}\n[1]\nnot json\n\n'
+                    '{"question": 5}\n{"question": "What is a stock?"}\n', encoding="utf-8")
+    malformed = []
+    assert list(read_questions(path, malformed)) == [("a", "What is a bond?"), ("7", "What is a stock?")]
+    assert malformed == [2, 3, 4, 6]
@@ -0,0 +1,34 @@
+"""Questions the calculators would answer wrongly go to the model.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calc_router import quantities, route  # noqa: E402
+
+
+@pytest.mark.parametrize("question", [
+    "How much will my $2,000 rent cost me over 10 years at 3% increases?",
+    "I earn $80,000 a year; what is $10,000 worth in 10 years at 5%?",
+    "My salary is $90,000. What is the future value of $5,000 at 4% over 15 years?",
+    "Mortgage of $300,000 at 6% for 30 years with $100 extra each month",
+    "Loan of $20,000 at -3% over 5 years",
+])
+def test_left_to_the_model(question):
+    assert route(question) is None
+
+
+def test_rates_keep_their_sign():
+    assert [q.value for q in quantities("-5% a year")] == [-0.05]
+    intent, answer = route("What will $10,000 be worth in 10 years at -5%?")
+    assert intent == "compound"
+    assert answer.startswith("**Future value after 10 years: $6,058.97**")
+
+
+def test_growth_questions_still_compute():
+    assert route("How much will $5,000 grow in 10 years at 5%?")[0] == "compound"
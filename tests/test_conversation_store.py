@@ -0,0 +1,46 @@
+"""The in-memory store builds search indexes outside its lock and pays for them.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation_store import MemoryConversationStore, turn_size  # noqa: E402
+
+
+def fill(store, sid, count):
+    for i in range(count):
+        store.append(sid, ("user", f"turn {i} about escrow", "t"))
+
+
+def test_index_counts_toward_the_budget_and_goes_with_the_conversation():
+    store = MemoryConversationStore()
+    fill(store, "a", 10)
+    turns_bytes = store.total_bytes
+    assert store.search("a", "escrow")
+    assert store.total_bytes == 2 * turns_bytes
+    store.append("a", ("user", "late turn", "t"))
+    assert store.total_bytes == 2 * (turns_bytes + turn_size(("user", "late turn", "t")))
+    store.clear("a")
+    assert store.total_bytes == 0
+
+
+def test_turns_appended_during_the_build_are_indexed():
+    store = MemoryConversationStore()
+    fill(store, "a", 3)
+    snapshot = store.turns("a")
+    store.append("a", ("user", "appended meanwhile", "t"))
+    index = store._build_index("a", store.generation("a"), snapshot)
+    assert [hit["cursor"] for hit in index.search("meanwhile")] == [4]
+
+
+def test_build_for_a_cleared_conversation_is_discarded():
+    store = MemoryConversationStore()
+    fill(store, "a", 3)
+    generation, snapshot = store.generation("a"), store.turns("a")
+    store.clear("a")
+    fill(store, "a", 1)
+    assert store._build_index("a", generation, snapshot) is None
+    assert len(store.search("a", "escrow")) == 1
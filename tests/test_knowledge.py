@@ -0,0 +1,33 @@
+"""Chunking rejects overlaps it cannot advance past; embedding keeps no memo.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge import HashingEmbedder, split_document  # noqa: E402
+
+
+def test_overlap_as_large_as_the_window_is_rejected():
+    with pytest.raises(ValueError):
+        split_document("word " * 50, "doc.md", max_words=10, overlap=10)
+
+
+def test_long_paragraphs_are_windowed():
+    chunks = split_document(" ".join(str(i) for i in range(25)), "doc.md", max_words=10, overlap=2)
+    assert [chunk["text"].split()[0] for chunk in chunks] == ["0", "8", "16"]
+
+
+def test_queries_leave_no_memo_behind():
+    embedder = HashingEmbedder(dim=16)
+    first = embedder.embed(["compound interest on savings"])
+    assert vars(embedder) == {"dim": 16, "name": "hashing-16"}
+    slots = {}
+    shared = embedder.embed_tokens([["compound", "interest", "savings"]], slots)
+    assert len(slots) == 5
+    assert np.allclose(first, shared)
@@ -0,0 +1,28 @@
+"""Collectors copy outside statistics into the registry at scrape time.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Registry  # noqa: E402
+
+
+def test_collectors_run_before_every_render():
+    registry = Registry()
+    hits = registry.counter("cache_lookups", "Lookups.", ["result"])
+    size = registry.gauge("cache_entries", "Entries.")
+    stats = {"hits": 3, "size": 2}
+
+    @registry.collect
+    def export():
+        hits.set(stats["hits"], result="hit")
+        size.set(stats["size"])
+
+    assert 'cache_lookups_total{result="hit"} 3' in registry.render()
+    stats.update(hits=5, size=1)
+    text = registry.render()
+    assert 'cache_lookups_total{result="hit"} 5' in text
+    assert "cache_entries 1" in text
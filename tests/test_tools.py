@@ -0,0 +1,43 @@
+"""Tool calls made in a streamed completion run before the answer is streamed.
+
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import ToolRunner  # noqa: E402
+from upstream import merge_tool_call_deltas  # noqa: E402
+
+
+def test_fragments_merge_into_whole_calls():
+    calls = []
+    merge_tool_call_deltas(calls, [{"index": 0, "id": "call_0", "function": {"name": "get_quotes", "arguments": '{"sym'}}])
+    merge_tool_call_deltas(calls, [{"index": 0, "function": {"arguments": 'bols": ["AAPL"]}'}}])
+    assert calls == [{"id": "call_0", "type": "function",
+                      "function": {"name": "get_quotes", "arguments": '{"symbols": ["AAPL"]}'}}]
+
+
+def test_stream_runs_the_tool_round_then_streams_the_answer():
+    runner = ToolRunner({"get_quotes": ({"type": "function"}, lambda symbols: {"quotes": {s: 1.0 for s in symbols}})})
+    payloads = []
+
+    def open_stream(payload, tool_calls):
+        payloads.append(payload)
+        if len(payloads) == 1:
+            tool_calls.append({"id": "call_0", "type": "function",
+                               "function": {"name": "get_quotes", "arguments": json.dumps({"symbols": ["AAPL"]})}})
+            return
+        yield "AAPL is "
+        yield "1.0"
+
+    outcome = {}
+    try:
+        assert "".join(runner.stream(open_stream, {"messages": []}, outcome=outcome)) == "AAPL is 1.0"
+    finally:
+        runner.close()
+    assert outcome == {"tool_rounds": 1}
+    assert [m["role"] for m in payloads[1]["messages"]] == ["assistant", "tool"]
+    assert json.loads(payloads[1]["messages"][1]["content"]) == {"quotes": {"AAPL": 1.0}}
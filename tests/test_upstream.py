@@ -0,0 +1,89 @@
+"""The half-open probe is released however the probing attempt ends.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deadline import Cancelled, Deadline  # noqa: E402
+from upstream import PROBE, AsyncUpstreamClient, CircuitBreaker, UpstreamClient, UpstreamError  # noqa: E402
+
+URL = "http://upstream.invalid/chat"
+PAYLOAD = {"messages": [{"role": "user", "content": "hi"}]}
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+
+    def close(self):
+        pass
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "half-open"
+    return breaker
+
+
+def sync_client(post):
+    client = UpstreamClient(URL, {}, max_retries=0, breaker=half_open_breaker())
+    client.session.post = post
+    return client
+
+
+def test_throttled_probe_closes_the_breaker():
+    client = sync_client(lambda *args, **kwargs: FakeResponse(429))
+    with pytest.raises(UpstreamError):
+        client.chat_completion(PAYLOAD)
+    assert client.breaker.state == "closed"
+    assert client.breaker.allow() is True
+
+
+def test_probe_cancelled_by_the_deadline_is_released():
+    def post(*args, **kwargs):
+        time.sleep(0.1)
+        raise requests.Timeout("read timed out")
+
+    client = sync_client(post)
+    with pytest.raises(Cancelled):
+        client.chat_completion(PAYLOAD, deadline=Deadline(0.05))
+    assert client.breaker.allow() == PROBE
+
+
+def test_probe_ending_in_an_unexpected_error_is_released():
+    def post(*args, **kwargs):
+        raise ValueError("bad payload")
+
+    client = sync_client(post)
+    with pytest.raises(ValueError):
+        client.chat_completion(PAYLOAD)
+    assert client.breaker.allow() == PROBE
+
+
+def test_async_probe_cancelled_by_a_disconnect_is_released():
+    async def scenario():
+        client = AsyncUpstreamClient(URL, {}, max_retries=0, breaker=half_open_breaker())
+
+        async def post(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        client.client.post = post
+        task = asyncio.ensure_future(client.chat_completion(PAYLOAD))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await client.aclose()
+        return client.breaker
+
+    assert asyncio.run(scenario()).allow() == PROBE
@@ -0,0 +1,49 @@
+"""Routing follows the configured weights until latency samples exist.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from upstream import CircuitBreaker, UpstreamError  # noqa: E402
+from upstream_router import Backend, UpstreamRouter  # noqa: E402
+
+
+class FakeClient:
+    def __init__(self, fail=False):
+        self.breaker = CircuitBreaker()
+        self.fail = fail
+        self.calls = 0
+
+    def stream_chat_completion(self, payload, deadline=None, tool_calls=None):
+        self.calls += 1
+        if self.fail:
+            raise UpstreamError("Upstream returned HTTP 503", status_code=503)
+        yield "hello"
+
+
+def test_streamed_calls_record_a_latency_sample():
+    backend = Backend("a", FakeClient())
+    router = UpstreamRouter([backend], explore=0)
+    assert list(router.stream_chat_completion({})) == ["hello"]
+    assert backend.latency is not None
+
+
+def test_untried_backends_split_by_weight():
+    light, heavy = Backend("light", FakeClient(), weight=1), Backend("heavy", FakeClient(), weight=9)
+    router = UpstreamRouter([light, heavy], explore=0)
+    firsts = [router.order()[0] for _ in range(2000)]
+    assert 0.85 < firsts.count(heavy) / len(firsts) < 0.95
+
+
+def test_untried_backend_that_failed_once_is_still_tried():
+    flaky, other = Backend("flaky", FakeClient(fail=True)), Backend("other", FakeClient())
+    router = UpstreamRouter([flaky, other], explore=0)
+    flaky.record(error=True)
+    other.record(latency=0.5)
+    assert router.order()[0] is flaky
+    assert list(router.stream_chat_completion({})) == ["hello"]
+    # Two failures in a row are not yet enough to shelve it
+    assert flaky.cost() == 0.0
@@ -0,0 +1,211 @@
+"""Chat-completions tool calling: the market-data tool and the loop that runs it.
+
+When the model answers with several ``tool_calls`` they are executed at
+once on a thread pool, and their results go back in the next request, so a
+question about five tickers costs one extra round-trip rather than five.
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+MAX_SYMBOLS = 20
+_SYMBOL = re.compile(r"^[A-Z0-9.^=/-]{1,15}$")
+
+QUOTES_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "get_quotes",
+        "description": "Latest market data for stock or ETF tickers, currency pairs (EURUSD) and rate "
+                       "series (US10Y, FEDFUNDS, MORTGAGE30). Use it for any question about current "
+                       "prices, yields or rates, and ask for every symbol you need in one call.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "symbols": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Symbols in upper case, e.g. [\"AAPL\", \"US10Y\"].",
+                },
+            },
+            "required": ["symbols"],
+        },
+    },
+}
+
+
+def market_data_tools(market_data, timeout=5.0):
+    """Tools backed by a CachedMarketData, as ``{name: (definition, function)}``."""
+
+    def get_quotes(symbols):
+        requested = []
+        for symbol in symbols if isinstance(symbols, list) else [symbols]:
+            symbol = str(symbol).strip().upper()
+            if _SYMBOL.match(symbol) and symbol not in requested:
+                requested.append(symbol)
+        requested = requested[:MAX_SYMBOLS]
+        found = market_data.quotes(requested, timeout=timeout)
+        return {"quotes": found, "unknown": [symbol for symbol in requested if symbol not in found]}
+
+    return {"get_quotes": (QUOTES_TOOL, get_quotes)}
+
+
+class ToolRunner:
+    """Runs the tool calls of a completion on a pool and feeds the results back to the model.
+
+    ``converse`` repeats completion and tool execution until the model
+    answers in text, for at most ``max_rounds`` rounds of tool calls.
+    """
+
+    def __init__(self, tools, max_workers=8, max_rounds=3, call_timeout=10.0, on_call=None):
+        self.tools = tools
+        self.max_rounds = max_rounds
+        self.call_timeout = call_timeout
+        self.on_call = on_call
+        self.definitions = [definition for definition, _ in tools.values()]
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+
+    def _call(self, call):
+        name = call["function"]["name"]
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            if name not in self.tools:
+                status = "unknown"
+                return {"error": f"Unknown tool: {name}"}
+            try:
+                arguments = json.loads(call["function"].get("arguments") or "{}")
+            except json.JSONDecodeError:
+                status = "bad_arguments"
+                return {"error": "Arguments are not valid JSON"}
+            try:
+                return self.tools[name][1](**arguments)
+            except Exception as e:
+                # The model gets the error and can answer without the data
+                status = "error"
+                logger.warning(f"Tool {name} failed: {e}")
+                return {"error": str(e)}
+        finally:
+            if self.on_call is not None:
+                self.on_call(name, status, time.perf_counter() - started)
+
+    def submit(self, calls):
+        return [self._pool.submit(self._call, call) for call in calls]
+
+    def _timeout(self, deadline):
+        if deadline is None:
+            return self.call_timeout
+        deadline.check("tools")
+        return deadline.timeout(self.call_timeout)
+
+    def _results(self, calls, futures):
+        messages = []
+        for call, future in zip(calls, futures):
+            # A call still running past the timeout is abandoned; the model is told so
+            result = future.result() if future.done() else {"error": "Timed out"}
+            messages.append({"role": "tool", "tool_call_id": call["id"], "content": json.dumps(result)})
+        return messages
+
+    def run(self, calls, deadline=None):
+        """Execute ``calls`` in parallel and return their ``tool`` messages, in order."""
+        futures = self.submit(calls)
+        wait(futures, timeout=self._timeout(deadline))
+        return self._results(calls, futures)
+
+    async def arun(self, calls, deadline=None):
+        futures = self.submit(calls)
+        await asyncio.wait([asyncio.wrap_future(future) for future in futures], timeout=self._timeout(deadline))
+        return self._results(calls, futures)
+
+    def _start(self, payload):
+        return dict(payload, tools=self.definitions)
+
+    def _next(self, payload, rounds, result):
+        """The follow-up payload for a round that called tools, or None when ``result`` is the answer."""
+        message = result["choices"][0]["message"]
+        if not message.get("tool_calls") or rounds >= self.max_rounds:
+            result["tool_rounds"] = rounds
+            return None
+        payload = dict(payload, messages=payload["messages"] + [message])
+        if rounds + 1 == self.max_rounds:
+            # Out of rounds: the next answer has to be text
+            payload["tool_choice"] = "none"
+        return payload
+
+    def converse(self, complete, payload, deadline=None):
+        """Run ``complete(payload)`` with the tools offered, executing calls until a text answer.
+
+        Returns the final completion with ``tool_rounds`` set to the number of
+        rounds that called tools; replies built on live data should not be cached.
+        """
+        payload = self._start(payload)
+        started = time.perf_counter()
+        executed = 0
+        for rounds in range(self.max_rounds + 1):
+            result = complete(payload)
+            next_payload = self._next(payload, rounds, result)
+            if next_payload is None:
+                break
+            calls = next_payload["messages"][-1]["tool_calls"]
+            next_payload["messages"] = next_payload["messages"] + self.run(calls, deadline)
+            executed += len(calls)
+            payload = next_payload
+        self._log(result, executed, started)
+        return result
+
+    def stream(self, open_stream, payload, deadline=None, outcome=None):
+        """Yield the answer's content deltas, running tool calls between streamed requests.
+
+        ``open_stream(payload, tool_calls)`` yields content deltas and fills the
+        ``tool_calls`` list with the calls the model made. ``outcome``, if given,
+        gets ``tool_rounds`` set as on the result of ``converse``.
+        """
+        payload = self._start(payload)
+        started = time.perf_counter()
+        executed = 0
+        for rounds in range(self.max_rounds + 1):
+            calls = []
+            yield from open_stream(payload, calls)
+            result = {"choices": [{"message": {"role": "assistant", "content": None, "tool_calls": calls}}]}
+            next_payload = self._next(payload, rounds, result)
+            if next_payload is None:
+                break
+            next_payload["messages"] = next_payload["messages"] + self.run(calls, deadline)
+            executed += len(calls)
+            payload = next_payload
+        if outcome is not None:
+            outcome["tool_rounds"] = result["tool_rounds"]
+        self._log(result, executed, started)
+
+    async def aconverse(self, complete, payload, deadline=None):
+        payload = self._start(payload)
+        started = time.perf_counter()
+        executed = 0
+        for rounds in range(self.max_rounds + 1):
+            result = await complete(payload)
+            next_payload = self._next(payload, rounds, result)
+            if next_payload is None:
+                break
+            calls = next_payload["messages"][-1]["tool_calls"]
+            next_payload["messages"] = next_payload["messages"] + await self.arun(calls, deadline)
+            executed += len(calls)
+            payload = next_payload
+        self._log(result, executed, started)
+        return result
+
+    def _log(self, result, executed, started):
+        if executed:
+            # End-to-end time of the turn, model rounds included
+            logger.info("Tool conversation finished", extra={
+                "tool_rounds": result["tool_rounds"],
+                "tool_calls": executed,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
@@ -0,0 +1,124 @@
+"""Local pre-filter that turns away clearly off-topic questions.
+
+Two token tries, one of finance phrases and one of common off-topic
+subjects, are built once at import. A question is scanned once against
+both, and a small logistic model combines the match counts with a few
+surface features. Only confident off-topic scores are rejected. Questions
+with no evidence either way, such as greetings or "what about 6%?"
+follow-ups, score near the bias and go to the model as before.
+"""
+import math
+import re
+
+FINANCE_PHRASES = """
+401k, 401 k, 403b, 529 plan, accrued interest, accounting, accountant, afford, affordable, amortization, amortize,
+annuity, apr, apy, arbitrage, asset, assets, asset allocation, audit, balance sheet, bank, banking, bank account,
+bankrupt, bankruptcy, basis point, bear market, beta, bill, bills, bitcoin, bond, bonds, borrow, borrowing,
+brokerage, broker, budget, budgeting, bull market, buy, buyback, buying, capital, capital gains, cash flow, cd,
+certificate of deposit, checking account, collateral, commodity, commodities, compound, compounding,
+consumer price index, cost, costs, cpa, cpi, credit, credit card, credit score, crypto, cryptocurrency, currency,
+day trading, debt, debts, deduct, deductible, deduction, default, deficit, deflation, deposit, depreciation,
+derivative, derivatives, dividend, dividends, dollar cost averaging, dow jones, down payment, earnings, ebitda,
+economic, economics, economist, economy, emergency fund, equity, escrow, estate planning, etf, etfs, exchange rate,
+expense ratio, expensive, fed, federal reserve, fico, finance, finances, financial, fiscal, forex, fund, funds,
+futures, gdp, gold, hedge fund, heloc, home equity, housing market, income, income tax, index fund, inflation,
+insurance, insurer, insurers, interest, interest rate, interest rates, invest, investing, investment, investments,
+investor, invoice, ipo, ira, irr, lend, lender, lending, leverage, liability, liabilities, liquidity, loan, loans,
+margin, market cap, markets, monetary policy, money, mortgage, mutual fund, nasdaq, net worth, npv, options,
+overvalued, paycheck, payroll, pension, portfolio, premium, price, prices, pricing, principal, profit, purchase,
+rebalance, rebalancing, recession, refinance, rent, retire, retirement, return, returns, revenue, roi, roth,
+roth ira, s p 500, salary, save, saving, savings, savings account, securities, sell, selling, shares, short selling,
+social security, spend, spending, stock, stocks, stock market, tariff, tariffs, tax, taxes, trade deficit, trading,
+treasury, treasuries, undervalued, unemployment, valuation, venture capital, volatility, wage, wages, wall street,
+wealth, withdrawal, yield, yields
+"""
+
+OFF_TOPIC_PHRASES = """
+recipe, recipes, cook, cooking, bake, baking, dessert, cake, pizza, pasta, dinner, lunch, breakfast, vegan,
+football, soccer, basketball, baseball, nba, nfl, fifa, world cup, tennis, golf, cricket, hockey, olympics,
+movie, movies, film, films, actor, actress, celebrity, tv show, netflix, anime, cartoon, song, songs, lyrics,
+album, singer, concert, guitar, piano, poem, poetry, haiku, fairy tale, novel, joke, jokes, riddle,
+weather, forecast, rain, snow, hurricane, earthquake,
+python, javascript, java, c++, html, css, sql, programming, coding, debug, compile, github,
+minecraft, fortnite, video game, video games, playstation, xbox, nintendo,
+dog, dogs, cat, cats, puppy, kitten, pet, pets, horse, bird,
+doctor, symptoms, disease, medicine, headache, fever, flu, covid, vaccine, pregnancy, diet, calories, workout,
+exercise, gym, yoga, weight loss, muscle,
+garden, gardening, plants, flowers, lawn,
+dating, boyfriend, girlfriend, wedding dress, proposal, love letter, breakup,
+capital of, president of, world war, ancient rome, dinosaur, dinosaurs, planet, planets, galaxy, physics,
+chemistry, biology, photosynthesis, molecule, atom, volcano,
+translate, translation, spanish, french, german, grammar, spelling, essay, homework,
+engine, oil change, tire, tires, makeup, hairstyle, haircut, fashion, outfit
+"""
+
+TOKEN = re.compile(r"[a-z0-9+#]+")
+MONEY = re.compile(r"[$€£¥]|\d\s*%|\b\d+(?:\.\d+)?\s*(?:k|m|bn|million|billion|dollars?|euros?|percent)\b")
+DIGIT = re.compile(r"\d")
+
+# Logistic model over (bias, finance hits, off-topic hits, money or percent, any digit)
+WEIGHTS = (0.5, 2.5, -2.0, 1.5, 0.3)
+MAX_HITS = 3
+
+
+def build_trie(phrases):
+    """Nested dicts keyed by token; a ``None`` key marks the end of a phrase."""
+    root = {}
+    for phrase in phrases.split(","):
+        tokens = TOKEN.findall(phrase.lower())
+        if not tokens:
+            continue
+        node = root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node[None] = True
+    return root
+
+
+def count_matches(trie, tokens):
+    """Count non-overlapping longest phrase matches of ``tokens`` in ``trie``."""
+    hits = i = 0
+    while i < len(tokens):
+        node, j, end = trie, i, None
+        while j < len(tokens) and tokens[j] in node:
+            node = node[tokens[j]]
+            j += 1
+            if None in node:
+                end = j
+        if end is not None:
+            hits += 1
+            i = end
+        else:
+            i += 1
+    return hits
+
+
+FINANCE_TRIE = build_trie(FINANCE_PHRASES)
+OFF_TOPIC_TRIE = build_trie(OFF_TOPIC_PHRASES)
+
+
+class TopicFilter:
+    """Scores how likely a question is about finance; ``is_off_topic`` is the reject decision."""
+
+    def __init__(self, threshold=0.2, weights=WEIGHTS):
+        self.threshold = threshold
+        self.weights = weights
+
+    def features(self, text):
+        text = text.lower()
+        tokens = TOKEN.findall(text)
+        return (
+            1.0,
+            min(count_matches(FINANCE_TRIE, tokens), MAX_HITS),
+            min(count_matches(OFF_TOPIC_TRIE, tokens), MAX_HITS),
+            1.0 if MONEY.search(text) else 0.0,
+            1.0 if DIGIT.search(text) else 0.0,
+        )
+
+    def score(self, text):
+        """Probability that ``text`` is a finance question."""
+        z = sum(w * x for w, x in zip(self.weights, self.features(text)))
+        return 1 / (1 + math.exp(-z))
+
+    def is_off_topic(self, text):
+        return self.score(text) < self.threshold
@@ -0,0 +1,350 @@
+"""Pooled, retrying HTTP client for the Azure OpenAI chat-completions endpoint."""
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from deadline import Cancelled
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth another attempt; everything else in 4xx is the caller's fault
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_AFTER_STATUSES = {429, 503}
+
+
+def merge_tool_call_deltas(calls, deltas):
+    """Fold streamed ``tool_calls`` fragments into ``calls``; a call's arguments arrive in pieces."""
+    for delta in deltas:
+        index = delta.get("index", len(calls))
+        while len(calls) <= index:
+            calls.append({"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+        call = calls[index]
+        if delta.get("id"):
+            call["id"] = delta["id"]
+        function = delta.get("function") or {}
+        call["function"]["name"] += function.get("name") or ""
+        call["function"]["arguments"] += function.get("arguments") or ""
+
+
+class UpstreamError(Exception):
+    """Raised when the upstream call fails for good (after retries)."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised without touching the network while the breaker is open."""
+
+
+# What CircuitBreaker.allow returns for the one call let through while half-open
+PROBE = "probe"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe.
+
+    The probe ends with ``record_success`` or ``record_failure``; one that
+    ends with neither (cancelled, or an unexpected error) must call
+    ``end_probe`` so the next call can probe instead.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        """True to go ahead, PROBE for the half-open probe, False to fail fast."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            # Half-open: let exactly one request through to probe the deployment
+            if self._probing:
+                return False
+            self._probing = True
+            return PROBE
+
+    def end_probe(self):
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Upstream circuit opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+
+
+def parse_retry_after(value):
+    """Return the Retry-After header as seconds, or None if absent/invalid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _RetryPolicy:
+    """Backoff and status handling shared by the sync and async clients."""
+
+    def __init__(self, api_url, connect_timeout=3.05, read_timeout=30.0, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, breaker=None, on_error=None):
+        self.api_url = api_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        # Called with the HTTP status (or "connection") of every failed attempt, retried or not
+        self.on_error = on_error
+
+    def _check_breaker(self):
+        """Raise while the breaker is open; returns whether this attempt is the half-open probe."""
+        allowed = self.breaker.allow()
+        if not allowed:
+            raise CircuitOpenError("Upstream circuit is open; failing fast")
+        return allowed == PROBE
+
+    def _report_error(self, status):
+        if self.on_error is not None:
+            self.on_error(status)
+
+    def _failed_status(self, status, headers):
+        """Turn an HTTP error status into ``(error, retry_after)``, raising if it is final."""
+        self._report_error(status)
+        retry_after = None
+        if status in RETRY_AFTER_STATUSES:
+            retry_after = parse_retry_after(headers.get("Retry-After"))
+        error = UpstreamError(f"Upstream returned HTTP {status}", status_code=status)
+
+        if status not in RETRY_STATUSES:
+            # The deployment answered; a bad request says nothing about its health
+            self.breaker.record_success()
+            raise error
+        if status >= 500:
+            self.breaker.record_failure()
+        else:
+            # A throttled deployment is up; its 429s are handled by retries and routing
+            self.breaker.record_success()
+        return error, retry_after
+
+    def _timeouts(self, deadline):
+        """``(connect, read)`` timeouts, cut to what is left of ``deadline``."""
+        if deadline is None:
+            return self.connect_timeout, self.read_timeout
+        deadline.check("upstream")
+        return deadline.timeout(self.connect_timeout), deadline.timeout(self.read_timeout)
+
+    def _transport_failed(self, e, deadline):
+        """The error for a failed attempt; a timeout we imposed says nothing about the deployment."""
+        if deadline is not None and deadline.cancelled():
+            return Cancelled(deadline.reason, "upstream")
+        self.breaker.record_failure()
+        self._report_error("connection")
+        return UpstreamError(f"Upstream request failed: {e}")
+
+    def _retry_delay(self, attempt, error, retry_after, deadline=None):
+        """Seconds to wait before the next attempt, raising ``error`` when out of retries."""
+        if isinstance(error, Cancelled) or attempt >= self.max_retries:
+            raise error
+        if retry_after is not None and retry_after > self.backoff_max:
+            # Waiting that long would hold the worker; surface the throttle instead
+            raise error
+        delay = self._backoff(attempt, retry_after)
+        if deadline is not None and delay >= deadline.remaining():
+            # The retry could not finish in time anyway
+            raise error
+        logger.warning(f"{error}; retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})")
+        return delay
+
+    def _backoff(self, attempt, retry_after=None):
+        # Full jitter keeps a burst of clients from retrying in lockstep
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class UpstreamClient(_RetryPolicy):
+    """Keep-alive session to one chat-completions URL with retries and a breaker."""
+
+    def __init__(self, api_url, headers, pool_size=10, **options):
+        super().__init__(api_url, **options)
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        # Retries are handled here so Retry-After and the breaker see every attempt. A full pool
+        # opens an extra connection rather than blocking, since that wait would ignore the deadline.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0, pool_block=False)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def warm(self, connections=1):
+        """Open up to ``connections`` keep-alive connections so the first requests skip the handshake.
+
+        Each connection is opened with a HEAD request outside the retry policy
+        and the breaker; any status leaves it in the pool. Returns how many
+        connections were opened.
+        """
+        opened = []
+
+        def connect():
+            try:
+                self.session.head(self.api_url, timeout=(self.connect_timeout, self.connect_timeout))
+                opened.append(True)
+            except requests.RequestException as e:
+                logger.warning(f"Could not pre-open upstream connection: {e}")
+
+        # Concurrent requests, so each one checks out a connection of its own
+        threads = [threading.Thread(target=connect) for _ in range(min(connections, self.pool_size))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(opened)
+
+    def chat_completion(self, payload, deadline=None):
+        """POST the payload and return the decoded JSON body."""
+        response = self._post(payload, deadline=deadline)
+        try:
+            return response.json()
+        finally:
+            response.close()
+
+    def stream_chat_completion(self, payload, deadline=None, tool_calls=None):
+        """POST with ``stream: true`` and yield content deltas as they arrive.
+
+        Closing the generator, or a ``deadline`` that runs out between deltas,
+        closes the connection, which stops the generation upstream. Tool calls
+        the model streams are assembled into the ``tool_calls`` list, if given.
+        """
+        response = self._post(dict(payload, stream=True), stream=True, deadline=deadline)
+        try:
+            for line in response.iter_lines():
+                if deadline is not None:
+                    deadline.check("upstream")
+                # SSE is always UTF-8; don't trust requests' charset guess
+                if not line or not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip().decode("utf-8")
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                for choice in chunk.get("choices", []):
+                    delta = choice.get("delta") or {}
+                    if tool_calls is not None and delta.get("tool_calls"):
+                        merge_tool_call_deltas(tool_calls, delta["tool_calls"])
+                    content = delta.get("content")
+                    if content:
+                        yield content
+        finally:
+            response.close()
+
+    def _post(self, payload, stream=False, deadline=None):
+        attempt = 0
+        while True:
+            timeout = self._timeouts(deadline)
+            probe = self._check_breaker()
+            retry_after = None
+            try:
+                response = self.session.post(self.api_url, json=payload, timeout=timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = self._transport_failed(e, deadline)
+            else:
+                if response.status_code < 400:
+                    self.breaker.record_success()
+                    return response
+                response.close()
+                error, retry_after = self._failed_status(response.status_code, response.headers)
+            finally:
+                if probe:
+                    # Every way out of the attempt releases the probe, verdict or not
+                    self.breaker.end_probe()
+
+            time.sleep(self._retry_delay(attempt, error, retry_after, deadline))
+            attempt += 1
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncUpstreamClient(_RetryPolicy):
+    """asyncio counterpart of UpstreamClient, built on httpx."""
+
+    def __init__(self, api_url, headers, max_connections=1000, **options):
+        super().__init__(api_url, **options)
+        # Only the async serving path needs httpx
+        import httpx
+
+        self._httpx = httpx
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def chat_completion(self, payload, deadline=None):
+        """POST the payload and return the decoded JSON body."""
+        attempt = 0
+        while True:
+            connect, read = self._timeouts(deadline)
+            probe = self._check_breaker()
+            retry_after = None
+            try:
+                response = await self.client.post(self.api_url, json=payload,
+                                                  timeout=self._httpx.Timeout(read, connect=connect))
+            except (self._httpx.TransportError, self._httpx.TimeoutException) as e:
+                error = self._transport_failed(e, deadline)
+            else:
+                if response.status_code < 400:
+                    self.breaker.record_success()
+                    return response.json()
+                error, retry_after = self._failed_status(response.status_code, response.headers)
+            finally:
+                # Includes the CancelledError of a client that disconnected mid-probe
+                if probe:
+                    self.breaker.end_probe()
+
+            await asyncio.sleep(self._retry_delay(attempt, error, retry_after, deadline))
+            attempt += 1
+
+    async def aclose(self):
+        await self.client.aclose()
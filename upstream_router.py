@@ -0,0 +1,327 @@
+"""Latency-aware routing across several chat-completions deployments.
+
+Each backend wraps its own client and circuit breaker and keeps an EWMA of
+latency and error rate. Requests go to the cheapest healthy backend, where
+cost is latency inflated by errors and divided by the configured weight.
+They fail over down the ranking when a backend gives up. With hedging on,
+a completion that outlives its backend's p95 latency is raced against a
+second backend, but only if that backend has per-minute quota to spare.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from admission import TokenBucket
+from deadline import Cancelled
+from upstream import RETRY_STATUSES, UpstreamError
+
+logger = logging.getLogger(__name__)
+
+# How strongly recent errors push a backend down the ranking
+ERROR_PENALTY = 4.0
+# An untried backend whose error rate reaches this waits behind the measured ones
+UNTRIED_ERROR_LIMIT = 0.5
+
+
+def backend_failed(error):
+    """Whether an error reflects on the backend; a rejected or cancelled request would fail anywhere."""
+    if isinstance(error, Cancelled):
+        return False
+    status = getattr(error, "status_code", None)
+    return status is None or status in RETRY_STATUSES
+
+
+class Backend:
+    """One deployment: its client plus the health statistics routing is based on."""
+
+    def __init__(self, name, client, weight=1.0, rpm=0, alpha=0.2, window=200):
+        self.name = name
+        self.client = client
+        self.weight = weight
+        self.alpha = alpha
+        self.latency = None
+        self.error_rate = 0.0
+        self._recent = deque(maxlen=window)
+        self._p95 = None
+        self._lock = threading.Lock()
+        # Requests per minute the deployment is provisioned for; 0 means unlimited
+        self._quota = TokenBucket(rpm / 60, max(1, rpm / 60)) if rpm else None
+
+    @property
+    def healthy(self):
+        return self.client.breaker.state != "open"
+
+    def cost(self):
+        if self.latency is None:
+            # Untried backends go first so they get a latency estimate; ones that keep failing go last
+            return 0.0 if self.error_rate < UNTRIED_ERROR_LIMIT else float("inf")
+        return self.latency * (1 + ERROR_PENALTY * self.error_rate) / self.weight
+
+    def take_quota(self):
+        if self._quota is None:
+            return True
+        with self._lock:
+            return self._quota.take(time.monotonic()) == 0
+
+    def record(self, latency=None, error=False):
+        with self._lock:
+            self.error_rate += self.alpha * ((1.0 if error else 0.0) - self.error_rate)
+            if latency is not None:
+                self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+                self._recent.append(latency)
+                self._p95 = None
+
+    def p95(self):
+        with self._lock:
+            if self._p95 is None and self._recent:
+                ordered = sorted(self._recent)
+                self._p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+            return self._p95
+
+
+class UpstreamRouter:
+    """Drop-in replacement for UpstreamClient that spreads calls over several backends."""
+
+    def __init__(self, backends, hedge=False, hedge_min_delay=0.5, hedge_workers=32, explore=0.05):
+        if not backends:
+            raise ValueError("UpstreamRouter needs at least one backend")
+        self.backends = backends
+        self.hedge = hedge and len(backends) > 1
+        self.hedge_min_delay = hedge_min_delay
+        self.explore = explore
+        # Hedged calls run on the pool so the request thread can wait with a deadline
+        self._pool = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="hedge") if self.hedge else None
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def order(self):
+        """Backends in the order to try them, the primary first."""
+        healthy = [b for b in self.backends if b.healthy] or list(self.backends)
+        # Costs all tie at zero until backends have latency samples; split those first calls by weight
+        healthy.sort(key=lambda b: random.random() ** (1 / b.weight), reverse=True)
+        ranked = sorted(healthy, key=Backend.cost)
+        if len(ranked) > 1 and random.random() < self.explore:
+            # Now and then route by weight alone so stale latency estimates get refreshed
+            ranked.insert(0, ranked.pop(ranked.index(random.choices(ranked, [b.weight for b in ranked])[0])))
+        # Prefer a backend with quota left; if none has any, the best one still gets the call
+        primary = next((b for b in ranked if b.take_quota()), ranked[0])
+        ranked.remove(primary)
+        return [primary] + ranked
+
+    def hedge_delay(self, backend):
+        return max(self.hedge_min_delay, backend.p95() or 0.0)
+
+    def take_hedge(self, spares):
+        """The best spare backend with quota for a hedge, removed from ``spares``, or None."""
+        for backend in spares:
+            if backend.take_quota():
+                spares.remove(backend)
+                self.hedges += 1
+                return backend
+        return None
+
+    def hedge_won(self, backend, started):
+        self.hedge_wins += 1
+        # The slow primary's latency is at least this much; without it a backend that
+        # never finishes first would keep its low estimate and keep being picked
+        backend.record(latency=time.perf_counter() - started)
+
+    def chat_completion(self, payload, deadline=None):
+        order = self.order()
+        last_error = None
+        while order:
+            backend = order.pop(0)
+            try:
+                return self._attempt(backend, order, payload, deadline)
+            except Exception as e:
+                if not backend_failed(e):
+                    raise
+                last_error = e
+                if order:
+                    self.failovers += 1
+                    logger.warning(f"Backend {backend.name} failed ({e}); failing over to {order[0].name}")
+        raise last_error
+
+    def _call(self, backend, payload, deadline=None):
+        started = time.perf_counter()
+        try:
+            result = backend.client.chat_completion(payload, deadline=deadline)
+        except Cancelled:
+            # Neither a latency sample nor an error
+            raise
+        except Exception as e:
+            backend.record(error=backend_failed(e))
+            raise
+        backend.record(latency=time.perf_counter() - started)
+        return result
+
+    def _attempt(self, backend, spares, payload, deadline=None):
+        if not self.hedge or not spares:
+            return self._call(backend, payload, deadline)
+        started = time.perf_counter()
+        primary = self._pool.submit(self._call, backend, payload, deadline)
+        delay = self.hedge_delay(backend)
+        done, _ = wait([primary], timeout=delay if deadline is None else deadline.timeout(delay))
+        if done:
+            return primary.result()
+        pending = {primary}
+        last_error = None
+        hedged = True
+        while pending:
+            if hedged and (deadline is None or not deadline.cancelled()):
+                # Race the slow call (or replace a failed hedge) with the next spare that has quota
+                hedge_backend = self.take_hedge(spares)
+                if hedge_backend is not None:
+                    logger.info(f"Hedging slow call to {backend.name} with {hedge_backend.name}")
+                    pending.add(self._pool.submit(self._call, hedge_backend, payload, deadline))
+            # First success wins; the loser finishes in the background and only updates stats
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            hedged = False
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self.hedge_won(backend, started)
+                    return future.result()
+                last_error = future.exception()
+                hedged = future is not primary
+        raise last_error
+
+    def stream_chat_completion(self, payload, deadline=None, tool_calls=None):
+        """Stream from the first backend that produces a delta; no failover once output started."""
+        last_error = None
+        for backend in self.order():
+            started = time.perf_counter()
+            if tool_calls is not None:
+                # Whatever a failed backend streamed before giving up is not the model's request
+                tool_calls.clear()
+            stream = backend.client.stream_chat_completion(payload, deadline=deadline, tool_calls=tool_calls)
+            try:
+                first = next(stream, None)
+            except Cancelled:
+                raise
+            except Exception as e:
+                backend.record(error=backend_failed(e))
+                if not backend_failed(e):
+                    raise
+                last_error = e
+                self.failovers += 1
+                logger.warning(f"Backend {backend.name} failed to stream ({e})")
+                continue
+            finished = False
+            try:
+                if first is not None:
+                    yield first
+                yield from stream
+                finished = True
+            finally:
+                # Closing early (client gone) must close the upstream response too
+                stream.close()
+                # A whole stream takes about as long as the same completion unstreamed; a cut-short
+                # one says only that the backend answered
+                backend.record(latency=time.perf_counter() - started if finished else None)
+            return
+        raise last_error or UpstreamError("No upstream backend available")
+
+    def stats(self):
+        return {
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "backends": {
+                b.name: {"latency": b.latency, "error_rate": round(b.error_rate, 4), "p95": b.p95(), "healthy": b.healthy}
+                for b in self.backends
+            },
+        }
+
+    def close(self):
+        for backend in self.backends:
+            backend.client.close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+
+class AsyncUpstreamRouter:
+    """asyncio counterpart for the ASGI path, sharing the sync router's backend statistics.
+
+    ``clients`` maps backend names to AsyncUpstreamClients. Hedges are plain
+    tasks here, so the losing call is cancelled instead of left to finish.
+    """
+
+    def __init__(self, router, clients):
+        self.router = router
+        self.clients = clients
+
+    async def chat_completion(self, payload, deadline=None):
+        order = self.router.order()
+        last_error = None
+        while order:
+            backend = order.pop(0)
+            try:
+                return await self._attempt(backend, order, payload, deadline)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not backend_failed(e):
+                    raise
+                last_error = e
+                if order:
+                    self.router.failovers += 1
+                    logger.warning(f"Backend {backend.name} failed ({e}); failing over to {order[0].name}")
+        raise last_error
+
+    async def _call(self, backend, payload, deadline=None):
+        started = time.perf_counter()
+        try:
+            result = await self.clients[backend.name].chat_completion(payload, deadline=deadline)
+        except (asyncio.CancelledError, Cancelled):
+            raise
+        except Exception as e:
+            backend.record(error=backend_failed(e))
+            raise
+        backend.record(latency=time.perf_counter() - started)
+        return result
+
+    async def _attempt(self, backend, spares, payload, deadline=None):
+        if not self.router.hedge or not spares:
+            return await self._call(backend, payload, deadline)
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(self._call(backend, payload, deadline))
+        tasks = {primary}
+        try:
+            delay = self.router.hedge_delay(backend)
+            done, _ = await asyncio.wait(tasks, timeout=delay if deadline is None else deadline.timeout(delay))
+            pending = set(tasks) - done
+            last_error = None
+            hedged = not done
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.router.hedge_won(backend, started)
+                        return task.result()
+                    last_error = task.exception()
+                    hedged = task is not primary
+                if hedged and (deadline is None or not deadline.cancelled()):
+                    hedge_backend = self.router.take_hedge(spares)
+                    if hedge_backend is not None:
+                        logger.info(f"Hedging slow call to {backend.name} with {hedge_backend.name}")
+                        hedge = asyncio.ensure_future(self._call(hedge_backend, payload, deadline))
+                        tasks.add(hedge)
+                        pending.add(hedge)
+                if not pending:
+                    raise last_error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                hedged = False
+        finally:
+            # The losing calls are no longer needed
+            for task in tasks:
+                task.cancel()
+
+    async def aclose(self):
+        for client in self.clients.values():
+            await client.aclose()
@@ -0,0 +1,12 @@
+"""WSGI entry point for a preforking server.
+
+Every worker imports this after it forks, so each builds its own app,
+upstream pools and log listener, then warms them before it accepts a
+connection::
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+"""
+from app import create_app, warm_up
+
+application = create_app()
+warm_up()